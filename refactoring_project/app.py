@@ -37,23 +37,71 @@ FOR EXAMPLE :
 """
 
 # python package
-from flask import Flask, request, render_template
+import hmac
+import logging
+import os
+import time
+
+from flask import Flask, Response, request, render_template, jsonify, url_for, g, abort, send_from_directory
 
 # internal package
 from src.service import service
 
 # initialize global function alias
 GetFilePathAndName              = service._getFilePathWithName
+ReadUploadImage                 = service.ReadUploadImage
 ModelDictionary                 = service._getDictModel
 QueryImageList                  = service.GetListOfQueryImage
+SetModelMemoryBudget            = service.SetModelMemoryBudget
+BuildQueryImageGallery          = service.BuildQueryImageGallery
+SetMicroBatching                = service.SetMicroBatching
+SetCompareConcurrency           = service.SetCompareConcurrency
+SetUploadPreviewTTL             = service.SetUploadPreviewTTL
+SetResultCache                  = service.SetResultCache
+SetReducedDecode                = service.SetReducedDecode
+SetPreprocessingBufferPool      = service.SetPreprocessingBufferPool
+SetInferenceEngine              = service.SetInferenceEngine
+PreloadModels                   = service.PreloadModels
+GetReadiness                    = service.GetReadiness
+PrepareForkServing              = service.PrepareForkServing
+StartInferencePool              = service.StartInferencePool
+CheckForkSafety                 = service.CheckForkSafety
+GetWorkerMemory                 = service.GetWorkerMemory
+SetBackendThreads               = service.SetBackendThreads
+ServiceStats                    = service.GetServiceStats
+ReadUploadImageList             = service.ReadUploadImageList
+FindQueryImageList              = service.FindQueryImageList
+RankPredictionLabels            = service.RankPredictionLabels
+RankBatchPredictionLabels       = service.RankBatchPredictionLabels
+SetPredictionJobs               = service.SetPredictionJobs
+StartPredictionJobs             = service.StartPredictionJobs
+SubmitPredictionJob             = service.SubmitPredictionJob
+GetPredictionJob                = service.GetPredictionJob
+SetStageTiming                  = service.SetStageTiming
+StartStageTiming                = service.StartStageTiming
+StageTimer                      = service.StageTimer
+GetStageTimings                 = service.GetStageTimings
+FinishStageTiming               = service.FinishStageTiming
+SetMetrics                      = service.SetMetrics
+ObserveRequest                  = service.ObserveRequest
+GetMetrics                      = service.GetMetrics
+SetProfiling                    = service.SetProfiling
+StartRequestProfile             = service.StartRequestProfile
+FinishRequestProfile            = service.FinishRequestProfile
+GetRecentProfiles               = service.GetRecentProfiles
+SetLeaderboard                  = service.SetLeaderboard
+GetModelLeaderboard             = service.GetModelLeaderboard
+EvaluateModelLeaderboard        = service.EvaluateModelLeaderboard
 
 """ Uncomment to use this part if you using RGB imgae as input prediction"""
 PredictRGBImageList             = service.PredictInputRGBImageList  # TO CHANGE 
 PredicRGBImage                  = service.PredictInputRGBImage  # TO CHANGE 
+PredictRGBImageBatch            = service.PredictInputRGBImageBatch  # TO CHANGE 
 
 """ Uncomment to use this part if you using grayscale imgae as input prediction"""
 # PredictGrayImageList            = service.PredictInputGrayImageList  # TO CHANGE 
 # PredicGrayImage                 = service.PredictInputGrayImage  # TO CHANGE 
+# PredictGrayImageBatch           = service.PredictInputGrayImageBatch  # TO CHANGE 
 
 """
 GLOBAL CONSTANT VARIABLE!
@@ -71,6 +119,161 @@ MODEL_PATH          = "static/model/"
 QUERY_IMAGE_PATH    = "static/queryImage/"
 QUERY_UPLOAD_IMAGE  = "static/queryUpload/"
 
+"""
+SERVICE TUNING!
+    * model_memory_budget is maximum size (in megabytes) of loaded models kept in memory by model registry.
+        each model is loaded once and reused by every request, least recently used model is evicted when 
+        total size of loaded models is bigger than this budget
+    * query_image_cache is a folder to persist preprocessed tensor of each query image sample (set None to keep them in memory only)
+    * micro_batch_* configure cross-request micro-batching, images of concurrent requests for the same model are
+        collected for up to micro_batch_max_wait milliseconds (or micro_batch_max_size images) and predicted together
+    * compare_max_workers is maximum number of selected models predicted concurrently in compare page
+    * upload_preview_ttl is how long (in seconds) preview of uploaded image is kept in query_upload_image folder
+    * result_cache_* configure prediction result cache, the same image predicted by the same model files is only predicted once.
+        result_cache_size results are kept in memory and they are persisted into result_cache_path (set None to keep them in memory only)
+    * reduced_decode decodes large JPEG images at reduced resolution (still at least twice model input size) before resize
+    * buffer_pool_* configure pool of preallocated preprocessing buffers reused by every request, buffer_pool_size is
+        maximum total size (in megabytes) of free buffers kept by the pool
+    * inference_engine is 'compiled' (graph functions traced once for each batch size bucket) or 'predict' (keras model.predict).
+        buckets up to inference_warmup_batch images are traced and run when a model is loaded, keep it at least micro_batch_max_size
+    * backend_threads is number of cpu threads used by each TFLite / ONNX model (None means backend default).
+        keras models in model_path can be exported into TFLite / ONNX models by convert_models.py
+    * preload_models loads every model of model_path at startup (preload_workers models at once) and runs a dummy inference on each,
+        /readyz reports ready only after all models are warmed up. Set False to load each model on its first request
+    * stage_timing measures decode, preprocess, model, inference, postprocess and render stages of every request (perf_counter_ns),
+        the breakdown is sent as Server-Timing header and in json api response. stage_timing_on_page also shows it on result pages
+    * metrics_* configure service metrics of /metrics (Prometheus text format). With several gunicorn workers each worker writes
+        a snapshot of its metrics into metrics_path every metrics_flush_interval seconds, so /metrics reports every worker
+        (set None to report only the worker serving the scrape). Clear metrics_path when the service is deployed again
+    * profiling_* configure opt-in request profiling. A request with profile_header (such X-Profile: 1) or picked by profile_sample_rate
+        is profiled by profiler ('cprofile' or 'pyinstrument') and its predict step is traced by TensorFlow profiler (profile_tf_trace).
+        Artifacts are saved into profile_path (newest profile_max profiles are kept) and listed on /profiles page.
+        Keep profiling_enabled False in production unless you are looking for a slow request
+    * api_max_images is maximum number of images accepted by one json api request
+    * job_* configure asynchronous prediction jobs (/api/v1/jobs), jobs are kept in job_database (sqlite, created when this file
+        is imported) and predicted by job_workers background threads of each serving process, job_batch_size images at a time.
+        Finished jobs are kept for job_result_ttl seconds
+    * job_max_images is maximum number of images accepted by one job
+    * job_image_mode is 'rgb' or 'gray' depending on input image of your models
+    * leaderboard_* configure model leaderboard (/leaderboard page and /api/v1/leaderboard), every model is evaluated over labelled
+        query images (accuracy, recall of each class and confusion matrix against CLASS_DICT) and benchmarked for each of
+        leaderboard_batch_sizes over leaderboard_iterations calls. Reports are saved into leaderboard_cache_path and a model is
+        only evaluated again when its files are changed. Pages only show saved reports, models are evaluated by
+        python evaluate_models.py, or in a background thread of the serving process when leaderboard_evaluate is True
+        (it competes with live requests). ?refresh=<leaderboard_token> evaluates every model again in background,
+        leaderboard_token is read from LEADERBOARD_TOKEN environment variable, refresh is refused while it is not set
+    * prefork_serving is set by gunicorn.conf.py (gunicorn -c gunicorn.conf.py app:app), gunicorn master imports this file and
+        TensorFlow once and forks its workers, so their pages are shared copy-on-write. Background threads of a worker
+        (prediction jobs and model preload) are started after fork by start_worker_services, TensorFlow runtime is never
+        initialized in the master because forked workers would hang on their first prediction
+    * prefork_share_tflite reads TFLite models of model_path in gunicorn master, every worker builds its interpreter over
+        the same weight pages (without XNNPACK delegate, which copies weights into each worker). Keras and ONNX models are
+        loaded by each worker, export them into TFLite by convert_models.py to share their weights.
+        Memory of each worker (rss, pss, uss and shared) is reported by /stats and /metrics
+    * inference_processes is number of inference processes of each serving process, they load the models and run every prediction
+        while request threads only parse requests, preprocess images and render pages, so inference does not compete with them
+        for the GIL. Preprocessed batches are handed over by shared memory. Every pool process keeps its own copy of each model
+        (model_memory_budget applies to each of them). It is 0 by default (predict inside request threads).
+        In pre-fork serving each gunicorn worker starts its own pool, so there are workers x inference_processes copies of each
+        model instead of one for each worker, keep it 0 there unless the copies fit in memory
+    * background services (inference pool, prediction jobs and model preload) are never started when this file is imported,
+        they are started by start_worker_services from __main__ (python app.py) or from post_fork of gunicorn.conf.py.
+        Under flask run, the test client or another WSGI server prediction job workers and model preload are started by the first
+        request of each process (start_background_services), the inference pool is only started by start_worker_services
+"""
+MODEL_MEMORY_BUDGET     = 1024              # TO CHANGE
+QUERY_IMAGE_CACHE       = "cache/gallery/"  # TO CHANGE
+MICRO_BATCH_ENABLED     = True              # TO CHANGE
+MICRO_BATCH_MAX_WAIT    = 5                 # TO CHANGE
+MICRO_BATCH_MAX_SIZE    = 16                # TO CHANGE
+COMPARE_MAX_WORKERS     = 4                 # TO CHANGE
+UPLOAD_PREVIEW_TTL      = 600               # TO CHANGE
+RESULT_CACHE_ENABLED    = True              # TO CHANGE
+RESULT_CACHE_SIZE       = 4096              # TO CHANGE
+RESULT_CACHE_PATH       = "cache/results/"  # TO CHANGE
+REDUCED_DECODE          = True              # TO CHANGE
+BUFFER_POOL_ENABLED     = True              # TO CHANGE
+BUFFER_POOL_SIZE        = 256               # TO CHANGE
+INFERENCE_ENGINE        = 'compiled'        # TO CHANGE
+INFERENCE_WARMUP_BATCH  = 16                # TO CHANGE
+BACKEND_THREADS         = None              # TO CHANGE
+PRELOAD_MODELS          = False             # TO CHANGE
+PRELOAD_WORKERS         = 4                 # TO CHANGE
+STAGE_TIMING            = True              # TO CHANGE
+STAGE_TIMING_ON_PAGE    = False             # TO CHANGE
+METRICS_ENABLED         = True              # TO CHANGE
+METRICS_PATH            = "cache/metrics/"  # TO CHANGE
+METRICS_FLUSH_INTERVAL  = 5                 # TO CHANGE
+PROFILING_ENABLED       = False             # TO CHANGE
+PROFILE_PATH            = "cache/profiles/" # TO CHANGE
+PROFILE_HEADER          = 'X-Profile'       # TO CHANGE
+PROFILE_SAMPLE_RATE     = 0.0               # TO CHANGE
+PROFILER                = 'cprofile'        # TO CHANGE
+PROFILE_TF_TRACE        = True              # TO CHANGE
+PROFILE_MAX             = 50                # TO CHANGE
+API_MAX_IMAGES          = 64                # TO CHANGE
+JOB_DATABASE            = "cache/jobs.sqlite3"  # TO CHANGE
+JOB_WORKERS             = 1                 # TO CHANGE
+JOB_BATCH_SIZE          = 8                 # TO CHANGE
+JOB_RESULT_TTL          = 3600              # TO CHANGE
+JOB_MAX_IMAGES          = 1000              # TO CHANGE
+JOB_IMAGE_MODE          = 'rgb'             # TO CHANGE
+LEADERBOARD_CACHE_PATH  = "cache/leaderboard/"  # TO CHANGE
+LEADERBOARD_BATCH_SIZES = (1, 8, 32)        # TO CHANGE
+LEADERBOARD_ITERATIONS  = 20                # TO CHANGE
+LEADERBOARD_IMAGE_MODE  = 'rgb'             # TO CHANGE
+LEADERBOARD_EVALUATE    = False             # TO CHANGE
+LEADERBOARD_TOKEN       = os.environ.get('LEADERBOARD_TOKEN') # TO CHANGE
+PREFORK_SERVING         = os.environ.get('PREFORK_SERVING') == '1' # set by gunicorn.conf.py
+PREFORK_SHARE_TFLITE    = True              # TO CHANGE
+INFERENCE_PROCESSES     = 0                 # TO CHANGE
+SetModelMemoryBudget(MODEL_MEMORY_BUDGET)
+SetMicroBatching(MICRO_BATCH_ENABLED, MICRO_BATCH_MAX_WAIT, MICRO_BATCH_MAX_SIZE)
+SetCompareConcurrency(COMPARE_MAX_WORKERS)
+SetUploadPreviewTTL(UPLOAD_PREVIEW_TTL)
+SetResultCache(RESULT_CACHE_ENABLED, RESULT_CACHE_SIZE, RESULT_CACHE_PATH)
+SetReducedDecode(REDUCED_DECODE)
+SetPreprocessingBufferPool(BUFFER_POOL_ENABLED, 8, BUFFER_POOL_SIZE)
+SetInferenceEngine(INFERENCE_ENGINE, (1, 2, 4, 8, 16, 32, 64), INFERENCE_WARMUP_BATCH)
+SetBackendThreads(BACKEND_THREADS)
+SetStageTiming(STAGE_TIMING)
+SetMetrics(METRICS_ENABLED, METRICS_PATH, METRICS_FLUSH_INTERVAL)
+SetProfiling(PROFILING_ENABLED, PROFILE_PATH, PROFILE_SAMPLE_RATE, PROFILER, PROFILE_TF_TRACE, PROFILE_MAX)
+SetLeaderboard(LEADERBOARD_CACHE_PATH, LEADERBOARD_BATCH_SIZES, LEADERBOARD_ITERATIONS)
+SetPredictionJobs(JOB_DATABASE, JOB_WORKERS, JOB_BATCH_SIZE, JOB_RESULT_TTL, JOB_IMAGE_MODE) # job database is ready to submit and poll, its workers are started later
+ModelDictionary(MODEL_PATH) # build model catalog once at startup, it is only rebuilt when static/model/ changes
+BuildQueryImageGallery(QUERY_IMAGE_PATH, QUERY_IMAGE_CACHE) # build query image gallery once at startup
+logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(name)s: %(message)s') # preload logs load and warm-up time of each model
+
+BACKGROUND_SERVICES = {'pid': None} # process which started prediction job workers and model preload
+
+def start_worker_services():
+    """
+    START WORKER SERVICES : start inference pool and background threads of a serving process (prediction jobs and model preload),
+                            in pre-fork serving they are started by each worker after fork (post_fork of gunicorn.conf.py).
+                            Inference pool is started first, its processes are forked before any other thread runs.
+                            Every service is started once in each process, calling it again (or after the first request) does nothing
+    """
+    if BACKGROUND_SERVICES['pid'] == os.getpid(): # threads of the process are running, inference pool can not be forked anymore
+        return
+    StartInferencePool(INFERENCE_PROCESSES)
+    start_background_services()
+
+def start_background_services():
+    """
+    START BACKGROUND SERVICES : start prediction job workers and model preload once in each serving process (checked by process id),
+                                it runs before every request so they are also started under flask run, the test client or another WSGI server
+    """
+    if BACKGROUND_SERVICES['pid'] == os.getpid():
+        return
+    StartPredictionJobs()
+    if PRELOAD_MODELS:
+        PreloadModels(MODEL_PATH, PRELOAD_WORKERS) # models are loaded in background, /healthz is served meanwhile
+    BACKGROUND_SERVICES['pid'] = os.getpid()
+
+if PREFORK_SERVING:
+    PrepareForkServing(MODEL_PATH, PREFORK_SHARE_TFLITE) # gunicorn master imports TensorFlow and reads TFLite models before fork
+
 """
 IMPORTANT!
 please change this part into your product detail and configuration
@@ -95,19 +298,50 @@ PRODUCTION CONFIG!
 """
 # app = Flask(__name__, static_url_path='/'+PARENT_LOCATION+'/static')  # TO CHANGE 
 
+app.before_request(start_background_services) # first request of a process starts its job workers and model preload
+
+@app.before_request
+def start_stage_timing():
+    """
+        Open stage timing of the request, service functions add their stages (decode, preprocess, inference ...) into it
+    """
+    g.request_start = time.perf_counter()
+    g.timing_token  = StartStageTiming()
+    if PROFILING_ENABLED: # profile the request when it has profile header or it is sampled
+        g.profile   = StartRequestProfile(request.headers.get(PROFILE_HEADER))
+
 @app.after_request
 def add_header(r):
     """
         IMPORTANT! 
         This part would handle after request cache while developing flask api
         It would clean and remove all development cache that could be happend
+        Stage timing of the request is sent as Server-Timing header and request latency is added into service metrics
+        Id of request profile is sent as X-Profile-Id header
     """
+    route = request.url_rule.rule if request.url_rule else 'unmatched'
+    if g.get('profile'):
+        r.headers['X-Profile-Id'] = FinishRequestProfile(g.pop('profile'), route, request.method, r.status_code)['id']
+    if 'request_start' in g:
+        ObserveRequest(route, request.method, r.status_code, time.perf_counter() - g.pop('request_start'))
+    serverTiming = FinishStageTiming(g.pop('timing_token', None))
+    if serverTiming:
+        r.headers['Server-Timing'] = serverTiming
     r.headers["Cache-Control"] = "no-cache, no-store, must-revalidate"
     r.headers["Pragma"] = "no-cache"
     r.headers["Expires"] = "0"
     r.headers['Cache-Control'] = 'public, max-age=0'
     return r
 
+def render_result(template, **context):
+    """
+        Render result page, rendering is measured as render stage of the request
+        Stage timing measured so far is shown on the page when STAGE_TIMING_ON_PAGE is True
+    """
+    with StageTimer('render'):
+        stageTimings = GetStageTimings() if STAGE_TIMING_ON_PAGE else None
+        return render_template(template, stages = stageTimings, **context)
+
 #   ROUTING START!
 # @app.route('/'+PRODUCT_ID+"/") # TO CHANGE
 @app.route("/compare")
@@ -140,7 +374,7 @@ def predict_compare():
     getImageFile                     = request.form.get('input_image') 
     predictionResult, predictionTime = PredictRGBImageList(choosenModelList, MODEL_PATH, getImageFile)  # TO CHANGE 
     # predictionResult, predictionTime = PredictGrayImageList(choosenModelList, MODEL_PATH, getImageFile)  # TO CHANGE 
-    return render_template('/result_compare.html', labels = LABELS, probs = predictionResult, parent_location = PARENT_LOCATION,
+    return render_result('/result_compare.html', labels = LABELS, probs = predictionResult, parent_location = PARENT_LOCATION,
                             topic_name = TOPIC_NAME, aoi_id = AREA_OF_INTEREST_ID, topic_id = TOPIC_ID, 
                             product_id = PRODUCT_ID, model = choosenModelList, run_time = predictionTime, img = getImageFile[7:])
 
@@ -150,7 +384,8 @@ def predicts_compare():
     """
     PREDICTS_COMPARE : handle POST prediction of uploaded image in case comparing several models
                      * choosenModelList get list of selected models from frontend
-                     * getImageFile get uploaded image from frontend and save as temp image 
+                     * getImageFile get bytes of uploaded image from frontend (predicted in memory) 
+                     * relocationImageFile hold content-addressed preview of uploaded image
                      * PredictRGBImageList() provide a collection of prediction time and result
                      * predictionTime hold prediction time and 
                      * predictionResult hold prediction result for each selected model
@@ -158,12 +393,10 @@ def predicts_compare():
                      * (labels, probs, model names, run_times and image query)
     """
     choosenModelList                 = request.form.getlist('select_model')
-    getImageFile                     = request.files["file"]
-    relocationImageFile              = GetFilePathAndName(QUERY_UPLOAD_IMAGE, 'temp.jpg')
-    getImageFile.save(relocationImageFile)
+    getImageFile, relocationImageFile = ReadUploadImage(request.files["file"], QUERY_UPLOAD_IMAGE)
     predictionResult, predictionTime = PredictRGBImageList(choosenModelList, MODEL_PATH, getImageFile)  # TO CHANGE 
     # predictionResult, predictionTime = PredictGrayImageList(choosenModelList, MODEL_PATH, getImageFile)  # TO CHANGE 
-    return render_template('/result_compare.html', labels = LABELS, probs = predictionResult, parent_location = PARENT_LOCATION,
+    return render_result('/result_compare.html', labels = LABELS, probs = predictionResult, parent_location = PARENT_LOCATION,
                             topic_name = TOPIC_NAME, aoi_id = AREA_OF_INTEREST_ID, topic_id = TOPIC_ID, 
                             product_id = PRODUCT_ID, model = choosenModelList, run_time = predictionTime, img = relocationImageFile[7:])
 
@@ -198,7 +431,7 @@ def predict_select():
     getImageFile                     = request.form.get('input_image')
     predictionResult, predictionTime = PredicRGBImage(choosenModel, MODEL_PATH, getImageFile) # TO CHANGE 
     # predictionResult, predictionTime = PredicGrayImage(choosenModel, MODEL_PATH, getImageFile)  # TO CHANGE 
-    return render_template('/result_select.html', labels = LABELS, probs = predictionResult, parent_location = PARENT_LOCATION,
+    return render_result('/result_select.html', labels = LABELS, probs = predictionResult, parent_location = PARENT_LOCATION,
                             topic_name = TOPIC_NAME, aoi_id = AREA_OF_INTEREST_ID, topic_id = TOPIC_ID, 
                             product_id = PRODUCT_ID, model = choosenModel, run_time = predictionTime, img = getImageFile[7:])
 
@@ -208,7 +441,8 @@ def predicts_select():
     """
     PREDICTS_SELECT : handle POST prediction of uploaded image
                     * choosenModelList get selected models from frontend
-                    * getImageFile get an uploaded image from frontend and save as temp image 
+                    * getImageFile get bytes of an uploaded image from frontend (predicted in memory) 
+                    * relocationImageFile hold content-addressed preview of uploaded image
                     * PredicRGBImage() give prediction time and result
                     * predictionTime hold prediction time and
                     * predictionResult hold prediction result for each selected model
@@ -216,20 +450,254 @@ def predicts_select():
                     * (labels, probs, model names, run_times and image query)
     """
     choosenModel                     = request.form['select_model']
-    getImageFile                     = request.files["file"]
-    relocationImageFile              = GetFilePathAndName(QUERY_UPLOAD_IMAGE, 'temp.jpg')
-    getImageFile.save(relocationImageFile)
+    getImageFile, relocationImageFile = ReadUploadImage(request.files["file"], QUERY_UPLOAD_IMAGE)
     predictionResult, predictionTime = PredicRGBImage(choosenModel, MODEL_PATH, getImageFile) # TO CHANGE 
     # predictionResult, predictionTime = PredicGrayImage(choosenModel, MODEL_PATH, getImageFile)  # TO CHANGE 
-    return render_template('/result_select.html', labels = LABELS, probs = predictionResult, parent_location = PARENT_LOCATION,
+    return render_result('/result_select.html', labels = LABELS, probs = predictionResult, parent_location = PARENT_LOCATION,
                             topic_name = TOPIC_NAME, aoi_id = AREA_OF_INTEREST_ID, topic_id = TOPIC_ID, 
                             product_id = PRODUCT_ID, model = choosenModel, run_time = predictionTime, img = relocationImageFile[7:])
 
+# @app.route('/'+PRODUCT_ID+'/stats') # TO CHANGE
+@app.route('/stats')
+def stats():
+    """
+    STATS : provide service statistic as json such (loaded models of model registry, query image gallery,
+            micro-batching batch sizes and queue wait time)
+    """
+    return jsonify(ServiceStats())
+
+# @app.route('/'+PRODUCT_ID+'/healthz') # TO CHANGE
+@app.route('/healthz')
+def healthz():
+    """
+    HEALTHZ : liveness probe, the worker process is running and answering requests (models might still be loading)
+    """
+    return jsonify({'status': 'ok'})
+
+# @app.route('/'+PRODUCT_ID+'/readyz') # TO CHANGE
+@app.route('/readyz')
+def readyz():
+    """
+    READYZ : readiness probe for load balancer, status 200 when every preloaded model is loaded and warmed up (or preload_models is False)
+             else status 503, response contains preload status and load / warm-up time of each model
+    """
+    ready, preloadInfo = GetReadiness()
+    return jsonify(preloadInfo), (200 if ready else 503)
+
+# @app.route('/'+PRODUCT_ID+'/metrics') # TO CHANGE
+@app.route('/metrics')
+def metrics():
+    """
+    METRICS : provide service metrics of every worker in Prometheus text format such (request latency of each route and model,
+              micro-batching batch size and queue depth, model loads, cache hit ratio, upload size and worker memory)
+    """
+    metricsText = GetMetrics()
+    if metricsText is None:
+        return jsonify({'error': 'metrics are disabled'}), 404
+    return Response(metricsText, mimetype='text/plain; version=0.0.4')
+
+def read_leaderboard():
+    """
+    READ_LEADERBOARD : read leaderboard of saved model reports, models are never evaluated inside the request
+                     * models without a report are evaluated in background when leaderboard_evaluate is True
+                     * optional query string refresh=<leaderboard_token> evaluates every model again in background
+                     * return (modelLeaderboard, None) or (None, error response)
+    """
+    refresh = request.args.get('refresh')
+    if refresh is not None and not (LEADERBOARD_TOKEN and hmac.compare_digest(refresh.encode('utf-8'), LEADERBOARD_TOKEN.encode('utf-8'))):
+        return None, (jsonify({'error': 'refresh is not allowed'}), 403)
+
+    modelLeaderboard = GetModelLeaderboard(MODEL_PATH, QUERY_IMAGE_PATH, CLASS_DICT, LEADERBOARD_IMAGE_MODE)
+    if refresh is not None or (LEADERBOARD_EVALUATE and modelLeaderboard['pending'] and not modelLeaderboard['evaluating']):
+        EvaluateModelLeaderboard(MODEL_PATH, QUERY_IMAGE_PATH, CLASS_DICT, LEADERBOARD_IMAGE_MODE, refresh is not None)
+        modelLeaderboard['evaluating'] = True
+    return modelLeaderboard, None
+
+# @app.route('/'+PRODUCT_ID+'/leaderboard') # TO CHANGE
+@app.route('/leaderboard')
+def leaderboard():
+    """
+    LEADERBOARD : render leaderboard of every model over labelled query images such (accuracy, recall of each class, confusion matrix,
+                  p50 / p95 latency and images per second of each batch size) from saved reports, see read_leaderboard()
+    """
+    modelLeaderboard, leaderboardError = read_leaderboard()
+    if leaderboardError:
+        return leaderboardError
+    return render_template('/leaderboard.html', leaderboard = modelLeaderboard)
+
+# @app.route('/'+PRODUCT_ID+'/api/v1/leaderboard') # TO CHANGE
+@app.route('/api/v1/leaderboard')
+def api_leaderboard():
+    """
+    API_LEADERBOARD : provide leaderboard of every model over labelled query images as json (see LEADERBOARD)
+    """
+    modelLeaderboard, leaderboardError = read_leaderboard()
+    if leaderboardError:
+        return leaderboardError
+    return jsonify(modelLeaderboard)
+
+# @app.route('/'+PRODUCT_ID+'/profiles') # TO CHANGE
+@app.route('/profiles')
+def profiles():
+    """
+    PROFILES : render index of recent request profiles such (route, status, duration, trigger and links to profile artifacts),
+               only available when profiling_enabled is True
+    """
+    if not PROFILING_ENABLED:
+        abort(404)
+    profilePath, recentProfiles = GetRecentProfiles()
+    return render_template('/profiles.html', profiles = recentProfiles, profile_path = profilePath, header = PROFILE_HEADER)
+
+# @app.route('/'+PRODUCT_ID+'/profiles/<path:name>') # TO CHANGE
+@app.route('/profiles/<path:name>')
+def profile_artifact(name):
+    """
+    PROFILE_ARTIFACT : provide an artifact file of a request profile (.prof, .txt or .html)
+    """
+    if not PROFILING_ENABLED:
+        abort(404)
+    profilePath, _ = GetRecentProfiles()
+    return send_from_directory(os.path.abspath(profilePath), name)
+
+def is_string_list(value):
+    """
+    IS_STRING_LIST : check whether a value of json request is a list of strings (such samples or models)
+    """
+    return isinstance(value, list) and all(isinstance(item, str) for item in value)
+
+def read_api_request():
+    """
+    READ_API_REQUEST : read images, models and options of a json api request
+                     * multipart request : images are uploaded as "images" files, models as "models" fields and other options as fields
+                     * json request      : {"samples": [<query image name>, ...], "models": [<model name>, ...], "top_k": 3, ...}
+                                           body must be an object, samples and models must be lists of strings
+                     * return (imageNames, getImageFiles, choosenModelList, options) or (None, error response)
+    """
+    if request.files:
+        options                     = request.form.to_dict()
+        choosenModelList            = request.form.getlist('models')
+        imageNames, getImageFiles   = ReadUploadImageList(request.files.getlist('images'))
+    else:
+        options                     = request.get_json(silent=True)
+        options                     = {} if options is None else options
+        if not isinstance(options, dict):
+            return None, (jsonify({'error': 'json body must be an object'}), 400)
+        choosenModelList            = options.get('models', [])
+        imageNames                  = options.get('samples', [])
+        if not is_string_list(choosenModelList) or not is_string_list(imageNames):
+            return None, (jsonify({'error': 'samples and models must be lists of strings'}), 400)
+        getImageFiles, missingNames = FindQueryImageList(QUERY_IMAGE_PATH, imageNames)
+        if missingNames:
+            return None, (jsonify({'error': 'unknown samples', 'samples': missingNames}), 400)
+
+    _, listModel, _ = ModelDictionary(MODEL_PATH)
+    unknownModels   = [model for model in choosenModelList if model not in listModel]
+    if not getImageFiles or not choosenModelList:
+        return None, (jsonify({'error': 'images (or samples) and models are required'}), 400)
+    if unknownModels:
+        return None, (jsonify({'error': 'unknown models', 'models': unknownModels}), 400)
+    try:
+        options['top_k'] = min(max(int(options.get('top_k', len(LABELS))), 1), len(LABELS))
+    except (TypeError, ValueError):
+        return None, (jsonify({'error': 'top_k must be an integer'}), 400)
+    return (imageNames, getImageFiles, choosenModelList, options), None
+
+def label_api_prediction(model, probs, top_k):
+    """
+    LABEL_API_PREDICTION : provide json prediction of a model for an image such (probability of each label and top_k labels)
+    """
+    return {'model': model, 'probabilities': dict(zip(LABELS, probs)), 'top_k': RankPredictionLabels(probs, LABELS, top_k)}
+
+# @app.route('/'+PRODUCT_ID+'/api/v1/predict', methods=['POST']) # TO CHANGE
+@app.route('/api/v1/predict', methods=['POST'])
+def api_predict():
+    """
+    API_PREDICT : handle POST json prediction of several images for several models
+                * images, models and top_k are read by read_api_request()
+                * every model predicts all images with one batched forward pass (PredictRGBImageBatch)
+                * response hold probability of each label, top_k labels and run_time for each image and each model, 
+                * also batch run_time of each model and total time of the request
+    """
+    start                   = time.perf_counter()
+    apiRequest, apiError    = read_api_request()
+    if apiError:
+        return apiError
+    imageNames, getImageFiles, choosenModelList, options = apiRequest
+    if len(getImageFiles) > API_MAX_IMAGES:
+        return jsonify({'error': 'too many images, submit them as a job', 'max_images': API_MAX_IMAGES}), 400
+
+    try:
+        predictionResult, predictionTime = PredictRGBImageBatch(choosenModelList, MODEL_PATH, getImageFiles)  # TO CHANGE 
+        # predictionResult, predictionTime = PredictGrayImageBatch(choosenModelList, MODEL_PATH, getImageFiles)  # TO CHANGE 
+    except (OSError, ValueError):
+        return jsonify({'error': 'one of images can not be decoded'}), 400
+
+    results = []
+    with StageTimer('postprocess'):
+        modelRows   = [modelResult.tolist() for modelResult in predictionResult]
+        modelRanks  = [RankBatchPredictionLabels(modelResult, LABELS, options['top_k']) for modelResult in predictionResult] # top_k of all images at once
+        imageTime   = [round(runTime / len(imageNames), 4) for runTime in predictionTime]
+        for imageIndex, imageName in enumerate(imageNames):
+            predictions = [{'model': model, 'probabilities': dict(zip(LABELS, modelRows[modelIndex][imageIndex])),
+                            'top_k': modelRanks[modelIndex][imageIndex], 'run_time': imageTime[modelIndex]}
+                           for modelIndex, model in enumerate(choosenModelList)]
+            results.append({'image': imageName, 'predictions': predictions})
+
+    with StageTimer('render'):
+        return jsonify({'api_version': 'v1', 'labels': LABELS, 'models': choosenModelList, 'results': results,
+                        'timing': {'models': dict(zip(choosenModelList, predictionTime)), 'total': round(time.perf_counter() - start, 4),
+                                   'stages': GetStageTimings()}})
+
+# @app.route('/'+PRODUCT_ID+'/api/v1/jobs', methods=['POST']) # TO CHANGE
+@app.route('/api/v1/jobs', methods=['POST'])
+def api_submit_job():
+    """
+    API_SUBMIT_JOB : handle POST submission of an asynchronous prediction job (for many images)
+                   * images, models and top_k are read by read_api_request()
+                   * optional "lane" ("bulk" by default or "interactive") and "callback_url" (http or https url called with the finished job)
+                   * response hold job id, status, progress and url to poll the job
+    """
+    apiRequest, apiError = read_api_request()
+    if apiError:
+        return apiError
+    imageNames, getImageFiles, choosenModelList, options = apiRequest
+    if len(getImageFiles) > JOB_MAX_IMAGES:
+        return jsonify({'error': 'too many images', 'max_images': JOB_MAX_IMAGES}), 400
+
+    try:
+        job = SubmitPredictionJob(choosenModelList, MODEL_PATH, list(zip(imageNames, getImageFiles)),
+                                  options.get('lane', 'bulk'), options.get('callback_url'))
+    except ValueError as error:
+        return jsonify({'error': str(error)}), 400
+    job['poll_url'] = url_for('api_get_job', job_id=job['id'])
+    return jsonify(job), 202
+
+# @app.route('/'+PRODUCT_ID+'/api/v1/jobs/<job_id>') # TO CHANGE
+@app.route('/api/v1/jobs/<job_id>')
+def api_get_job(job_id):
+    """
+    API_GET_JOB : provide status, progress and finished results of a prediction job as json
+                * results hold probability of each label and top_k labels for each finished image and each model
+                * optional query string top_k (default all labels)
+    """
+    job = GetPredictionJob(job_id)
+    if job is None:
+        return jsonify({'error': 'unknown or expired job', 'id': job_id}), 404
+
+    topK = min(max(request.args.get('top_k', len(LABELS), type=int), 1), len(LABELS))
+    for result in job['results']:
+        result['predictions'] = [label_api_prediction(model, probs, topK) for model, probs in result['predictions'].items()]
+    job['labels'] = LABELS
+    return jsonify(job)
+
 if __name__ == "__main__": 
     # LOCAL DEVELOPMENT CONFIG
+    if os.environ.get('WERKZEUG_RUN_MAIN') == 'true': # debug reloader serves from its child process, the parent only watches files
+        start_worker_services()
     app.run(debug=True, host='127.0.0.1', port=5000) # TO CHANGE 
     
     # PRODUCTION CONFIG    
+    start_worker_services() # does nothing when services are already started by LOCAL DEVELOPMENT CONFIG
     # app.run(debug=False, host='0.0.0.0', port=2000, # TO CHANGE 
     # HANDLE SSL CERT AND KEYS
     #         ssl_context = ('/home/admin/conf/web/ssl.riset.informatika.umm.ac.id.crt', # TO CHANGE 
@@ -0,0 +1,70 @@
+"""
+
+Documentation
+
+Microbenchmark of inference engine. It compares keras model.predict() (inference engine mode 'predict') with
+compiled graph functions traced for each batch size bucket (inference engine mode 'compiled', src/config/engine.py)
+on a model of static/model/, and checks both give the same prediction.
+
+HOW TO RUN
+
+            * python benchmark_inference.py
+            * python benchmark_inference.py --model VGG_model --batch 1 3 8 --iterations 100
+
+Reported numbers are warm-up time of compiled engine and mean latency of one prediction call for each batch size.
+
+@cham_is_fum
+"""
+
+# python package
+import argparse
+import time
+
+import numpy as np
+
+# internal package
+from src.config import config
+from src.config import engine
+
+def measure(function, iterations):
+    """
+        provide mean latency (seconds) of one call of function
+    """
+    function() # first call is not measured
+    start = time.perf_counter()
+    for _ in range(iterations):
+        function()
+    return (time.perf_counter() - start) / iterations
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Microbenchmark of model.predict() and compiled inference engine')
+    parser.add_argument('--path', default='static/model/', help='model directory')
+    parser.add_argument('--model', default=None, help='model name (default first model of model directory)')
+    parser.add_argument('--batch', type=int, nargs='+', default=[1, 3, 8], help='batch sizes to predict')
+    parser.add_argument('--iterations', type=int, default=50)
+    args = parser.parse_args()
+
+    model_dict, model_names, _ = config._getDictModel(args.path)
+    model_name  = args.model or model_names[0]
+    model       = config._loadModelFromFile(model_dict[model_name])
+    input_shape = tuple(model.input_shape[1:])
+
+    engine._setInferenceEngine('compiled')
+    start       = time.perf_counter()
+    engine._warmupEngine(model)
+    print('model %s %s, warm-up of compiled engine %.3f s, %d iterations' % (model_name, input_shape, time.perf_counter() - start, args.iterations))
+
+    for batch_size in args.batch:
+        batch = np.random.rand(batch_size, *input_shape).astype(np.float32)
+
+        engine._setInferenceEngine('predict')
+        expected         = engine._predictRows(model, batch)
+        predict_latency  = measure(lambda: engine._predictRows(model, batch), args.iterations)
+
+        engine._setInferenceEngine('compiled')
+        engine._warmupEngine(model)
+        assert np.allclose(expected, engine._predictRows(model, batch), atol=1e-5)
+        compiled_latency = measure(lambda: engine._predictRows(model, batch), args.iterations)
+
+        print('batch %-3d predict %9.3f ms   compiled %9.3f ms   speed up %6.1fx' % (batch_size, predict_latency * 1000,
+              compiled_latency * 1000, predict_latency / compiled_latency))
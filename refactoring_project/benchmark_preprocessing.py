@@ -0,0 +1,114 @@
+"""
+
+Documentation
+
+Microbenchmark of image preprocessing. It compares the step by step preprocessing chain (resize, RGB to BGR,
+astype float32 / 255 and expand dimension, every step allocates a new array) with the fused preprocessing
+which resizes and normalizes straight into pooled buffers (src/config/buffers.py), and checks both give the same tensor.
+
+HOW TO RUN
+
+            * python benchmark_preprocessing.py
+            * python benchmark_preprocessing.py --image static/queryImage/Glioma_4.jpg --size 224 --batch 8 --iterations 200
+
+Reported numbers are mean latency of one preprocessing call and mean bytes allocated by one call (traced by tracemalloc).
+
+@cham_is_fum
+"""
+
+# python package
+import argparse
+import os
+import time
+import tracemalloc
+
+import numpy as np
+
+# internal package
+from src.config import buffers
+from src.config import config
+from src.infra import infra
+
+def legacy_rgb_tensor(image_array, image_size):
+    """
+        step by step RGB preprocessing, each step allocates a new array
+    """
+    convertToBGR    = infra._renderRGBImage(image_array)
+    resizeImage     = infra._resizeImage(convertToBGR, image_size)
+    normalizeImage  = infra._normalizeImage(resizeImage)
+    return infra._expandRGBImageDimensions(normalizeImage, 0)
+
+def legacy_rgb_batch(image_arrays, image_size):
+    """
+        step by step RGB preprocessing of several images stacked into one batch
+    """
+    return infra._stackImageTensors([legacy_rgb_tensor(image_array, image_size) for image_array in image_arrays])
+
+def fused_rgb_batch(image_arrays, image_size):
+    """
+        fused RGB preprocessing of several images straight into rows of one pooled batch buffer
+    """
+    batch = buffers._allocateBuffer((len(image_arrays),) + config._getTensorShape(image_size, 'rgb')[1:], 'float32')
+    for index, image_array in enumerate(image_arrays):
+        config._rgbTensorFromArray(image_array, image_size, batch[index:index + 1])
+    return batch
+
+def measure(function, iterations):
+    """
+        provide mean latency (seconds) and mean allocated bytes of one call of function,
+        latency is measured without tracemalloc since tracing slows down every allocation
+    """
+    function() # warm up, pooled buffers are created here
+    start     = time.perf_counter()
+    for _ in range(iterations):
+        function()
+    latency   = (time.perf_counter() - start) / iterations
+
+    tracemalloc.start()
+    allocated = 0
+    for _ in range(iterations):
+        tracemalloc.reset_peak()
+        baseline, _ = tracemalloc.get_traced_memory()
+        function()
+        _, peak     = tracemalloc.get_traced_memory()
+        allocated   += peak - baseline
+    tracemalloc.stop()
+    return latency, allocated / iterations
+
+def run_pooled(function):
+    """
+        run function inside a buffer scope, like a request of the service
+    """
+    def pooled():
+        with buffers._bufferScope():
+            function()
+    return pooled
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Microbenchmark of step by step and fused image preprocessing')
+    parser.add_argument('--image', default=None, help='image to preprocess (default first image of static/queryImage/)')
+    parser.add_argument('--size', type=int, default=224, help='model input size')
+    parser.add_argument('--batch', type=int, default=8, help='number of images of batch benchmark')
+    parser.add_argument('--iterations', type=int, default=200)
+    args = parser.parse_args()
+
+    image_file  = args.image or os.path.join('static/queryImage/', sorted(os.listdir('static/queryImage/'))[0])
+    image_size  = (args.size, args.size)
+    image_array = config._decodeRGBImage(image_file)
+    batch       = [image_array] * args.batch
+
+    with buffers._bufferScope():
+        assert np.array_equal(legacy_rgb_tensor(image_array, image_size), config._rgbTensorFromArray(image_array, image_size))
+        assert np.array_equal(legacy_rgb_batch(batch, image_size), fused_rgb_batch(batch, image_size))
+
+    cases = [
+        ('single  step by step', lambda: legacy_rgb_tensor(image_array, image_size)),
+        ('single  fused pooled', run_pooled(lambda: config._rgbTensorFromArray(image_array, image_size))),
+        ('batch %-2d step by step' % args.batch, lambda: legacy_rgb_batch(batch, image_size)),
+        ('batch %-2d fused pooled' % args.batch, run_pooled(lambda: fused_rgb_batch(batch, image_size))),
+    ]
+
+    print('image %s %s -> %s, %d iterations' % (image_file, image_array.shape, image_size, args.iterations))
+    for name, function in cases:
+        latency, allocated = measure(function, args.iterations)
+        print('%-24s latency %8.3f ms   allocated %10.1f KB / call' % (name, latency * 1000, allocated / 1024))
@@ -0,0 +1,278 @@
+"""
+
+Documentation
+
+Offline bulk inference of image archives with the models of static/model/ folder. Images of a directory (searched recursively)
+or of a file list are streamed through a bounded pipeline:
+
+            * decode and preprocessing of the next batches run on worker threads (prefetch batches ahead), with the same
+              config preprocessing as the web service (src/config/config.py _batchImageProcessing), each image is decoded once
+              for every selected model
+            * every model predicts the current batch with one batched forward pass of the inference engine, while workers
+              prepare the next batches
+            * probabilities are rounded percentages (as shown by the web service) with the top-1 label of each model, results
+              are written incrementally into a CSV file or a Parquet directory (one part file per --part-rows rows, pyarrow
+              is needed for Parquet)
+
+The output is also the checkpoint, --resume skips images which are already in the output so an interrupted run continues
+where it stopped. Images which can not be decoded are written with their error and are not predicted.
+Throughput (images per second) is reported while running and at the end, with time spent on decode, inference and writing.
+
+HOW TO RUN
+
+            * python bulk_predict.py archive/ --output cache/archive_scores.csv
+            * python bulk_predict.py archive/ --model VGG_model SMALL_model --batch-size 32 --workers 4 --prefetch 4
+            * python bulk_predict.py --list slices.txt --output cache/archive_scores.parquet --resume
+
+@cham_is_fum
+"""
+
+# python package
+import argparse
+import collections
+import concurrent.futures
+import csv
+import glob
+import os
+import time
+
+import numpy as np
+
+# internal package
+from src.config import config
+from src.config import engine
+from src.config import imports
+from src.infra import infra
+
+IMAGE_EXTENSIONS    = ('.jpg', '.jpeg', '.png', '.bmp', '.gif', '.tif', '.tiff', '.webp')
+
+def list_images(inputs, list_file):
+    """
+        provide sorted image files of input directories (searched recursively), input files and files listed in list_file
+    """
+    images = set()
+    for input_path in inputs:
+        if os.path.isdir(input_path):
+            for root, _, files in os.walk(input_path):
+                images.update(os.path.join(root, name) for name in files if infra._getFileExtension(name).lower() in IMAGE_EXTENSIONS)
+        else:
+            images.add(input_path)
+    if list_file:
+        with open(list_file, 'r') as opened_file:
+            images.update(line.strip() for line in opened_file if line.strip())
+    return sorted(images)
+
+def result_columns(model_names, labels):
+    """
+        provide output columns: path, error, then probability of each label and top-1 label of each model
+    """
+    columns = ['path', 'error']
+    for model_name in model_names:
+        columns += ['%s_%s' % (model_name, label) for label in labels] + ['%s_prediction' % model_name]
+    return columns
+
+def read_done_images(output, output_format, columns):
+    """
+        provide images already written into output (resume checkpoint), an output written with other columns is refused
+    """
+    if output_format == 'csv':
+        if not os.path.exists(output):
+            return set()
+        with open(output, 'rb+') as opened_file: # drop a row which was cut by an interrupted run
+            data = opened_file.read()
+            if data and not data.endswith(b'\n'):
+                opened_file.truncate(data.rfind(b'\n') + 1)
+        with open(output, 'r', newline='') as opened_file:
+            rows = list(csv.reader(opened_file))
+        if rows and rows[0] != columns:
+            raise SystemExit('%s has other columns (models or labels), use another --output' % output)
+        return {row[0] for row in rows[1:] if len(row) == len(columns)}
+
+    done = set()
+    for part_file in sorted(glob.glob(os.path.join(output, 'part-*.parquet'))):
+        parquet = imports._importModule('pyarrow.parquet')
+        if parquet.read_schema(part_file).names != columns:
+            raise SystemExit('%s has other columns (models or labels), use another --output' % part_file)
+        done.update(parquet.read_table(part_file, columns=['path']).column('path').to_pylist())
+    return done
+
+def open_writer(output, output_format, columns, resume):
+    """
+        provide writer of output, results are appended when resume is set else output is started again
+    """
+    writer = {'format': output_format, 'columns': columns, 'output': output, 'pending': [], 'parts': 0}
+    if output_format == 'csv':
+        if os.path.dirname(output):
+            os.makedirs(os.path.dirname(output), exist_ok=True)
+        append           = resume and os.path.exists(output) and os.path.getsize(output) > 0
+        writer['file']   = open(output, 'a' if append else 'w', newline='')
+        writer['csv']    = csv.writer(writer['file'])
+        if not append:
+            writer['csv'].writerow(columns)
+        return writer
+
+    imports._importModule('pyarrow.parquet') # fail before the first batch when pyarrow is not installed
+    os.makedirs(output, exist_ok=True)
+    part_files = sorted(glob.glob(os.path.join(output, 'part-*.parquet')))
+    if not resume:
+        for part_file in part_files:
+            os.remove(part_file)
+        part_files = []
+    writer['parts'] = max([int(os.path.basename(part_file)[5:10]) + 1 for part_file in part_files] or [0])
+    return writer
+
+def flush_parquet_part(writer):
+    """
+        write pending rows as the next parquet part file, the part is renamed into place only when it is complete
+    """
+    if not writer['pending']:
+        return
+    pyarrow   = imports._importModule('pyarrow')
+    parquet   = imports._importModule('pyarrow.parquet')
+    table     = pyarrow.Table.from_pydict(dict(zip(writer['columns'], map(list, zip(*writer['pending'])))))
+    part_file = os.path.join(writer['output'], 'part-%05d.parquet' % writer['parts'])
+    parquet.write_table(table, part_file + '.tmp')
+    os.replace(part_file + '.tmp', part_file)
+    writer['parts']   += 1
+    writer['pending']  = []
+
+def write_rows(writer, rows, part_rows):
+    """
+        write result rows of a batch, csv rows are flushed at once and parquet rows once part_rows rows are pending
+    """
+    if writer['format'] == 'csv':
+        writer['csv'].writerows(rows)
+        writer['file'].flush()
+        return
+    writer['pending'].extend(rows)
+    if len(writer['pending']) >= part_rows:
+        flush_parquet_part(writer)
+
+def close_writer(writer):
+    """
+        write remaining rows and close output
+    """
+    if writer['format'] == 'csv':
+        writer['file'].close()
+    else:
+        flush_parquet_part(writer)
+
+def preprocess_chunk(chunk, models, mode):
+    """
+        provide batch tensor of a chunk of images for each model, errors of images which can not be decoded (by chunk index)
+        and preprocessing time. Runs on a worker thread, outside of buffer scope so batches can be handed to the main thread
+    """
+    start = time.perf_counter()
+    try:
+        batches, errors = config._batchImageProcessing(chunk, models, mode), {}
+    except (OSError, ValueError): # one of images can not be decoded, preprocess images one by one to find it
+        rows, errors = [], {}
+        for index, image_file in enumerate(chunk):
+            try:
+                rows.append(config._batchImageProcessing([image_file], models, mode))
+            except (OSError, ValueError) as error:
+                errors[index] = '%s: %s' % (type(error).__name__, error)
+        batches = [np.concatenate([row[model_index] for row in rows], axis=0) for model_index in range(len(models))] if rows else None
+    return batches, errors, time.perf_counter() - start
+
+def prefetched_chunks(executor, function, images, batch_size, prefetch):
+    """
+        provide (chunk, function(chunk)) of each chunk of batch_size images in order, up to prefetch chunks are prepared ahead
+    """
+    pending = collections.deque()
+    for start in range(0, len(images), batch_size):
+        chunk = images[start:start + batch_size]
+        pending.append((chunk, executor.submit(function, chunk)))
+        if len(pending) > prefetch:
+            chunk, future = pending.popleft()
+            yield chunk, future.result()
+    while pending:
+        chunk, future = pending.popleft()
+        yield chunk, future.result()
+
+def result_rows(chunk, errors, predictions, labels):
+    """
+        provide output rows of a chunk from (N, classes) rounded predictions of each model (None when no image was decoded)
+    """
+    rows         = [[image_file, errors.get(index, '')] for index, image_file in enumerate(chunk)]
+    scored       = [index for index in range(len(chunk)) if index not in errors]
+    empty        = [None] * (len(labels) + 1)
+    for prediction in predictions:
+        if prediction is None: # no image of the chunk can be decoded
+            prediction = np.zeros((0, len(labels)))
+        top_labels = [labels[index] for index in infra._getTopIndices(prediction, 1)[:, 0].tolist()]
+        for row_index, probabilities, top_label in zip(scored, prediction.tolist(), top_labels):
+            rows[row_index] += probabilities + [top_label]
+        for row_index in errors:
+            rows[row_index] += empty
+    return rows
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Predict image archives with models of model directory and write results into CSV or Parquet')
+    parser.add_argument('inputs', nargs='*', help='image directories (searched recursively) or image files')
+    parser.add_argument('--list', default=None, help='text file with one image path per line')
+    parser.add_argument('--path', default='static/model/', help='model directory')
+    parser.add_argument('--model', nargs='+', default=None, help='model names (default every model of model directory)')
+    parser.add_argument('--mode', default='rgb', choices=['rgb', 'gray'], help='preprocessing of images')
+    parser.add_argument('--labels', nargs='+', default=None, help='class names in class index order (default CLASS_DICT of app.py)')
+    parser.add_argument('--output', default='cache/bulk_predictions.csv', help='.csv file or .parquet directory')
+    parser.add_argument('--resume', action='store_true', help='skip images which are already in output')
+    parser.add_argument('--batch-size', type=int, default=32, help='images predicted by one forward pass')
+    parser.add_argument('--workers', type=int, default=4, help='decode and preprocessing threads')
+    parser.add_argument('--prefetch', type=int, default=4, help='batches prepared ahead of inference')
+    parser.add_argument('--part-rows', type=int, default=4096, help='rows of each parquet part file')
+    parser.add_argument('--engine', default='compiled', choices=['compiled', 'predict'], help='inference engine mode')
+    parser.add_argument('--log-every', type=int, default=20, help='report progress every this many batches')
+    args = parser.parse_args()
+
+    if not args.inputs and not args.list:
+        parser.error('give image directories / files or --list')
+    if args.labels is None:
+        class_dict  = infra._readModuleConstant(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'app.py'), 'CLASS_DICT')
+        args.labels = sorted(class_dict, key=class_dict.get)
+
+    output_format              = 'parquet' if args.output.rstrip('/').endswith('.parquet') else 'csv'
+    model_dict, model_names, _ = config._getDictModel(args.path)
+    model_names                = args.model or model_names
+    unknown_models             = [model_name for model_name in model_names if model_name not in model_dict]
+    if unknown_models:
+        parser.error('unknown models %s, use one of %s' % (unknown_models, sorted(model_dict)))
+
+    columns   = result_columns(model_names, args.labels)
+    images    = list_images(args.inputs, args.list)
+    done      = read_done_images(args.output, output_format, columns) if args.resume else set()
+    images    = [image_file for image_file in images if image_file not in done]
+    print('%d images to predict (%d already in %s), models %s' % (len(images), len(done), args.output, model_names))
+
+    engine._setInferenceEngine(args.engine, tuple(sorted({1, 2, 4, 8, 16, 32, 64, args.batch_size})), args.batch_size)
+    models    = [config._loadSelectModel(model_name, args.path) for model_name in model_names] # loaded and warmed up before timing
+    writer    = open_writer(args.output, output_format, columns, args.resume)
+    timing    = {'decode': 0.0, 'inference': 0.0, 'write': 0.0}
+    scored    = 0
+    failed    = 0
+    start     = time.perf_counter()
+
+    try:
+        with concurrent.futures.ThreadPoolExecutor(max_workers=max(args.workers, 1), thread_name_prefix='bulk-preprocess') as executor:
+            preprocess = lambda chunk: preprocess_chunk(chunk, models, args.mode)
+            for batch_index, (chunk, (batches, errors, decode_time)) in enumerate(
+                    prefetched_chunks(executor, preprocess, images, args.batch_size, max(args.prefetch, 1)), 1):
+                inference_start = time.perf_counter()
+                predictions     = [infra._roundedPercentageArray(engine._predictRows(model, batch), 3) for model, batch in zip(models, batches)] if batches else [None] * len(models)
+                write_start     = time.perf_counter()
+                write_rows(writer, result_rows(chunk, errors, predictions, args.labels), args.part_rows)
+
+                timing['decode']    += decode_time
+                timing['inference'] += write_start - inference_start
+                timing['write']     += time.perf_counter() - write_start
+                scored              += len(chunk)
+                failed              += len(errors)
+                if batch_index % max(args.log_every, 1) == 0:
+                    print('%d/%d images   %.1f images/s' % (scored, len(images), scored / (time.perf_counter() - start)))
+    finally:
+        close_writer(writer)
+
+    seconds = time.perf_counter() - start
+    print('%d images (%d can not be decoded) in %.2f s, %.1f images/s' % (scored, failed, seconds, scored / seconds if seconds else 0.0))
+    print('decode %.2f s (on %d workers), inference %.2f s, write %.2f s' % (timing['decode'], args.workers, timing['inference'], timing['write']))
+    print('results saved into %s' % args.output)
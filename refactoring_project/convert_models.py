@@ -0,0 +1,98 @@
+"""
+
+Documentation
+
+Offline converter of keras models in static/model/ folder. Each keras model (h5 model or json model with its weight) is exported
+into TFLite and / or ONNX file next to it, named <name>_tflite_model.tflite and <name>_onnx_model.onnx, so the exported models
+are listed by the model catalog as new selectable models and served by their own backend (see src/config/backends.py).
+Every exported model is checked against its keras model on query image samples: the outputs must match within tolerance.
+
+HOW TO RUN
+
+            * python convert_models.py
+            * python convert_models.py --model VGG_model --format tflite --atol 1e-4
+            * python convert_models.py --check-only (only check parity of already exported models)
+
+ONNX export needs tf2onnx and ONNX serving needs onnxruntime (pip install tf2onnx onnxruntime).
+Exit status is 1 when one of the exported models does not match its keras model.
+
+@cham_is_fum
+"""
+
+# python package
+import argparse
+import os
+import sys
+
+import numpy as np
+
+# internal package
+from src.config import backends
+from src.config import config
+
+EXPORTERS   = {'tflite': ('.tflite', backends._exportTFLiteModel), 'onnx': ('.onnx', backends._exportOnnxModel)}
+
+def exported_model_file(model_path, model_name, export_format):
+    """
+        provide file of exported model, such static/model/VGG_tflite_model.tflite for VGG_model
+    """
+    base_name = model_name[:-len('_model')] if model_name.endswith('_model') else model_name
+    extension = EXPORTERS[export_format][0]
+    return os.path.join(model_path, '%s_%s_model%s' % (base_name, export_format, extension))
+
+def sample_batch(query_path, image_size, mode, samples):
+    """
+        provide preprocessed batch of query image samples for image_size
+    """
+    build_tensor = config._buildRGBTensor if mode == 'rgb' else config._buildGrayTensor
+    image_files  = [os.path.join(query_path, name) for name in sorted(os.listdir(query_path))][:samples]
+    return np.concatenate([build_tensor(image_file, image_size) for image_file in image_files], axis=0)
+
+def check_parity(keras_model, exported_model, batch, atol):
+    """
+        provide max absolute difference and top-1 agreement of exported model against keras model
+    """
+    expected  = np.asarray(keras_model.predict(batch, verbose=0))
+    result    = np.asarray(exported_model.predict(batch))
+    max_diff  = float(np.max(np.abs(expected - result)))
+    agreement = float(np.mean(np.argmax(expected, axis=1) == np.argmax(result, axis=1)))
+    return max_diff, agreement, max_diff <= atol
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Export keras models into TFLite / ONNX and check parity of the outputs')
+    parser.add_argument('--path', default='static/model/', help='model directory')
+    parser.add_argument('--query', default='static/queryImage/', help='query image directory used for parity check')
+    parser.add_argument('--model', nargs='+', default=None, help='keras model names (default every keras model of model directory)')
+    parser.add_argument('--format', nargs='+', default=['tflite', 'onnx'], choices=sorted(EXPORTERS))
+    parser.add_argument('--mode', default='rgb', choices=['rgb', 'gray'], help='preprocessing of query images')
+    parser.add_argument('--samples', type=int, default=8, help='number of query images used for parity check')
+    parser.add_argument('--atol', type=float, default=1e-4, help='maximum absolute difference of outputs')
+    parser.add_argument('--check-only', action='store_true', help='do not export, only check already exported models')
+    args = parser.parse_args()
+
+    model_dict, model_names, _ = config._getDictModel(args.path)
+    keras_names = [name for name in model_names if backends._getModelBackend(model_dict[name]) == 'keras']
+    failed      = 0
+
+    for model_name in args.model or keras_names:
+        keras_model = backends._loadKerasModel(model_dict[model_name])
+        image_size  = tuple(keras_model.input_shape[1:3])
+        batch       = sample_batch(args.query, image_size, args.mode, args.samples)
+
+        for export_format in args.format:
+            output_file = exported_model_file(args.path, model_name, export_format)
+            try:
+                if not args.check_only:
+                    EXPORTERS[export_format][1](keras_model, output_file)
+                exported_model                 = backends._loadBackendModel(output_file)
+                max_diff, agreement, parity_ok = check_parity(keras_model, exported_model, batch, args.atol)
+            except Exception as error: # missing optional package or unsupported layer, other models are still converted
+                failed += 1
+                print('%-24s %-6s FAILED %s: %s' % (model_name, export_format, type(error).__name__, error))
+                continue
+
+            failed += 0 if parity_ok else 1
+            print('%-24s %-6s %-40s size %8.1f KB   max diff %.2e   top-1 agreement %5.1f%%   %s' % (model_name, export_format,
+                  output_file, os.path.getsize(output_file) / 1024, max_diff, agreement * 100, 'OK' if parity_ok else 'MISMATCH'))
+
+    sys.exit(1 if failed else 0)
@@ -0,0 +1,55 @@
+"""
+
+Documentation
+
+Offline evaluation of the model leaderboard (/leaderboard page and /api/v1/leaderboard of the web service). Every model of
+static/model/ folder without a saved report of its current files is evaluated over the labelled query images
+(static/queryImage/<Class>_*): accuracy, recall of each class, confusion matrix and p50 / p95 latency and images per second
+of each benchmark batch size (see src/config/leaderboard.py).
+
+Reports are saved into LEADERBOARD_CACHE_PATH of app.py with the same key as the web service (model files, query images,
+CLASS_DICT, LEADERBOARD_BATCH_SIZES, LEADERBOARD_ITERATIONS and LEADERBOARD_IMAGE_MODE of app.py), so every worker of the
+service shows them right away. Run it when the service is quiet or on another machine sharing the cache folder, the
+web service itself never evaluates a model inside a request.
+
+HOW TO RUN
+
+            * python evaluate_models.py
+            * python evaluate_models.py --refresh (evaluate every model again)
+
+@cham_is_fum
+"""
+
+# python package
+import argparse
+import os
+
+# internal package
+from src.config import engine
+from src.config import leaderboard
+from src.infra import infra
+
+APP_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'app.py')
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Evaluate models of model directory and save their leaderboard reports for the web service')
+    parser.add_argument('--refresh', action='store_true', help='evaluate every model again (default only new or changed models)')
+    args = parser.parse_args()
+
+    setting     = {name: infra._readModuleConstant(APP_FILE, name) for name in (
+                   'CLASS_DICT', 'MODEL_PATH', 'QUERY_IMAGE_PATH', 'LEADERBOARD_CACHE_PATH', 'LEADERBOARD_BATCH_SIZES',
+                   'LEADERBOARD_ITERATIONS', 'LEADERBOARD_IMAGE_MODE', 'INFERENCE_ENGINE', 'INFERENCE_WARMUP_BATCH')}
+    arguments   = (setting['MODEL_PATH'], setting['QUERY_IMAGE_PATH'], setting['CLASS_DICT'], setting['LEADERBOARD_IMAGE_MODE'])
+
+    engine._setInferenceEngine(setting['INFERENCE_ENGINE'], (1, 2, 4, 8, 16, 32, 64), setting['INFERENCE_WARMUP_BATCH']) # as served by app.py
+    leaderboard._setLeaderboard(setting['LEADERBOARD_CACHE_PATH'], setting['LEADERBOARD_BATCH_SIZES'], setting['LEADERBOARD_ITERATIONS'])
+    evaluated   = leaderboard._evaluateLeaderboard(*arguments, refresh=args.refresh)
+    result      = leaderboard._getLeaderboard(*arguments)
+    print('%d labelled samples, evaluated %s' % (result['samples'], evaluated or 'nothing (every report is up to date)'))
+
+    for rank, report in enumerate(result['models'], 1):
+        if report.get('error'):
+            print('%2d. %-28s %s' % (rank, report['model'], report['error']))
+            continue
+        throughput = '   '.join('batch %d : %.1f images/s' % (benchmark['batch_size'], benchmark['images_per_second']) for benchmark in report['throughput'])
+        print('%2d. %-28s accuracy %6.2f%%   %s' % (rank, report['model'], report['accuracy'], throughput))
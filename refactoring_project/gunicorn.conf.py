@@ -0,0 +1,58 @@
+"""
+
+Documentation
+
+Gunicorn configuration of pre-fork serving. Gunicorn master imports app.py once (preload_app) before it forks the workers,
+so TensorFlow / Keras modules and TFLite models read by the master (see src/config/prefork.py) are shared copy-on-write by
+every worker instead of being loaded again by each of them:
+
+            * the master never initializes TensorFlow runtime (no model load, no op), CheckForkSafety is called before each fork
+              and stops the master when TensorFlow runtime is initialized in it
+            * inference pool and background threads of a worker (prediction jobs and model preload) are started after fork
+              by start_worker_services, each worker starts its own pool (INFERENCE_PROCESSES of app.py, 0 by default), so
+              WEB_CONCURRENCY x INFERENCE_PROCESSES inference processes keep their own copy of each model
+            * memory of the master after preload and of each worker after its start is logged as rss, pss and uss,
+              /stats (prefork) and /metrics (ml_worker_memory_bytes) report memory of running workers
+
+pss divides each shared page between the processes sharing it, so the sum of pss of the master and its workers is the real
+memory of the service, uss is the private memory of a worker (freed when it exits).
+
+HOW TO RUN
+
+            * gunicorn -c gunicorn.conf.py app:app
+            * WEB_CONCURRENCY=4 GUNICORN_BIND=0.0.0.0:2000 gunicorn -c gunicorn.conf.py app:app
+
+@cham_is_fum
+"""
+
+# python package
+import os
+
+os.environ['PREFORK_SERVING'] = '1' # app.py prepares pre-fork serving when it is imported by the master
+
+bind        = os.environ.get('GUNICORN_BIND', '0.0.0.0:2000') # TO CHANGE
+workers     = int(os.environ.get('WEB_CONCURRENCY', 2))       # TO CHANGE
+timeout     = 120                                             # TO CHANGE # a keras model is loaded by the first request of each worker
+preload_app = True
+
+def format_memory(memory):
+    """
+    Provide memory of a process as text, such 'rss 612.4 MB, pss 201.3 MB, uss 38.9 MB'
+    """
+    return ', '.join('%s %.1f MB' % (kind, memory[kind] / 1048576) for kind in ('rss', 'pss', 'uss') if memory[kind] is not None)
+
+def when_ready(server):
+    import app
+    server.log.info('master %d memory after preload : %s', os.getpid(), format_memory(app.GetWorkerMemory()))
+
+def pre_fork(server, worker):
+    import app
+    app.CheckForkSafety() # RuntimeError stops the master instead of forking workers which would hang
+
+def post_fork(server, worker):
+    import app
+    app.start_worker_services()
+
+def post_worker_init(worker):
+    import app
+    worker.log.info('worker %d memory after start : %s', os.getpid(), format_memory(app.GetWorkerMemory()))
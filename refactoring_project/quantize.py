@@ -0,0 +1,149 @@
+"""
+
+Documentation
+
+Post-training quantization of keras models in static/model/ folder. Each keras model is exported into float16 and int8 TFLite
+variants next to it, named <name>_float16_model.tflite and <name>_int8_model.tflite, so the model catalog lists them as new
+selectable models (served by TFLite backend, see src/config/backends.py) and they can be compared side by side with the float
+model on compare page. int8 weights and activations are calibrated on the labelled query image samples (static/queryImage/<Class>_*).
+
+The report compares every variant with its float keras model (as served by inference engine):
+
+            * accuracy of the labelled samples against CLASS_DICT of app.py, and the accuracy drift
+            * top-1 agreement with the float model
+            * model size and size reduction
+            * mean latency of one image and latency gain
+
+Calibration and evaluation use the same samples, so accuracy drift is only a quick check, use a held out set when you have one.
+
+HOW TO RUN
+
+            * python quantize.py
+            * python quantize.py --model VGG_model --variant int8 --mode rgb --iterations 50
+            * python quantize.py --report-only (only report already quantized variants)
+
+@cham_is_fum
+"""
+
+# python package
+import argparse
+import json
+import os
+import time
+
+import numpy as np
+
+# internal package
+from src.config import backends
+from src.config import config
+from src.config import engine
+from src.config import gallery
+from src.infra import infra
+
+VARIANTS    = ('float16', 'int8')
+
+def variant_model_file(model_path, model_name, variant):
+    """
+        provide file of quantized variant, such static/model/VGG_int8_model.tflite for VGG_model
+    """
+    base_name = model_name[:-len('_model')] if model_name.endswith('_model') else model_name
+    return os.path.join(model_path, '%s_%s_model.tflite' % (base_name, variant))
+
+def labelled_samples(query_path, labels):
+    """
+        provide query image files and their class index, class of each sample is taken from its file name <ClassName_>
+    """
+    index         = gallery._getGalleryIndex(query_path)
+    class_index   = {name.upper(): position for position, name in enumerate(labels)}
+    samples       = [(query, class_index[name.upper()]) for name, query in zip(index['classes'], index['queries']) if name.upper() in class_index]
+    return [query for query, _ in samples], np.array([label for _, label in samples])
+
+def sample_batch(image_files, image_size, mode):
+    """
+        provide preprocessed batch of image files for image_size
+    """
+    build_tensor = config._buildRGBTensor if mode == 'rgb' else config._buildGrayTensor
+    return np.concatenate([build_tensor(image_file, image_size) for image_file in image_files], axis=0)
+
+def mean_latency(predict, batch, iterations):
+    """
+        provide mean latency (seconds) of predicting one image of batch
+    """
+    predict(batch[:1]) # first call is not measured
+    start = time.perf_counter()
+    for _ in range(iterations):
+        for row in range(batch.shape[0]):
+            predict(batch[row:row + 1])
+    return (time.perf_counter() - start) / (iterations * batch.shape[0])
+
+def report_variant(name, model_file, predict, batch, targets, reference, iterations):
+    """
+        provide report of a model: accuracy, top-1 agreement with reference prediction, size and latency
+    """
+    prediction = np.asarray(predict(batch))
+    predicted  = np.argmax(prediction, axis=1)
+    size       = sum(os.path.getsize(file_name) for file_name in (model_file if type(model_file) == list else [model_file]))
+    return {
+        'model'     : name,
+        'accuracy'  : round(float(np.mean(predicted == targets)) * 100, 2),
+        'agreement' : round(float(np.mean(predicted == reference)) * 100, 2) if reference is not None else 100.0,
+        'size'      : size,
+        'latency_ms': round(mean_latency(predict, batch, iterations) * 1000, 4),
+    }, predicted
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Quantize keras models into float16 / int8 TFLite variants and report accuracy, size and latency')
+    parser.add_argument('--path', default='static/model/', help='model directory')
+    parser.add_argument('--query', default='static/queryImage/', help='labelled query image directory (calibration and evaluation samples)')
+    parser.add_argument('--model', nargs='+', default=None, help='keras model names (default every keras model of model directory)')
+    parser.add_argument('--variant', nargs='+', default=list(VARIANTS), choices=VARIANTS)
+    parser.add_argument('--mode', default='rgb', choices=['rgb', 'gray'], help='preprocessing of query images')
+    parser.add_argument('--labels', nargs='+', default=None, help='class names in class index order (default CLASS_DICT of app.py)')
+    parser.add_argument('--iterations', type=int, default=20, help='latency is measured over every sample this many times')
+    parser.add_argument('--report', default='cache/quantization_report.json', help='json report file')
+    parser.add_argument('--report-only', action='store_true', help='do not quantize, only report already quantized variants')
+    args = parser.parse_args()
+
+    if args.labels is None:
+        class_dict  = infra._readModuleConstant(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'app.py'), 'CLASS_DICT')
+        args.labels = sorted(class_dict, key=class_dict.get)
+
+    image_files, targets       = labelled_samples(args.query, args.labels)
+    model_dict, model_names, _ = config._getDictModel(args.path)
+    keras_names                = [name for name in model_names if backends._getModelBackend(model_dict[name]) == 'keras']
+    report                     = {'labels': args.labels, 'samples': len(image_files), 'models': []}
+    print('%d labelled samples, labels %s' % (len(image_files), args.labels))
+
+    for model_name in args.model or keras_names:
+        keras_model = backends._loadKerasModel(model_dict[model_name])
+        batch       = sample_batch(image_files, tuple(keras_model.input_shape[1:3]), args.mode)
+
+        baseline, reference = report_variant(model_name, model_dict[model_name], lambda tensor: engine._predictRows(keras_model, tensor),
+                                             batch, targets, None, args.iterations)
+        baseline['variant'] = 'float32'
+        rows                = [baseline]
+
+        for variant in args.variant:
+            variant_file = variant_model_file(args.path, model_name, variant)
+            if not args.report_only:
+                backends._exportTFLiteModel(keras_model, variant_file, variant, batch)
+            variant_model = backends._loadBackendModel(variant_file)
+            row, _        = report_variant(os.path.splitext(os.path.basename(variant_file))[0], variant_file, variant_model.predict,
+                                           batch, targets, reference, args.iterations)
+            row['variant'] = variant
+            rows.append(row)
+
+        for row in rows:
+            row['accuracy_drift'] = round(row['accuracy'] - baseline['accuracy'], 2)
+            row['size_reduction'] = round((1 - row['size'] / baseline['size']) * 100, 2)
+            row['latency_gain']   = round(baseline['latency_ms'] / row['latency_ms'], 2)
+            print('%-28s %-8s accuracy %6.2f%% (drift %+6.2f)   agreement %6.2f%%   size %9.1f KB (-%5.1f%%)   latency %8.3f ms (%5.2fx)' % (
+                  row['model'], row['variant'], row['accuracy'], row['accuracy_drift'], row['agreement'], row['size'] / 1024,
+                  row['size_reduction'], row['latency_ms'], row['latency_gain']))
+        report['models'].append({'model': model_name, 'variants': rows})
+
+    if os.path.dirname(args.report):
+        os.makedirs(os.path.dirname(args.report), exist_ok=True)
+    with open(args.report, 'w') as report_file:
+        json.dump(report, report_file, indent=2)
+    print('report saved into %s' % args.report)
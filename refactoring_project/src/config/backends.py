@@ -0,0 +1,293 @@
+"""
+
+DOCUMENTATION:
+
+backends is part of configuration layer. It provides the inference backends which serve models of static/model/ folder.
+Backend of a model is chosen by its file extension:
+
+            * keras  : <name>_model.h5, <name>_model.hdf5 or <name>_model.json with <name>_weights.h5 (keras load_model / model_from_json)
+            * tflite : <name>_model.tflite (TFLite interpreter, from tflite_runtime when it is installed else from tensorflow)
+            * onnx   : <name>_model.onnx (ONNX Runtime, optional package onnxruntime)
+
+A TFLite or ONNX model is wrapped by a small model object which has the part of keras model interface used by the service
+(predict, input_shape and name), so model registry, micro-batching and inference engine serve every backend the same way.
+Keras models can be exported into TFLite / ONNX files by convert_models.py, which also checks the parity of the outputs.
+In pre-fork serving (see prefork) the gunicorn master reads TFLite model files into memory and every worker builds its
+interpreter over the same bytes, so weight pages are shared copy-on-write by all workers.
+
+"""
+# python package
+import os
+import threading
+
+import numpy as np
+
+# internal package
+from src.config import imports
+from src.infra import infra
+
+# Initialize Global alias
+_getElementByIndex              = infra._getElementByIndex
+_getTensorflow                  = imports._getTensorflow
+_getKerasModels                 = imports._getKerasModels
+_importModule                   = imports._importModule
+
+# Initialize backend state
+_EXTENSIONS                     = {'.h5': 'keras', '.hdf5': 'keras', '.json': 'keras', '.tflite': 'tflite', '.onnx': 'onnx'}
+_NUM_THREADS                    = None # cpu threads used by one TFLite interpreter / ONNX Runtime session, None means backend default
+_SHARED_MODELS                  = {} # TFLite model file -> model bytes read by gunicorn master, shared copy-on-write by its workers
+
+class _TFLiteModel:
+  """
+  _TFLiteModel : TFLite model served by a TFLite interpreter. The interpreter is not thread safe, so predictions of one model
+                 run one at a time, and the input tensor is only resized when the batch size is changed.
+                 A quantized model with integer input / output is quantized and dequantized here, so it accepts and provides float32 like the keras model.
+                 A model shared by gunicorn master is built over its bytes with builtin kernels only, because the default XNNPACK
+                 delegate repacks weights into private memory of each worker.
+  """
+  backend = 'tflite'
+
+  def __init__(self, model_file, num_threads=None):
+    interpreter       = _getTFLiteInterpreter()
+    content           = _SHARED_MODELS.get(model_file)
+    self.name         = os.path.splitext(os.path.basename(model_file))[0]
+    self.nbytes       = os.path.getsize(model_file)
+    self.shared       = content is not None
+    if self.shared:
+      resolver         = _importModule(interpreter.__module__).OpResolverType.BUILTIN_WITHOUT_DEFAULT_DELEGATES
+      self.interpreter = interpreter(model_content=content, num_threads=num_threads, experimental_op_resolver_type=resolver)
+    else:
+      self.interpreter = interpreter(model_path=model_file, num_threads=num_threads)
+    self.interpreter.allocate_tensors()
+    self.input        = self.interpreter.get_input_details()[0]
+    self.output       = self.interpreter.get_output_details()[0]
+    self.input_shape  = (None,) + tuple(int(dimension) for dimension in self.input['shape'][1:])
+    self.batch_size   = int(self.input['shape'][0])
+    self.lock         = threading.Lock()
+
+  def predict(self, batch, **kwargs):
+    batch = np.asarray(batch)
+    with self.lock:
+      if batch.shape[0] != self.batch_size:
+        self.interpreter.resize_tensor_input(self.input['index'], list(batch.shape))
+        self.interpreter.allocate_tensors()
+        self.batch_size = batch.shape[0]
+        self.output     = self.interpreter.get_output_details()[0]
+      self.interpreter.set_tensor(self.input['index'], _quantizeTensor(batch, self.input))
+      self.interpreter.invoke()
+      result = _dequantizeTensor(self.interpreter.get_tensor(self.output['index']), self.output)
+    return result
+
+class _OnnxModel:
+  """
+  _OnnxModel : ONNX model served by an ONNX Runtime inference session (CPU execution provider). The session can be run
+               by several threads at once.
+  """
+  backend = 'onnx'
+
+  def __init__(self, model_file, num_threads=None):
+    onnxruntime = _importOptionalModule('onnxruntime', 'onnx')
+    options     = onnxruntime.SessionOptions()
+    if num_threads:
+      options.intra_op_num_threads = int(num_threads)
+
+    self.name         = os.path.splitext(os.path.basename(model_file))[0]
+    self.nbytes       = os.path.getsize(model_file)
+    self.session      = onnxruntime.InferenceSession(model_file, sess_options=options, providers=['CPUExecutionProvider'])
+    self.input        = self.session.get_inputs()[0]
+    self.input_shape  = (None,) + tuple(dimension if isinstance(dimension, int) else None for dimension in self.input.shape[1:])
+
+  def predict(self, batch, **kwargs):
+    result = self.session.run(None, {self.input.name: np.asarray(batch, dtype=np.float32)})[0]
+    return result
+
+def _importOptionalModule(name, backend):
+  """
+  _importOptionalModule() : Provide an optional package of a backend, with a clear error when the package is not installed
+
+                      ACCEPT module name and backend name as argument
+
+                      RETURN imported module
+  """
+  try:
+    return _importModule(name)
+  except ImportError as error:
+    raise RuntimeError('%s backend needs package %s, install it to serve %s models (%s)' % (backend, name, backend, error)) from error
+
+def _getTFLiteInterpreter():
+  """
+  _getTFLiteInterpreter() : Provide TFLite interpreter class, from the small tflite_runtime package when it is installed
+                            (so TensorFlow is never imported) else from tensorflow
+
+                      RETURN Interpreter class
+  """
+  try:
+    return _importModule('tflite_runtime.interpreter').Interpreter
+  except ImportError:
+    return _getTensorflow().lite.Interpreter
+
+def _quantizeTensor(tensor, detail):
+  """
+  _quantizeTensor() : Convert float tensor into input type of a TFLite tensor (quantized by scale and zero point for integer input)
+
+                      ACCEPT float tensor and TFLite tensor detail as argument
+
+                      RETURN tensor of TFLite input type
+  """
+  scale, zero_point = detail['quantization']
+  if np.issubdtype(detail['dtype'], np.integer) and scale:
+    limits = np.iinfo(detail['dtype'])
+    tensor = np.clip(np.round(tensor / scale + zero_point), limits.min, limits.max)
+  return tensor.astype(detail['dtype'], copy=False)
+
+def _dequantizeTensor(tensor, detail):
+  """
+  _dequantizeTensor() : Convert TFLite output tensor into float32 (dequantized by scale and zero point for integer output)
+
+                      ACCEPT TFLite output tensor and TFLite tensor detail as argument
+
+                      RETURN float32 tensor
+  """
+  scale, zero_point = detail['quantization']
+  if np.issubdtype(detail['dtype'], np.integer) and scale:
+    return (tensor.astype(np.float32) - zero_point) * scale
+  return tensor.astype(np.float32, copy=True) # output buffer of interpreter is reused by the next invoke
+
+def _setBackendThreads(num_threads=None):
+  """
+  _setBackendThreads() : Set cpu threads used by one TFLite interpreter / ONNX Runtime session of models loaded after this call
+
+                      ACCEPT num_threads (None means backend default) as argument
+
+                      RETURN num_threads
+  """
+  global _NUM_THREADS
+  _NUM_THREADS = int(num_threads) if num_threads else None
+  return _NUM_THREADS
+
+def _shareModelBytes(model_and_weight):
+  """
+  _shareModelBytes() : Read a TFLite model file into memory of the current process (gunicorn master), TFLite models loaded later by
+                       forked workers are built over these bytes. Keras and ONNX models copy their weights when they are loaded,
+                       so they are not read here.
+
+                      ACCEPT model_and_weight (list of json model and weight path or model file path) as argument
+
+                      RETURN size of shared model bytes (0 when the backend can not share weights)
+  """
+  if _getModelBackend(model_and_weight) != 'tflite':
+    return 0
+  with open(model_and_weight, 'rb') as model_file:
+    _SHARED_MODELS[model_and_weight] = model_file.read()
+  return len(_SHARED_MODELS[model_and_weight])
+
+def _getModelBackend(model_and_weight):
+  """
+  _getModelBackend() : Provide backend name of a model file by its extension
+
+                      ACCEPT model_and_weight (list of json model and weight path or model file path) as argument
+
+                      RETURN backend name
+
+                      RETURN EXAMPLE :
+
+                                      * BACKEND : 'tflite'
+  """
+  model_file = _getElementByIndex(model_and_weight, 0) if type(model_and_weight) == list else model_and_weight
+  extension  = os.path.splitext(model_file)[1].lower()
+  if extension not in _EXTENSIONS:
+    raise ValueError('unknown model file extension %r, use one of %s' % (extension, ', '.join(sorted(_EXTENSIONS))))
+  return _EXTENSIONS[extension]
+
+def _loadKerasModel(model_and_weight):
+  """
+  _loadKerasModel() : Deserialize keras model either json model (include json model and h5 weight) or h5 model.
+                      Keras (and TensorFlow) is imported here on the first model load, not when the application starts.
+
+                      ACCEPT model_and_weight (list of json model and weight path or h5 model path) as argument
+
+                      RETURN keras sequential model  <keras.engine.sequential.Sequential object at 0x000002C8C8AB8550>
+  """
+  kerasModels         = _getKerasModels() # deferred import of keras, only the first call pays for it
+  if type(model_and_weight) == list and model_and_weight: # handle json model and weight
+    model_name        = _getElementByIndex(model_and_weight, 0) # get json model name
+    weight_name       = _getElementByIndex(model_and_weight, 1) # get model weight
+    json_file         = open(model_name, 'r') # open json model
+    loaded_model_json = json_file.read() # read json model
+    json_file.close()
+    loaded_model      = kerasModels.model_from_json(loaded_model_json) # load json model
+    loaded_model.load_weights(weight_name) # load weight
+
+  else: # handle h5 or hdf5 model
+    loaded_model      = kerasModels.load_model(model_and_weight)
+
+  return loaded_model
+
+def _loadBackendModel(model_and_weight):
+  """
+  _loadBackendModel() : Deserialize a model by the backend of its file (keras, tflite or onnx)
+
+                      ACCEPT model_and_weight (list of json model and weight path or model file path) as argument
+
+                      RETURN loaded model (keras model, _TFLiteModel or _OnnxModel)
+  """
+  backend = _getModelBackend(model_and_weight)
+  if backend == 'tflite':
+    return _TFLiteModel(model_and_weight, _NUM_THREADS)
+  if backend == 'onnx':
+    return _OnnxModel(model_and_weight, _NUM_THREADS)
+  return _loadKerasModel(model_and_weight)
+
+def _getBackendName(model):
+  """
+  _getBackendName() : Provide backend name of a loaded model
+
+                      ACCEPT loaded model as argument
+
+                      RETURN backend name ('keras', 'tflite' or 'onnx')
+  """
+  return getattr(model, 'backend', 'keras')
+
+def _exportTFLiteModel(keras_model, output_file, quantization=None, representative_data=None):
+  """
+  _exportTFLiteModel() : Export keras model into a TFLite file, optionally with post-training quantization
+                         ('float16' weights, or 'int8' weights and activations calibrated on representative_data).
+                         Input and output of a quantized model stay float32, so it is served like the float model.
+
+                      ACCEPT keras model, output_file, quantization (None, 'float16' or 'int8') and representative_data
+                      (preprocessed float32 images with batch dimension, needed by 'int8') as argument
+
+                      RETURN output_file
+  """
+  tf        = _getTensorflow()
+  converter = tf.lite.TFLiteConverter.from_keras_model(keras_model)
+
+  if quantization == 'float16':
+    converter.optimizations               = [tf.lite.Optimize.DEFAULT]
+    converter.target_spec.supported_types = [tf.float16]
+  elif quantization == 'int8':
+    if representative_data is None or not len(representative_data):
+      raise ValueError('int8 quantization needs representative data for calibration')
+    converter.optimizations               = [tf.lite.Optimize.DEFAULT]
+    converter.representative_dataset      = lambda: ([sample[np.newaxis].astype(np.float32)] for sample in representative_data)
+    converter.target_spec.supported_ops   = [tf.lite.OpsSet.TFLITE_BUILTINS_INT8]
+  elif quantization is not None:
+    raise ValueError('unknown quantization %r, use None, float16 or int8' % (quantization,))
+
+  with open(output_file, 'wb') as opened_file:
+    opened_file.write(converter.convert())
+  return output_file
+
+def _exportOnnxModel(keras_model, output_file, opset=13):
+  """
+  _exportOnnxModel() : Export keras model into an ONNX file (optional package tf2onnx), batch dimension is kept dynamic
+
+                      ACCEPT keras model, output_file and opset as argument
+
+                      RETURN output_file
+  """
+  tf2onnx   = _importOptionalModule('tf2onnx', 'onnx')
+  tf        = _getTensorflow()
+  signature = [tf.TensorSpec((None,) + tuple(keras_model.input_shape[1:]), tf.float32, name='input')]
+  tf2onnx.convert.from_keras(keras_model, input_signature=signature, opset=opset, output_path=output_file)
+  return output_file
@@ -0,0 +1,276 @@
+"""
+
+DOCUMENTATION:
+
+batching is part of configuration layer. It provides a dynamic micro-batching scheduler for model inference.
+Preprocessed images coming from concurrent requests for the same model are collected for up to max wait time
+(or until max batch size is reached) and predicted with one batched forward pass, then each caller gets its own row.
+Each model has its own scheduler thread which stops by itself after a while without any request.
+
+"""
+# python package
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+import numpy as np
+
+# internal package
+from src.config import engine
+from src.config import metrics
+from src.config import registry
+
+# Initialize Global alias
+_predictData                    = engine._predictRow
+_predictBatchData               = engine._predictRows
+_getModelMetadata               = registry._getModelMetadata
+_observeHistogram               = metrics._observeHistogram
+
+# Initialize scheduler state
+_ENABLED                        = True
+_MAX_WAIT                       = 0.005 # seconds to wait for another request before running a batch
+_MAX_BATCH_SIZE                 = 16 # maximum number of images predicted by one forward pass
+_IDLE_TIMEOUT                   = 60 # seconds without request before scheduler thread of a model is stopped
+_BATCHERS                       = {} # id of model -> scheduler of the model
+_STATS                          = {} # model name -> batching statistic
+_BATCHING_LOCK                  = threading.Lock()
+
+def _setBatchingConfig(enabled=True, max_wait_ms=5, max_batch_size=16):
+  """
+  _setBatchingConfig() : Configure micro-batching scheduler. When it is disabled each request is predicted by itself.
+
+                      ACCEPT enabled, max_wait_ms (max wait time in milliseconds) and max_batch_size as argument
+
+                      RETURN dictionary of current configuration
+
+                      RETURN EXAMPLE :
+
+                                      * CONFIG : {'enabled': True, 'max_wait_ms': 5, 'max_batch_size': 16}
+  """
+  global _ENABLED, _MAX_WAIT, _MAX_BATCH_SIZE
+  _ENABLED        = bool(enabled)
+  _MAX_WAIT       = max(float(max_wait_ms), 0.0) / 1000
+  _MAX_BATCH_SIZE = max(int(max_batch_size), 1)
+  return {'enabled': _ENABLED, 'max_wait_ms': _MAX_WAIT * 1000, 'max_batch_size': _MAX_BATCH_SIZE}
+
+def _getModelName(model):
+  """
+  _getModelName() : Provide model name used as key of batching statistic, model name is taken from model registry
+
+                      ACCEPT loaded model as argument
+
+                      RETURN model name
+
+                      RETURN EXAMPLE :
+
+                                      * MODEL_NAME : 'BALANCE_model'
+  """
+  metadata = _getModelMetadata(model)
+  if metadata is not None:
+    return metadata['key'][1]
+  return getattr(model, 'name', str(id(model)))
+
+def _recordBatch(model_name, batch_size, queue_waits):
+  """
+  _recordBatch() : Record size and queue wait time of a predicted batch into batching statistic and service metrics
+
+                      ACCEPT model_name, batch_size (rows of the forward pass, a request may hold several rows) and queue_waits
+                      (list of queue wait of each request in seconds) as argument
+  """
+  with _BATCHING_LOCK:
+    stats = _STATS.setdefault(model_name, {'requests': 0, 'batches': 0, 'rows': 0, 'max_batch_size': 0, 'batch_sizes': {},
+                                           'queue_wait_total': 0.0, 'queue_wait_max': 0.0})
+    stats['requests']                 += len(queue_waits)
+    stats['batches']                  += 1
+    stats['rows']                     += batch_size
+    stats['max_batch_size']           = max(stats['max_batch_size'], batch_size)
+    stats['batch_sizes'][batch_size]  = stats['batch_sizes'].get(batch_size, 0) + 1
+    stats['queue_wait_total']         += sum(queue_waits)
+    stats['queue_wait_max']           = max([stats['queue_wait_max']] + queue_waits)
+
+  _observeHistogram('ml_inference_batch_size', batch_size, {'model': model_name})
+  for queue_wait in queue_waits:
+    _observeHistogram('ml_batch_queue_wait_seconds', queue_wait, {'model': model_name})
+
+def _runBatch(model, model_name, items):
+  """
+  _runBatch() : Predict collected requests with one forward pass and send each caller its own rows.
+                Requests are grouped by tensor shape, so a different shaped request never breaks the whole batch.
+
+                      ACCEPT model, model_name and items (list of tensor, future and enqueue time) as argument
+  """
+  groups = {}
+  for item in items:
+    groups.setdefault(item[0].shape[1:], []).append(item)
+
+  for group in groups.values():
+    started     = time.perf_counter()
+    queue_waits = [started - enqueued for _, _, enqueued in group]
+
+    try:
+      batch       = np.concatenate([tensor for tensor, _, _ in group], axis=0)
+      predictions = _predictBatchData(model, batch)
+    except Exception as error: # every caller of this group receives the error
+      for _, future, _ in group:
+        future.set_exception(error)
+      continue
+
+    offset = 0
+    for tensor, future, _ in group:
+      rows    = tensor.shape[0]
+      future.set_result(predictions[offset:offset + rows])
+      offset  += rows
+    _recordBatch(model_name, batch.shape[0], queue_waits)
+
+def _runScheduler(key, batcher):
+  """
+  _runScheduler() : Scheduler loop of a model. It waits for the first request, collects more requests until max wait time
+                    or max batch size is reached, and predicts them as one batch. The loop stops after idle timeout.
+
+                      ACCEPT key (id of model) and batcher dictionary as argument
+  """
+  request_queue = batcher['queue']
+  model         = batcher['model']
+  model_name    = _getModelName(model)
+
+  while True:
+    try:
+      first = request_queue.get(timeout=_IDLE_TIMEOUT)
+    except queue.Empty:
+      with _BATCHING_LOCK: # requests are only queued while holding the lock, so an empty queue here stays empty
+        if request_queue.empty():
+          if _BATCHERS.get(key) is batcher:
+            _BATCHERS.pop(key)
+          return
+      continue
+
+    items     = [first]
+    rows      = first[0].shape[0]
+    deadline  = first[2] + _MAX_WAIT
+
+    while rows < _MAX_BATCH_SIZE:
+      remaining = deadline - time.perf_counter()
+      try:
+        item = request_queue.get(timeout=remaining) if remaining > 0 else request_queue.get_nowait()
+      except queue.Empty:
+        break
+      items.append(item)
+      rows += item[0].shape[0]
+
+    _runBatch(model, model_name, items)
+
+def _submitBatch(model, tensor):
+  """
+  _submitBatch() : Queue preprocessed images into scheduler of the model.
+
+                      ACCEPT loaded model and tensor (numpy array with batch dimension) as argument
+
+                      RETURN future of prediction rows of the tensor
+  """
+  future = Future()
+  key    = id(model)
+
+  with _BATCHING_LOCK:
+    batcher = _BATCHERS.get(key)
+    if batcher is None or batcher['model'] is not model:
+      batcher           = {'model': model, 'queue': queue.Queue()}
+      batcher['thread'] = threading.Thread(target=_runScheduler, args=(key, batcher), daemon=True,
+                                           name='batcher-%s' % _getModelName(model))
+      _BATCHERS[key]    = batcher
+      batcher['thread'].start()
+    batcher['queue'].put((tensor, future, time.perf_counter()))
+
+  return future
+
+def _predictBatched(model, tensor):
+  """
+  _predictBatched() : Provide prediction result of a preprocessed image. When micro-batching is enabled the image is predicted
+                      together with images of concurrent requests for the same model, else it is predicted by itself.
+                      It has the same result as engine._predictRow.
+
+                      ACCEPT loaded model and tensor (numpy array with batch dimension) as argument
+
+                      RETURN prediction result of the first image of the tensor
+
+                      RETURN EXAMPLE :
+
+                                      * PREDICTION : [0.00003, 0.99987, 0.0001]
+  """
+  if not _ENABLED:
+    return _predictData(model, tensor)
+
+  predictions = _submitBatch(model, tensor).result()
+  return predictions[0]
+
+def _predictBatchedRows(model, tensor):
+  """
+  _predictBatchedRows() : Provide prediction result of every image of a preprocessed batch. When micro-batching is enabled the batch
+                          is queued into scheduler of the model (and may share its forward pass with concurrent requests),
+                          else it is predicted by itself. It has the same result as engine._predictRows.
+
+                      ACCEPT loaded model and tensor (numpy array with batch dimension) as argument
+
+                      RETURN prediction result of each image of the tensor
+
+                      RETURN EXAMPLE :
+
+                                      * PREDICTIONS : [[0.00003, 0.99987, 0.0001], [0.98, 0.01, 0.01]]
+  """
+  if not _ENABLED:
+    return _predictBatchData(model, tensor)
+
+  predictions = _submitBatch(model, tensor).result()
+  return predictions
+
+def _getQueueDepth():
+  """
+  _getQueueDepth() : Provide number of requests waiting in the queue of each running scheduler
+
+                      RETURN dictionary of model name and queued requests
+
+                      RETURN EXAMPLE :
+
+                                      * QUEUE_DEPTH : {'BALANCE_model': 3, 'VGG_model': 0}
+  """
+  with _BATCHING_LOCK:
+    batchers = list(_BATCHERS.values())
+  depth = {}
+  for batcher in batchers:
+    model_name        = _getModelName(batcher['model'])
+    depth[model_name] = depth.get(model_name, 0) + batcher['queue'].qsize()
+  return depth
+
+def _getBatchingStats():
+  """
+  _getBatchingStats() : Provide batching configuration and statistic (batch size and queue wait) of each model
+
+                      RETURN dictionary of batching statistic
+
+                      RETURN EXAMPLE :
+
+                                      * STATS : {
+                                                  'enabled': True, 'max_wait_ms': 5.0, 'max_batch_size': 16, 'active_schedulers': 1,
+                                                  'models': {'BALANCE_model': {'requests': 9, 'batches': 5, 'rows': 12, 'max_batch_size': 4,
+                                                                               'mean_batch_size': 2.4, 'batch_sizes': {1: 2, 2: 1, 4: 2},
+                                                                               'mean_queue_wait_ms': 2.1, 'max_queue_wait_ms': 5.2}}
+                                                }
+  """
+  with _BATCHING_LOCK:
+    models = {}
+    for model_name, stats in _STATS.items():
+      models[model_name] = {
+        'requests'           : stats['requests'],
+        'batches'            : stats['batches'],
+        'rows'               : stats['rows'],
+        'max_batch_size'     : stats['max_batch_size'],
+        'mean_batch_size'    : round(stats['rows'] / stats['batches'], 2),
+        'batch_sizes'        : dict(stats['batch_sizes']),
+        'mean_queue_wait_ms' : round(stats['queue_wait_total'] / stats['requests'] * 1000, 3),
+        'max_queue_wait_ms'  : round(stats['queue_wait_max'] * 1000, 3),
+      }
+    active = len(_BATCHERS)
+
+  info = {'enabled': _ENABLED, 'max_wait_ms': _MAX_WAIT * 1000, 'max_batch_size': _MAX_BATCH_SIZE,
+          'active_schedulers': active, 'models': models}
+  return info
@@ -0,0 +1,173 @@
+"""
+
+DOCUMENTATION:
+
+buffers is part of configuration layer. It provides a pool of preallocated arrays used by fused image preprocessing.
+Image tensors are resized and normalized straight into pooled buffers keyed by (shape, dtype) such (batch size, H, W, C),
+instead of allocating a new array at every preprocessing step. Buffers are only pooled inside a buffer scope: every buffer
+taken inside the scope is returned into the pool when the scope exits, so a request (or a job batch) wraps preprocessing
+and prediction with one scope. Scratch buffers (intermediate uint8 images of resize and color conversion) are dead as soon as
+the tensor is written, so one scratch buffer of each shape is reused by every image preprocessed inside the scope.
+Outside of any scope (such tensors kept by query image gallery) plain arrays are allocated.
+
+"""
+# python package
+import contextlib
+import contextvars
+import threading
+
+import numpy as np
+
+# Initialize buffer pool state
+_ENABLED                        = True
+_MAX_POOLED                     = 8 # free buffers kept for each (shape, dtype)
+_MAX_POOL_BYTES                 = 256 * 1024 * 1024 # total size of free buffers kept by the pool
+_POOLED_BYTES                   = {'size': 0}
+_POOL                           = {} # (shape, dtype) -> list of free buffer
+_STATS                          = {'reused': 0, 'allocated': 0, 'unpooled': 0, 'released': 0, 'dropped': 0}
+_SCOPE                          = contextvars.ContextVar('buffer_scope', default=None) # {'leased': buffers taken by current scope, 'scratch': key -> scratch buffer}
+_BUFFERS_LOCK                   = threading.Lock()
+
+def _setBufferPool(enabled=True, max_pooled=8, max_pool_megabytes=256):
+  """
+  _setBufferPool() : Configure buffer pool. When it is disabled every buffer is a new array.
+
+                      ACCEPT enabled, max_pooled (free buffers kept for each shape) and max_pool_megabytes (total size of free buffers) as argument
+
+                      RETURN dictionary of current configuration
+
+                      RETURN EXAMPLE :
+
+                                      * CONFIG : {'enabled': True, 'max_pooled': 8, 'max_pool_megabytes': 256}
+  """
+  global _ENABLED, _MAX_POOLED, _MAX_POOL_BYTES
+  with _BUFFERS_LOCK:
+    _ENABLED        = bool(enabled)
+    _MAX_POOLED     = max(int(max_pooled), 0)
+    _MAX_POOL_BYTES = max(int(max_pool_megabytes * 1024 * 1024), 0)
+    _POOL.clear() # free buffers are pooled again under the new limits
+    _POOLED_BYTES['size'] = 0
+  return {'enabled': _ENABLED, 'max_pooled': _MAX_POOLED, 'max_pool_megabytes': _MAX_POOL_BYTES / 1024 / 1024}
+
+def _allocateBuffer(shape, dtype=np.float32):
+  """
+  _allocateBuffer() : Provide an uninitialized array of shape and dtype. Inside a buffer scope the array is taken from the pool
+                      (and returned into the pool when the scope exits), outside of any scope a new array is allocated.
+
+                      ACCEPT shape and dtype as argument
+
+                      RETURN numpy array
+
+                      RETURN EXAMPLE :
+
+                                      * BUFFER : <type:ndarray shape (1, 224, 224, 3) dtype float32>
+  """
+  scope = _SCOPE.get()
+  key   = (tuple(shape), np.dtype(dtype).str)
+
+  if scope is None or not _ENABLED:
+    with _BUFFERS_LOCK:
+      _STATS['unpooled'] += 1
+    return np.empty(shape, dtype)
+
+  with _BUFFERS_LOCK:
+    free   = _POOL.get(key)
+    buffer = free.pop() if free else None
+    _STATS['reused' if buffer is not None else 'allocated'] += 1
+    if buffer is not None:
+      _POOLED_BYTES['size'] -= buffer.nbytes
+  if buffer is None:
+    buffer = np.empty(shape, dtype)
+
+  scope['leased'].append((key, buffer))
+  return buffer
+
+def _allocateScratchBuffer(shape, dtype=np.uint8, name='scratch'):
+  """
+  _allocateScratchBuffer() : Provide an uninitialized scratch array of shape and dtype, for an intermediate result which is not used
+                      after the next preprocessing step. Inside a buffer scope the same scratch array is given for every call with the same shape and name
+                      (use another name for two scratch arrays which are used at the same time).
+
+                      ACCEPT shape, dtype and name as argument
+
+                      RETURN numpy array
+
+                      RETURN EXAMPLE :
+
+                                      * BUFFER : <type:ndarray shape (224, 224, 3) dtype uint8>
+  """
+  scope = _SCOPE.get()
+  if scope is None or not _ENABLED:
+    return _allocateBuffer(shape, dtype)
+
+  key     = (name, tuple(shape), np.dtype(dtype).str)
+  scratch = scope['scratch'].get(key)
+  if scratch is None:
+    scratch = scope['scratch'][key] = _allocateBuffer(shape, dtype)
+  return scratch
+
+def _releaseBuffers(leased):
+  """
+  _releaseBuffers() : Return buffers into the pool, buffers above max pooled of their shape or above max pool size are dropped
+
+                      ACCEPT leased (list of (key, buffer)) as argument
+  """
+  with _BUFFERS_LOCK:
+    for key, buffer in leased:
+      free = _POOL.setdefault(key, [])
+      if len(free) < _MAX_POOLED and _POOLED_BYTES['size'] + buffer.nbytes <= _MAX_POOL_BYTES:
+        free.append(buffer)
+        _POOLED_BYTES['size'] += buffer.nbytes
+        _STATS['released'] += 1
+      else:
+        _STATS['dropped'] += 1
+
+@contextlib.contextmanager
+def _bufferScope():
+  """
+  _bufferScope() : Context manager of a buffer scope. Buffers taken inside the scope are pooled and returned into the pool when the scope exits,
+                   so arrays built inside the scope must not be kept after it (copy them when they need to be kept).
+                   A nested scope is part of its outer scope.
+  """
+  if _SCOPE.get() is not None:
+    yield
+    return
+
+  scope = {'leased': [], 'scratch': {}}
+  token = _SCOPE.set(scope)
+  try:
+    yield
+  finally:
+    _SCOPE.reset(token)
+    _releaseBuffers(scope['leased'])
+
+@contextlib.contextmanager
+def _unpooledScope():
+  """
+  _unpooledScope() : Context manager which suspends current buffer scope, arrays built inside it are plain arrays which can be kept
+                     (such tensors kept by query image gallery)
+  """
+  token = _SCOPE.set(None)
+  try:
+    yield
+  finally:
+    _SCOPE.reset(token)
+
+def _getBufferPoolInfo():
+  """
+  _getBufferPoolInfo() : Provide configuration, statistic and pooled buffers of buffer pool
+
+                      RETURN dictionary of buffer pool information
+
+                      RETURN EXAMPLE :
+
+                                      * INFO : {'enabled': True, 'max_pooled': 8, 'max_pool_bytes': 268435456, 'reused': 120, 'allocated': 3, 'unpooled': 20,
+                                                'released': 123, 'dropped': 0, 'pooled_bytes': 1806336,
+                                                'buffers': {'(1, 224, 224, 3) <f4': 2, '(224, 224, 3) |u1': 1}}
+  """
+  with _BUFFERS_LOCK:
+    info = {'enabled': _ENABLED, 'max_pooled': _MAX_POOLED, 'max_pool_bytes': _MAX_POOL_BYTES}
+    info.update(_STATS)
+    info['pooled_bytes'] = _POOLED_BYTES['size']
+    info['buffers']      = {'%s %s' % key: len(free) for key, free in _POOL.items() if free}
+  return info
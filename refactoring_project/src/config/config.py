@@ -8,10 +8,16 @@ This layer would use any infrastructure layer function to build each configurati
 
 """
 # python package
-from keras.models import load_model
-from keras.models import model_from_json
+import threading
 
 # internal package
+from src.config import backends
+from src.config import buffers
+from src.config import engine
+from src.config import gallery
+from src.config import pool
+from src.config import registry
+from src.config import timing
 from src.infra import infra
 
 # Initialize Global alias
@@ -20,14 +26,45 @@ _getSplitedStringByIndex        = infra._getSplitedStringByIndex
 _getElementByIndex              = infra._getElementByIndex
 _getFilesFromFolder             = infra._getFilesFromFolder
 _getFilePathAndName             = infra._getFilePathAndName
+_getFolderModifiedTime          = infra._getFolderModifiedTime
+_getFilesFingerprint            = infra._getFilesFingerprint
 _openImageFile                  = infra._openImageFile
+_bytesToImageFile               = infra._bytesToImageFile
 _imageToNumpyArray              = infra._imageToNumpyArray
 _renderRGBImage                 = infra._renderRGBImage
 _renderRGBtoGrayImage           = infra._renderRGBtoGrayImage
+_renderDecodedRGBtoGrayImage    = infra._renderDecodedRGBtoGrayImage
+_swapColorChannelsInto          = infra._swapColorChannelsInto
+_draftImage                     = infra._draftImage
+_renderImageMode                = infra._renderImageMode
 _resizeImageByModelInputShape   = infra._resizeImageByModelInputShape
+_resizeImage                    = infra._resizeImage
+_getImageSizeFromModel          = infra._getImageSizeFromModel
 _normalizeImage                 = infra._normalizeImage
 _reshapeGrayImage               = infra._reshapeGrayImage
 _expandRGBImageDimensions       = infra._expandRGBImageDimensions
+_stackImageTensors              = infra._stackImageTensors
+_resizeImageInto                = infra._resizeImageInto
+_normalizeImageInto             = infra._normalizeImageInto
+
+_acquireModel                   = registry._acquireModel
+_warmupEngine                   = engine._warmupEngine
+_finishEngineLoading            = engine._finishEngineLoading
+_loadBackendModel               = backends._loadBackendModel
+_isPoolRunning                  = pool._isPoolRunning
+_loadPoolModel                  = pool._loadPoolModel
+_getModelMetadata               = registry._getModelMetadata
+_getGalleryTensor               = gallery._getGalleryTensor
+_isGallerySample                = gallery._isGallerySample
+_allocateBuffer                 = buffers._allocateBuffer
+_allocateScratchBuffer          = buffers._allocateScratchBuffer
+_stageTimer                     = timing._stageTimer
+
+# Initialize model catalog state
+_MODEL_CATALOG                  = {} # path of model directory -> catalog index
+_MODEL_CATALOG_LOCK             = threading.Lock()
+_REDUCED_DECODE                 = True # decode large JPEG at reduced resolution which is still larger than model input size
+_REDUCED_DECODE_MARGIN          = 2 # reduced image is kept at least this times larger than model input size, so resize result stays close
 
 def _buildDictModel(list_model) -> list:
   """
@@ -65,16 +102,16 @@ def _buildDictModel(list_model) -> list:
 
   return keys, values
 
-def _buildListModel(path):
+def _buildListModel(path, files_in_folder=None):
   """
   _buildListModel() : Provide a collection of model and weight path
                       This function will help to build Model dictionary by providing a collection model and weight path
-                      either json model or hdf5 model. This function will scan all model by pattern name such (model.json, 
-                      weights.h5, weights.hdf5, model.h5, and model.hdf5) UPDATED SOON
+                      either json model, hdf5 model or exported model. This function will scan all model by pattern name such (model.json, 
+                      weights.h5, weights.hdf5, model.h5, model.hdf5, model.tflite and model.onnx)
 
-                      ACCEPT path of model directory as argument
+                      ACCEPT path of model directory and files_in_folder (optional, list of file name already scanned from path) as argument
                       
-                      RETURN json_model and hdf5_model which is containing each model path
+                      RETURN json_model, hdf5_model and exported_model (tflite and onnx) which is containing each model path
 
                       RETURN EXAMPLE : 
                                  * JSON_MODEL : [ ['static/model/BALANCE_model.json', 'static/model/BALANCE_weight.h5'],
@@ -82,12 +119,16 @@ def _buildListModel(path):
                                                 ]
 
                                  * HDF5_MODEL : ['static/model/BALANCE_model.h5', 'static/model/SPLIT_AUGMENTATION_model.h5']
+
+                                 * EXPORTED_MODEL : ['static/model/BALANCE_tflite_model.tflite', 'static/model/BALANCE_onnx_model.onnx']
   """
   json_arch       = []
   json_weight     = []
   hdf5_model      = []
+  exported_model  = []
   json_model      = []
-  files_in_folder = _getFilesFromFolder(path) # scan all model in path directory
+  if files_in_folder is None:
+    files_in_folder = _getFilesFromFolder(path) # scan all model in path directory
 
   for data in files_in_folder: # iterate files_in_folder to extract model and weight information
 
@@ -103,10 +144,61 @@ def _buildListModel(path):
       file_name_and_path = _getFilePathAndName(path, data)
       _appendListElement(hdf5_model, file_name_and_path)
 
+    elif "model.tflite" in data or "model.onnx" in data: # get exported model by partter name <model.tflite or model.onnx>
+      file_name_and_path = _getFilePathAndName(path, data)
+      _appendListElement(exported_model, file_name_and_path)
+
   if json_arch and json_weight: # build json model collection (it would return list of json model and realted weight)
     json_model = _getJsonModel(json_arch, json_weight)
   
-  return json_model, hdf5_model
+  return json_model, hdf5_model, exported_model
+
+def _buildCatalog(path, files_in_folder):
+  """
+  _buildCatalog() : Provide a catalog index of model directory. Json models (include json model and weight), hdf5 models and exported models
+                    (tflite and onnx) are merged into one index, when json model and hdf5 model have the same name the hdf5 model is used.
+                    Model names are sorted, so the order of models in UI is stable.
+
+                      ACCEPT path of model directory and files_in_folder (list of file name in path) as argument
+                      
+                      RETURN catalog index dictionary
+
+                      RETURN EXAMPLE :
+                      
+                                      * CATALOG : {
+                                                    'files' : frozenset({'BALANCE_model.h5', 'VGG19_model.json', 'VGG19_weights.h5'}),
+                                                    'dicts' : {'BALANCE_model': 'static/model/BALANCE_model.h5', 
+                                                               'VGG19_model': ['static/model/VGG19_model.json', 'static/model/VGG19_weights.h5']},
+                                                    'keys'  : ['BALANCE_model', 'VGG19_model'],
+                                                    'values': ['static/model/BALANCE_model.h5', 
+                                                               ['static/model/VGG19_model.json', 'static/model/VGG19_weights.h5']]
+                                                  }
+  """
+  dicts         = {}
+  json_keys     = []
+  json_values   = []
+  hdf5_keys     = []
+  hdf5_values   = []
+  export_keys   = []
+  export_values = []
+  json_model, hdf5_model, exported_model = _buildListModel(path, list(files_in_folder))
+
+  if json_model:
+    json_keys, json_values = _buildDictModel(json_model)
+
+  if hdf5_model:
+    hdf5_keys, hdf5_values = _buildDictModel(hdf5_model)
+
+  if exported_model:
+    export_keys, export_values = _buildDictModel(exported_model)
+
+  for key, value in zip(json_keys + hdf5_keys + export_keys, json_values + hdf5_values + export_values):
+    dicts[key]  = value
+
+  keys          = sorted(dicts)
+  values        = [dicts[key] for key in keys]
+  catalog       = {'files': frozenset(files_in_folder), 'dicts': dicts, 'keys': keys, 'values': values}
+  return catalog
 
 def _getDictModel(path):
   """
@@ -114,6 +206,10 @@ def _getDictModel(path):
                       This function will help to generate model information for service and application layer. 
                       This function used _buildListModel and _buildDictModel as helper. For detail please see the documentation of each fuction.
 
+                      The model directory is only scanned again when its modified time is changed, and the catalog index is only rebuilt
+                      when the collection of files in the directory is changed. Returned collections are shared, treat them as read only.
+                      A missing model directory is an empty catalog.
+
                       ACCEPT path of model directory as argument
                       
                       RETURN  dicts, keys and values which is containing model information such path and model name.
@@ -132,26 +228,80 @@ def _getDictModel(path):
                                                   'static/model/IMBALANCE_model.h5', 
                                                   'static/model/SPLIT_AUGMENTATION_model.h5']
   """
-  dicts        = {}
-  keys         = []
-  values       = []
-  json_model, hdf5_model = _buildListModel(path)
-  
-  if json_model:  
-    keys, values = _buildDictModel(json_model)
+  try:
+    signature = _getFolderModifiedTime(path)
+  except FileNotFoundError: # model directory is not created yet (it is not part of the repository), the catalog is empty
+    return {}, [], []
 
-  if hdf5_model:
-    keys, values = _buildDictModel(hdf5_model)
-    
-  for i in range(len(keys)):
-    data        = _getElementByIndex(keys, i)
-    dicts[data] = values[i]
-    
-  return dicts, keys, values
+  with _MODEL_CATALOG_LOCK:
+    catalog = _MODEL_CATALOG.get(path)
+
+    if catalog is None or catalog['signature'] != signature: # directory changed, compare file set before rebuilding the index
+      files_in_folder = frozenset(_getFilesFromFolder(path))
+
+      if catalog is None or catalog['files'] != files_in_folder:
+        catalog = _buildCatalog(path, files_in_folder)
+
+      catalog['signature']  = signature
+      _MODEL_CATALOG[path]  = catalog
+
+  return catalog['dicts'], catalog['keys'], catalog['values']
+
+def _loadModelFromFile(model_and_weight):
+  """
+  _loadModelFromFile() : This config function used to deserialize a model from disk by the backend of its file, keras (json model include json model
+                         and h5 weight, or h5 model), tflite or onnx model (see backends). It is used as loader by model registry, so each model file
+                         only read once by each worker.
+
+                      ACCEPT model_and_weight (list of json model and weight path or model file path) as argument
+                      
+                      RETURN loaded model  <keras.engine.sequential.Sequential object at 0x000002C8C8AB8550>
+  """
+  loaded_model = _loadBackendModel(model_and_weight)
+  return loaded_model
+
+def _getRegistryModel(model, path, model_and_weight):
+  """
+  _getRegistryModel() : Provide loaded model from model registry. Model would be loaded from disk only when it is not in the registry yet
+                        or its files are changed since it was loaded. A newly loaded model is warmed up by inference engine before it is kept by the registry,
+                        so concurrent requests for the model wait for the warm-up instead of tracing it again.
+                        When inference pool is running the model is loaded by pool processes and the registry keeps its pool model (see pool).
+
+                      ACCEPT model name, path of model directory and model_and_weight path as argument
+                      
+                      RETURN keras sequential model  <keras.engine.sequential.Sequential object at 0x000002C8C8AB8550>
+  """
+  fingerprint  = _getFilesFingerprint(model_and_weight if type(model_and_weight) == list else [model_and_weight])
+  if _isPoolRunning():
+    loaded_model = _acquireModel((path, model), lambda: _loadPoolModel((path, model), model_and_weight, fingerprint), fingerprint)
+  else:
+    loaded_model = _acquireModel((path, model), lambda: _warmupEngine(_loadModelFromFile(model_and_weight)), fingerprint)
+  return _finishEngineLoading(loaded_model)
+
+def _getModelFingerprint(model, path):
+  """
+  _getModelFingerprint() : Provide fingerprint of model files (json model and weight or h5 model), it is changed whenever one of the files is changed
+
+                      ACCEPT model name and path of model directory as argument
+                      
+                      RETURN fingerprint or None when model does not exist in model directory
+
+                      RETURN EXAMPLE :
+                      
+                                      * FINGERPRINT : '3f2a9c1d7b4e8f60'
+  """
+  model_dict, _, _ = _getDictModel(path)
+  if model not in model_dict:
+    return None
+
+  model_and_weight = _getElementByIndex(model_dict, model)
+  fingerprint      = _getFilesFingerprint(model_and_weight if type(model_and_weight) == list else [model_and_weight])
+  return fingerprint
 
 def _loadSelectModel(model, path):
   """
   _loadSelectModel() : This config function used to load selected model. It would help to load model into keras sequential model either json or h5 model.
+                       Loaded model is kept by model registry, so the next request would reuse the same model without reading it from disk.
 
                       ACCEPT selected model and path of model directory as argument
                       
@@ -162,23 +312,8 @@ def _loadSelectModel(model, path):
                                       * LOADED_MODEL :  <keras.engine.sequential.Sequential object at 0x000002C8C8AB8550>
   """
   model_dict, _, _ = _getDictModel(path)
-
-  for data in model_dict:
-    
-    if data == model:
-      model_and_weight  = _getElementByIndex(model_dict, data)
-
-      if type(model_and_weight) == list and model_and_weight: # handle json model and weight
-        model_name        = _getElementByIndex(model_and_weight, 0) # get json model name 
-        weight_name       = _getElementByIndex(model_and_weight, 1) # get model weight
-        json_file         = open(model_name, 'r') # open json model
-        loaded_model_json = json_file.read() # read json model
-        json_file.close()
-        loaded_model      = model_from_json(loaded_model_json) # load json model
-        loaded_model.load_weights(weight_name) # load weight
-
-      else: # handle h5 or hdf5 model
-        loaded_model      = load_model(model_and_weight)
+  model_and_weight = _getElementByIndex(model_dict, model) # lookup model by name from catalog index
+  loaded_model     = _getRegistryModel(model, path, model_and_weight)
  
   return loaded_model
     
@@ -186,6 +321,7 @@ def _loadCompareModel(list_model, path):
   """
   _loadCompareModel() : This config function used to load selected models. It would help to load all selected model into keras sequential model either json or h5 model.
                         This function will provide a collection of keras sequential model that can be use for service layer.
+                        Loaded models are kept by model registry, so the next request would reuse the same models without reading them from disk.
 
                       ACCEPT selected list_model and path of model directory as argument
                       
@@ -201,26 +337,35 @@ def _loadCompareModel(list_model, path):
   list_ofModel = []
 
   for data in list_model:
-    model_and_weight  = _getElementByIndex(model_dict, data)
 
     if data in model_dict:
-
-      if type(model_and_weight) == list and model_and_weight: # handle json model and weight
-        model_name        = _getElementByIndex(model_and_weight, 0) # get json model name 
-        weight_name       = _getElementByIndex(model_and_weight, 1) # get model weight
-        json_file         = open(model_name, 'r') # open json model
-        loaded_model_json = json_file.read() # read json model
-        json_file.close()
-        loaded_model      = model_from_json(loaded_model_json) # load json model
-        loaded_model.load_weights(weight_name) # load weight
-        _appendListElement(list_ofModel, loaded_model) # append loaded model with weight into list_OfModel
-
-      else: # handle h5 or hdf5 model
-        loaded_model = load_model(model_and_weight) # load h5 or hdf5 model
-        _appendListElement(list_ofModel, loaded_model) # append model into list_OfModel
+      model_and_weight  = _getElementByIndex(model_dict, data)
+      loaded_model      = _getRegistryModel(data, path, model_and_weight)
+      _appendListElement(list_ofModel, loaded_model) # append loaded model into list_OfModel
  
   return list_ofModel
 
+def _getModelImageSize(model):
+  """
+  _getModelImageSize() : Provide image size of model input shape. Image size is taken from model registry metadata
+                         and only calculated from model.layers when the model is not kept by the registry.
+
+                      ACCEPT keras sequential model as argument
+                      
+                      RETURN image size tuple
+
+                      RETURN EXAMPLE :
+                      
+                                      * IMAGE_SIZE :  (224, 224)
+  """
+  metadata = _getModelMetadata(model)
+
+  if metadata is not None:
+    return metadata['image_size']
+
+  _, image_size = _getImageSizeFromModel(model, 0, 1, 3)
+  return image_size
+
 def _getJsonModel(models, weights)-> list:
   """
   _getJsonModel() : Provide a collection of json model with each weight. It would be helpfull for build a collection of json model that
@@ -254,77 +399,180 @@ def _getJsonModel(models, weights)-> list:
 
   return json_model
 
-def _rgbImageProcessing(image_file, keras_model):
+def _setReducedDecode(enabled=True):
+  """
+  _setReducedDecode() : Enable or disable reduced resolution decoding of large JPEG images. When it is disabled every image is decoded at full resolution.
+
+                      ACCEPT enabled as argument
+                      
+                      RETURN enabled
+  """
+  global _REDUCED_DECODE
+  _REDUCED_DECODE = bool(enabled)
+  return _REDUCED_DECODE
+
+def _decodeRGBImage(image_file, image_size=None):
+  """
+  _decodeRGBImage() : Provide decoded RGB image of raw query image in RGB channel order (pillow order). Channels are swapped into BGR
+                      by the tensor builder after resize (see _rgbTensorFromArray), so the full resolution image is never converted or copied again.
+                      When image_size is given a large JPEG is decoded at reduced resolution (1/2, 1/4 or 1/8) which is still at least
+                      twice image_size, instead of decoding every pixel and throwing most of them away on resize.
+
+                      ACCEPT raw image file (image path, file object or image bytes) and image_size (largest size the image is resized into) as argument
+                      
+                      RETURN a numpy array of decoded image
+  """
+  with _stageTimer('decode'):
+    if isinstance(image_file, bytes):
+      image_file      = _bytesToImageFile(image_file) # uploaded image is decoded straight from memory
+    readImage         = _openImageFile(image_file) # open image file, only image header is read here
+    if _REDUCED_DECODE and image_size is not None:
+      draftSize       = (image_size[0] * _REDUCED_DECODE_MARGIN, image_size[1] * _REDUCED_DECODE_MARGIN)
+      readImage       = _draftImage(readImage, draftSize) # decode large JPEG at reduced resolution
+    readImage         = _renderImageMode(readImage, 'RGB') # grayscale, palette and RGBA image into RGB
+    imageNdarray      = _imageToNumpyArray(readImage) # decode image into numpy array
+
+  return imageNdarray
+
+def _decodeGrayImage(image_file, image_size=None):
+  """
+  _decodeGrayImage() : Provide decoded Grayscale image of raw query image (open image file and color conversion)
+
+                      ACCEPT raw image file and image_size (largest size the image is resized into) as argument
+                      
+                      RETURN a numpy array of decoded image
+  """
+  decodeImage         = _decodeRGBImage(image_file, image_size) # open image file at reduced resolution
+  with _stageTimer('preprocess'):
+    convertToGray     = _renderDecodedRGBtoGrayImage(decodeImage) # change image type from RGB into Grayscale
+
+  return convertToGray
+
+def _getTensorShape(image_size, mode='rgb'):
   """
-  _rgbImageProcessing() : Provide a RGB image preprocessing for raw query image based on model input volume information
+  _getTensorShape() : Provide shape of preprocessed image tensor for image_size, it follows the shape of the step by step preprocessing
+                      (cv2 resize into image_size and expand dimension for RGB image, reshape into image_size for Grayscale image)
 
-                      ACCEPT raw image file and keras sequential model as argument
+                      ACCEPT image_size and mode ('rgb' or 'gray') as argument
                       
-                      RETURN a numpy array of image which is ready to use for prediction
+                      RETURN tensor shape
 
                       RETURN EXAMPLE :
                       
-                                      * RESULTIMAGE :   [[[[0.00784314 0.00784314 0.00784314]
-                                                            [0.00784314 0.00784314 0.00784314]
-                                                            [0.00784314 0.00784314 0.00784314]
-                                                            ...
-                                                            [0.00392157 0.00392157 0.00392157]
-                                                            [0.00392157 0.00392157 0.00392157]
-                                                            [0.00392157 0.00392157 0.00392157]]
-
-                                                            ...
-
-                                                            [[0.02352941 0.02352941 0.02352941]
-                                                            [0.03529412 0.03529412 0.03529412]
-                                                            [0.03137255 0.03137255 0.03137255]
-                                                            ...
-                                                            [0.02745098 0.02745098 0.02745098]
-                                                            [0.02352941 0.02352941 0.02352941]
-                                                            [0.01960784 0.01960784 0.01960784]]]]
-  """
-  readImage           = _openImageFile(image_file) # open image file
-  imageNdarray        = _imageToNumpyArray(readImage) # transform image into numpy array
-  convertToRGB        = _renderRGBImage(imageNdarray) # change image type from BGR to RGB
-  resizeImage ,_ ,_   = _resizeImageByModelInputShape(convertToRGB, keras_model) # resize image based on model input shape
-  normalizeImage      = _normalizeImage(resizeImage) # normalize image
-  resultImage         = _expandRGBImageDimensions(normalizeImage, 0) # expanding image dimention for prediction
+                                      * TENSOR_SHAPE : (1, 224, 224, 3)
+  """
+  if mode == 'gray':
+    return (1, image_size[0], image_size[1], 1)
+  return (1, image_size[1], image_size[0], 3)
+
+def _rgbTensorFromArray(image_array, image_size, out=None):
+  """
+  _rgbTensorFromArray() : Provide a tensor of decoded RGB image (resize, color conversion and normalize) for image_size.
+                          Preprocessing is fused, image is resized and color converted in pooled uint8 buffers and normalized straight into out,
+                          so no intermediate array is allocated (see buffers). It gives the same result as the step by step
+                          preprocessing (resize, RGB to BGR, astype float32 / 255, expand dimension).
+
+                      ACCEPT decoded image array, image_size and out (optional float32 array of shape (1, H, W, 3), such a row of batch buffer) as argument
+                      
+                      RETURN a numpy array of image which is ready to use for prediction (see _batchImageProcessing)
+  """
+  with _stageTimer('preprocess'):
+    if out is None:
+      out             = _allocateBuffer(_getTensorShape(image_size, 'rgb'), 'float32') # pooled tensor inside a buffer scope
+    resizeBuffer      = _allocateScratchBuffer((image_size[1], image_size[0], 3), 'uint8', 'resize') # scratch buffers are reused by every image of the scope
+    swapBuffer        = _allocateScratchBuffer((image_size[1], image_size[0], 3), 'uint8', 'swap')
+    resizeImage       = _resizeImageInto(image_array, image_size, resizeBuffer) # resize image based on model input shape
+    convertToBGR      = _swapColorChannelsInto(resizeImage, swapBuffer) # change channel order on the small resized image, same result as before resize
+    _normalizeImageInto(convertToBGR, out[0]) # normalize image straight into tensor
+
+  return out
+
+def _grayTensorFromArray(image_array, image_size, out=None):
+  """
+  _grayTensorFromArray() : Provide a tensor of decoded Grayscale image (resize, normalize and reshape) for image_size.
+                          Preprocessing is fused like _rgbTensorFromArray and gives the same result as the step by step preprocessing.
+
+                      ACCEPT decoded image array, image_size and out (optional float32 array of shape (1, H, W, 1), such a row of batch buffer) as argument
+                      
+                      RETURN a numpy array of image which is ready to use for prediction (see _batchImageProcessing)
+  """
+  with _stageTimer('preprocess'):
+    if out is None:
+      out             = _allocateBuffer(_getTensorShape(image_size, 'gray'), 'float32') # pooled tensor inside a buffer scope
+    resizeBuffer      = _allocateScratchBuffer((image_size[1], image_size[0]), 'uint8', 'resize') # scratch buffer is reused by every image of the scope
+    resizeImage       = _resizeImageInto(image_array, image_size, resizeBuffer) # resize image based on model input shape
+    _normalizeImageInto(resizeImage, out.reshape(resizeImage.shape)) # normalize image straight into tensor, reshape of tensor is a view
+
+  return out
+
+def _buildRGBTensor(image_file, image_size):
+  """
+  _buildRGBTensor() : Provide a RGB image preprocessing (decode, color conversion, resize and normalize) for raw query image
+
+                      ACCEPT raw image file and image_size as argument
+                      
+                      RETURN a numpy array of image which is ready to use for prediction (see _batchImageProcessing)
+  """
+  decodeImage         = _decodeRGBImage(image_file, image_size) # open image file at reduced resolution
+  resultImage         = _rgbTensorFromArray(decodeImage, image_size) # resize, change image type from RGB to BGR and normalize image
 
   return resultImage
 
-def _grayImageProcessing(image_file, model):
+def _buildGrayTensor(image_file, image_size):
   """
-  _grayImageProcessing() : Provide a Grayscale image preprocessing for raw query image based on model input volume information
+  _buildGrayTensor() : Provide a Grayscale image preprocessing (decode, color conversion, resize and normalize) for raw query image
 
-                      ACCEPT raw image file and keras sequential model as argument
+                      ACCEPT raw image file and image_size as argument
                       
-                      RETURN a numpy array of image which is ready to use for prediction
+                      RETURN a numpy array of image which is ready to use for prediction (see _batchImageProcessing)
+  """
+  decodeImage         = _decodeGrayImage(image_file, image_size) # open image file and change image type into Grayscale
+  resultImage         = _grayTensorFromArray(decodeImage, image_size) # resize, normalize and reshape image
+
+  return resultImage
+
+# image decoder and tensor builder of each preprocessing mode
+_IMAGE_PROCESSING_MODE = {
+  'rgb'  : (_decodeRGBImage, _rgbTensorFromArray),
+  'gray' : (_decodeGrayImage, _grayTensorFromArray),
+}
+
+def _batchImageProcessing(list_image, list_model, mode='rgb'):
+  """
+  _batchImageProcessing() : Provide a batch tensor of several images for each model. Each image is decoded only once (large enough for the
+                            largest model input size), then it is resized and normalized straight into a row of one batch buffer for each distinct
+                            model input size, so models with the same input shape share the same batch. Tensor of a query image sample is copied
+                            from the gallery without decoding.
+
+                      ACCEPT list of raw image file, list of keras sequential model and mode ('rgb' or 'gray') as argument
+                      
+                      RETURN a collection of batch tensor, one for each model
 
                       RETURN EXAMPLE :
                       
-                                      * RESULTIMAGE :     [[[0.00784314]
-                                                            [0.00784314]
-                                                            [0.00784314]
-                                                            ...
-                                                            [0.00392157]
-                                                            [0.00392157]
-                                                            [0.00392157]]
-
-                                                            ...
-
-                                                            [[0.02352941]
-                                                            [0.03529412]
-                                                            [0.03137255]
-                                                            ...
-                                                            [0.02745098]
-                                                            [0.02352941]
-                                                            [0.01960784]]]
-  """
-  readImage                    = _openImageFile(image_file) # open image file
-  imageNdarray                 = _imageToNumpyArray(readImage) # transform image into numpy array
-  convertToRGB                 = _renderRGBImage(imageNdarray) # change image type from BGR to RGB
-  convertToGray                = _renderRGBtoGrayImage(convertToRGB) # change image type from RGB into Grayscale
-  resizeImage ,_ ,image_size   = _resizeImageByModelInputShape(convertToGray, model) # resize image based on model input shape
-  normalizeImage               = _normalizeImage(resizeImage) # normalize image
-  resultImage                  = _reshapeGrayImage(normalizeImage, image_size) # expanding image dimention for prediction
-
-  return resultImage
\ No newline at end of file
+                                      * LIST_OFBATCH : [<type:ndarray shape (8, 224, 224, 3)>, <type:ndarray shape (8, 224, 224, 3)>,
+                                                        <type:ndarray shape (8, 150, 150, 3)>]
+  """
+  decoder, tensorBuilder = _IMAGE_PROCESSING_MODE[mode]
+  imageSizes             = [_getModelImageSize(model) for model in list_model]
+  decodeSize             = (max(size[0] for size in imageSizes), max(size[1] for size in imageSizes)) if imageSizes else None
+  batches                = {}
+
+  for imageSize in imageSizes:
+    if imageSize not in batches:
+      tensorShape        = _getTensorShape(imageSize, mode)
+      batches[imageSize] = _allocateBuffer((len(list_image),) + tensorShape[1:], 'float32') # one pooled batch buffer for each input size
+
+  for index, image_file in enumerate(list_image):
+    decodeImage = None
+    for imageSize, batch in batches.items():
+      row = batch[index:index + 1]
+      if _isGallerySample(image_file):
+        row[...] = _getGalleryTensor(image_file, imageSize, mode, lambda: tensorBuilder(decoder(image_file, imageSize), imageSize))
+        continue
+      if decodeImage is None:
+        decodeImage = decoder(image_file, decodeSize) # decode image only once
+      tensorBuilder(decodeImage, imageSize, row) # resize and normalize straight into the batch row
+
+  list_ofBatch  = [batches[imageSize] for imageSize in imageSizes]
+  return list_ofBatch
@@ -0,0 +1,345 @@
+"""
+
+DOCUMENTATION:
+
+engine is part of configuration layer. It provides the inference engine used to predict preprocessed images.
+keras model.predict() builds a data adapter, callbacks and a progress bar on every call, which costs much more than
+the forward pass itself for one image (or a small batch). The compiled engine wraps each loaded model into graph functions
+with a fixed input signature for each batch size bucket (1, 2, 4, 8, ...): a batch is padded up to its bucket (and split
+by the largest bucket), so every call reuses an already traced function and never retraces. Buckets are traced and run
+once (warm-up) when the model is loaded, so the first request does not pay for tracing.
+The 'predict' mode keeps the old model.predict() path, it can be selected to compare both paths.
+Only keras models are compiled, TFLite and ONNX models (see backends) are predicted by their own runtime.
+
+"""
+# python package
+import atexit
+import threading
+import time
+
+import numpy as np
+
+# internal package
+from src.config import backends
+from src.config import imports
+from src.config import registry
+from src.infra import infra
+
+# Initialize Global alias
+_predictData                    = infra._predictData
+_predictBatchData               = infra._predictBatchData
+_getModelMetadata               = registry._getModelMetadata
+_getTensorflow                  = imports._getTensorflow
+_getBackendName                 = backends._getBackendName
+
+# Initialize inference engine state
+_MODES                          = ('compiled', 'predict')
+_MODE                           = 'compiled'
+_BUCKETS                        = (1, 2, 4, 8, 16, 32, 64) # batch sizes of traced functions
+_WARMUP_BATCH                   = 16 # buckets up to this batch size are traced and run when a model is loaded
+_ENGINES                        = {} # id of model -> compiled engine of the model
+_ENGINE_LOCK                    = threading.Lock()
+atexit.register(_ENGINES.clear) # traced functions are released before interpreter shutdown tears tensorflow down
+
+def _setInferenceEngine(mode='compiled', buckets=(1, 2, 4, 8, 16, 32, 64), warmup_batch=16):
+  """
+  _setInferenceEngine() : Configure inference engine. Use mode 'compiled' for compiled graph functions or 'predict' for keras model.predict().
+                          Compiled engines of loaded models are built again with the new buckets.
+
+                      ACCEPT mode, buckets (batch sizes of traced functions) and warmup_batch (largest bucket traced when a model is loaded) as argument
+
+                      RETURN dictionary of current configuration
+
+                      RETURN EXAMPLE :
+
+                                      * CONFIG : {'mode': 'compiled', 'buckets': [1, 2, 4, 8, 16, 32, 64], 'warmup_batch': 16}
+  """
+  global _MODE, _BUCKETS, _WARMUP_BATCH
+  if mode not in _MODES:
+    raise ValueError('unknown inference engine mode %r, use one of %s' % (mode, ', '.join(_MODES)))
+
+  with _ENGINE_LOCK:
+    _MODE         = mode
+    _BUCKETS      = tuple(sorted(set(max(int(bucket), 1) for bucket in buckets))) or (1,)
+    _WARMUP_BATCH = max(int(warmup_batch), 0)
+    _ENGINES.clear()
+  return {'mode': _MODE, 'buckets': list(_BUCKETS), 'warmup_batch': _WARMUP_BATCH}
+
+def _getBucket(rows):
+  """
+  _getBucket() : Provide the smallest bucket which can hold rows, or the largest bucket when rows is bigger than every bucket
+
+                      ACCEPT number of rows as argument
+
+                      RETURN bucket size
+
+                      RETURN EXAMPLE :
+
+                                      * BUCKET : 4 (for 3 rows)
+  """
+  for bucket in _BUCKETS:
+    if bucket >= rows:
+      return bucket
+  return _BUCKETS[-1]
+
+def _buildEngine(model):
+  """
+  _buildEngine() : Provide a compiled engine of a loaded model. The model call is wrapped by one graph function,
+                   traced functions of each bucket are added on first use (or by warm-up).
+
+                      ACCEPT loaded model as argument
+
+                      RETURN engine dictionary
+
+                      RETURN EXAMPLE :
+
+                                      * ENGINE : {'model': <keras.engine.sequential.Sequential object at 0x000002C8C8AB8550>,
+                                                  'function': <tensorflow.python.eager.polymorphic_function.Function object at 0x7f...>,
+                                                  'input_shape': (224, 224, 3), 'traced': {1: <ConcreteFunction>}, 'calls': {1: 12},
+                                                  'rows': 12, 'padded_rows': 0, 'fallbacks': 0, 'warmup_time': 0.8123, 'loading': False,
+                                                  'lock': <unlocked _thread.lock>}
+  """
+  tf          = _getTensorflow() # tensorflow is already imported by the model, this only gets the module
+  input_shape = model.input_shape
+  engine = {
+    'model'       : model,
+    'function'    : tf.function(lambda batch: model(batch, training=False)),
+    'input_shape' : tuple(input_shape[1:]) if isinstance(input_shape, tuple) else None, # model with several inputs is not compiled
+    'traced'      : {},
+    'calls'       : {},
+    'rows'        : 0,
+    'padded_rows' : 0,
+    'fallbacks'   : 0,
+    'warmup_time' : 0.0,
+    'loading'     : False, # model is warmed up and not kept by model registry yet, its engine is not dropped
+    'lock'        : threading.Lock(),
+  }
+  return engine
+
+def _getEngine(model, loading=False):
+  """
+  _getEngine() : Provide compiled engine of a loaded model, the engine is built on the first call.
+                 Engines of models which are no longer kept by model registry are dropped here, except engines of models
+                 which are still loading (warmed up but not kept by the registry yet, see _finishEngineLoading).
+
+                      ACCEPT loaded model and loading (mark the engine as loading) as argument
+
+                      RETURN engine dictionary
+  """
+  key = id(model)
+  with _ENGINE_LOCK:
+    engine = _ENGINES.get(key)
+    if engine is not None and engine['model'] is model:
+      engine['loading'] = engine['loading'] or loading
+      return engine
+
+    for other_key, other in list(_ENGINES.items()):
+      if not other['loading'] and _getModelMetadata(other['model']) is None:
+        _ENGINES.pop(other_key)
+    engine            = _buildEngine(model)
+    engine['loading'] = loading
+    _ENGINES[key]     = engine
+  return engine
+
+def _finishEngineLoading(model):
+  """
+  _finishEngineLoading() : Mark compiled engine of a model as loaded once model registry keeps the model, from then its engine
+                           is dropped by _getEngine when the model is evicted. Model without engine is ignored.
+
+                      ACCEPT loaded model as argument
+
+                      RETURN loaded model
+  """
+  with _ENGINE_LOCK:
+    engine = _ENGINES.get(id(model))
+    if engine is not None and engine['model'] is model:
+      engine['loading'] = False
+  return model
+
+def _getTracedFunction(engine, bucket):
+  """
+  _getTracedFunction() : Provide graph function of the engine traced for a bucket, it is traced only once for each bucket
+
+                      ACCEPT engine and bucket as argument
+
+                      RETURN traced (concrete) function
+  """
+  traced = engine['traced'].get(bucket)
+  if traced is None:
+    with engine['lock']:
+      traced = engine['traced'].get(bucket)
+      if traced is None:
+        tf                        = _getTensorflow()
+        signature                 = tf.TensorSpec((bucket,) + engine['input_shape'], tf.float32)
+        traced                    = engine['function'].get_concrete_function(signature)
+        engine['traced'][bucket]  = traced
+  return traced
+
+def _padBatchRows(batch, bucket):
+  """
+  _padBatchRows() : Provide float32 batch of bucket rows, rows after the batch are filled by zero
+
+                      ACCEPT batch (numpy array with batch dimension) and bucket as argument
+
+                      RETURN padded numpy array
+  """
+  if batch.shape[0] == bucket and batch.dtype == np.float32:
+    return batch
+  padded                  = np.zeros((bucket,) + batch.shape[1:], np.float32)
+  padded[:batch.shape[0]] = batch
+  return padded
+
+def _runCompiled(engine, batch):
+  """
+  _runCompiled() : Predict a batch by traced functions of the engine. The batch is split by the largest bucket
+                   and each part is padded up to its bucket, so only traced functions are called.
+
+                      ACCEPT engine and batch (numpy array with batch dimension) as argument
+
+                      RETURN numpy array of prediction result of each image of the batch
+  """
+  outputs = []
+  step    = _BUCKETS[-1]
+  for start in range(0, batch.shape[0], step):
+    part    = batch[start:start + step]
+    rows    = part.shape[0]
+    bucket  = _getBucket(rows)
+    result  = _getTracedFunction(engine, bucket)(_padBatchRows(part, bucket))
+    outputs.append(result.numpy()[:rows])
+
+    with engine['lock']:
+      engine['calls'][bucket] = engine['calls'].get(bucket, 0) + 1
+      engine['rows']          += rows
+      engine['padded_rows']   += bucket - rows
+
+  return outputs[0] if len(outputs) == 1 else np.concatenate(outputs, axis=0)
+
+def _isCompatible(engine, batch):
+  """
+  _isCompatible() : Check whether a batch fits the input signature of the engine (unknown model dimensions accept any size)
+
+                      ACCEPT engine and batch as argument
+
+                      RETURN True or False
+  """
+  if engine['input_shape'] is None or batch.ndim != len(engine['input_shape']) + 1:
+    return False
+  return all(expected is None or expected == actual for expected, actual in zip(engine['input_shape'], batch.shape[1:]))
+
+def _warmupEngine(model):
+  """
+  _warmupEngine() : Trace and run every bucket up to warm-up batch size for a newly loaded model, so the first request
+                    does not pay for tracing. It is used right after a model is loaded by model registry, the engine stays
+                    loading until _finishEngineLoading is called after the registry keeps the model.
+
+                      ACCEPT loaded model as argument
+
+                      RETURN loaded model
+  """
+  if _MODE != 'compiled' or _getBackendName(model) != 'keras':
+    return model
+
+  engine = _getEngine(model, loading=True)
+  if engine['input_shape'] is None or None in engine['input_shape']: # input size is only known from the first request
+    return model
+
+  start = time.perf_counter()
+  try:
+    for bucket in _BUCKETS:
+      if bucket > _WARMUP_BATCH:
+        break
+      _getTracedFunction(engine, bucket)(np.zeros((bucket,) + engine['input_shape'], np.float32))
+  except Exception:
+    with _ENGINE_LOCK: # the model is never kept by the registry
+      _ENGINES.pop(id(model), None)
+    raise
+  finally:
+    engine['warmup_time'] = time.perf_counter() - start
+  return model
+
+def _predictRows(model, batch):
+  """
+  _predictRows() : Provide prediction result of every image of a preprocessed batch by current inference engine.
+                   A batch which does not fit the input signature of the model is predicted by model.predict(),
+                   and TFLite / ONNX models are always predicted by their own runtime.
+
+                      ACCEPT loaded model and batch (numpy array with batch dimension) as argument
+
+                      RETURN prediction result of each image of the batch
+
+                      RETURN EXAMPLE :
+
+                                      * PREDICTIONS : [[0.00003, 0.99987, 0.0001], [0.98, 0.01, 0.01]]
+  """
+  if _MODE == 'predict' or _getBackendName(model) != 'keras':
+    return _predictBatchData(model, batch)
+
+  engine = _getEngine(model)
+  if not _isCompatible(engine, batch):
+    with engine['lock']:
+      engine['fallbacks'] += 1
+    return _predictBatchData(model, batch)
+  return _runCompiled(engine, batch)
+
+def _predictRow(model, tensor):
+  """
+  _predictRow() : Provide prediction result of the first image of a preprocessed tensor by current inference engine.
+                  It has the same result as infra._predictData.
+
+                      ACCEPT loaded model and tensor (numpy array with batch dimension) as argument
+
+                      RETURN prediction result of the first image
+
+                      RETURN EXAMPLE :
+
+                                      * PREDICTION : [0.00003, 0.99987, 0.0001]
+  """
+  if _MODE == 'predict' or _getBackendName(model) != 'keras':
+    return _predictData(model, tensor)
+  return _predictRows(model, tensor[:1])[0]
+
+def _runDummyInference(model):
+  """
+  _runDummyInference() : Predict one zero filled image by current inference engine, so every lazy initialization
+                         of the model (and of TensorFlow) is done before the first request. Model with unknown input size is skipped.
+
+                      ACCEPT loaded model as argument
+
+                      RETURN prediction result of the dummy image or None when it is skipped
+  """
+  input_shape = model.input_shape
+  if not isinstance(input_shape, tuple) or None in input_shape[1:]:
+    return None
+  return _predictRows(model, np.zeros((1,) + tuple(input_shape[1:]), np.float32))[0]
+
+def _getEngineInfo():
+  """
+  _getEngineInfo() : Provide configuration of inference engine and statistic of each compiled model
+
+                      RETURN dictionary of inference engine information
+
+                      RETURN EXAMPLE :
+
+                                      * INFO : {'mode': 'compiled', 'buckets': [1, 2, 4, 8, 16, 32, 64], 'warmup_batch': 16,
+                                                'models': {'BALANCE_model': {'traced': [1, 2, 4, 8, 16], 'calls': {1: 12, 4: 2},
+                                                                             'rows': 19, 'padded_rows': 1, 'fallbacks': 0, 'warmup_time': 0.8123}}}
+  """
+  with _ENGINE_LOCK:
+    engines = list(_ENGINES.values())
+
+  models = {}
+  for engine in engines:
+    metadata = _getModelMetadata(engine['model'])
+    name     = metadata['key'][1] if metadata is not None else getattr(engine['model'], 'name', str(id(engine['model'])))
+    with engine['lock']:
+      models[name] = {
+        'traced'      : sorted(engine['traced']),
+        'calls'       : dict(sorted(engine['calls'].items())),
+        'rows'        : engine['rows'],
+        'padded_rows' : engine['padded_rows'],
+        'fallbacks'   : engine['fallbacks'],
+        'warmup_time' : round(engine['warmup_time'], 4),
+      }
+
+  info = {'mode': _MODE, 'buckets': list(_BUCKETS), 'warmup_batch': _WARMUP_BATCH, 'models': models}
+  return info
@@ -0,0 +1,271 @@
+"""
+
+DOCUMENTATION:
+
+gallery is part of configuration layer. It keeps an index of query image samples (static/queryImage/ folder) so the
+folder is not scanned again on every page render, and it keeps preprocessed tensor of each sample image keyed by
+(image, model image size, RGB/gray mode). Predicting a bundled sample image would skip image decoding and
+preprocessing entirely. Preprocessed tensors can also be persisted as .npy files and loaded back as memory-mapped
+arrays, so restarted workers start warm. A sample overwritten in place (same name) is detected by its own modified time,
+its old tensors are dropped, and persisted tensors of samples which no longer exist are removed when the gallery is indexed.
+
+"""
+# python package
+import hashlib
+import os
+import threading
+
+# internal package
+from src.config import buffers
+from src.infra import infra
+
+# Initialize Global alias
+_getFilesFromFolder             = infra._getFilesFromFolder
+_getFilePathAndName             = infra._getFilePathAndName
+_getFolderModifiedTime          = infra._getFolderModifiedTime
+_getFileModifiedTime            = infra._getFileModifiedTime
+_getSplitedStringByIndex        = infra._getSplitedStringByIndex
+_saveNumpyArray                 = infra._saveNumpyArray
+_loadNumpyArray                 = infra._loadNumpyArray
+_unpooledScope                  = buffers._unpooledScope
+
+# Initialize gallery state
+_GALLERY                        = {} # path of query image directory -> gallery index
+_SAMPLES                        = {} # normalized path of sample image -> sample modified time
+_TENSORS                        = {} # (sample path, modified time, image size, mode) -> preprocessed tensor
+_CACHE_PATH                     = None # directory of persisted tensors, None means tensors are only kept in memory
+_GALLERY_LOCK                   = threading.RLock()
+
+def _setGalleryCachePath(cache_path):
+  """
+  _setGalleryCachePath() : Set directory used to persist preprocessed tensors as .npy files. Use None to keep tensors in memory only.
+
+                      ACCEPT cache_path as argument
+
+                      RETURN cache_path
+  """
+  global _CACHE_PATH
+  if cache_path:
+    os.makedirs(cache_path, exist_ok=True)
+  _CACHE_PATH = cache_path
+  return _CACHE_PATH
+
+def _buildGalleryIndex(path, signature):
+  """
+  _buildGalleryIndex() : Provide gallery index of query image directory. Class name of each sample is taken from
+                         its file name pattern <ClassName_><currentImageName>.<currentImageExtention>
+
+                      ACCEPT path of query image directory and signature (directory modified time) as argument
+
+                      RETURN gallery index dictionary
+
+                      RETURN EXAMPLE :
+
+                                      * INDEX : {
+                                                  'signature': 1634567890123456789,
+                                                  'classes'  : ['Glioma', 'Meningioma'],
+                                                  'images'   : ['Glioma_1469.png', 'Meningioma_09965.png'],
+                                                  'queries'  : ['static/queryImage/Glioma_1469.png', 'static/queryImage/Meningioma_09965.png'],
+                                                  'modified' : {'static/queryImage/Glioma_1469.png': 1634567890123456789,
+                                                                'static/queryImage/Meningioma_09965.png': 1634567890123456789}
+                                                }
+  """
+  classes   = []
+  images    = []
+  queries   = []
+  modified  = {}
+
+  for data in sorted(_getFilesFromFolder(path)):
+    fullFilePath = _getFilePathAndName(path, data)
+    classes.append(_getSplitedStringByIndex(data, "_", 0))
+    images.append(data)
+    queries.append(fullFilePath)
+    modified[os.path.normpath(fullFilePath)] = _getFileModifiedTime(fullFilePath)
+
+  index = {'signature': signature, 'classes': classes, 'images': images, 'queries': queries, 'modified': modified}
+  return index
+
+def _getGalleryIndex(path):
+  """
+  _getGalleryIndex() : Provide gallery index of query image directory. The directory is only scanned again when
+                       its modified time is changed. Returned collections are shared, treat them as read only.
+
+                      ACCEPT path of query image directory as argument
+
+                      RETURN gallery index dictionary (see _buildGalleryIndex)
+  """
+  signature = _getFolderModifiedTime(path)
+
+  with _GALLERY_LOCK:
+    index = _GALLERY.get(path)
+
+    if index is None or index['signature'] != signature:
+      if index is not None: # forget samples of the old index, their tensors are no longer valid
+        for sample in index['modified']:
+          _SAMPLES.pop(sample, None)
+        for key in [key for key in _TENSORS if key[0] in index['modified']]:
+          _TENSORS.pop(key, None)
+
+      index           = _buildGalleryIndex(path, signature)
+      _GALLERY[path]  = index
+      _SAMPLES.update(index['modified'])
+      _removeStaleTensorFiles()
+
+  return index
+
+def _getSamplePrefix(sample, modified):
+  """
+  _getSamplePrefix() : Provide file name prefix of persisted tensors of a sample, a hash of sample path and its modified time
+
+                      ACCEPT normalized sample path and modified time as argument
+
+                      RETURN prefix
+
+                      RETURN EXAMPLE :
+
+                                      * PREFIX : '5f0b6b6c1f9e0f3f5b0d6c2b6a1d7e9c0e5f4a3b'
+  """
+  return hashlib.sha1(repr((sample, modified)).encode('utf-8')).hexdigest()
+
+def _getTensorCacheFile(key):
+  """
+  _getTensorCacheFile() : Provide .npy file path of persisted tensor, file name is the prefix of its sample (see _getSamplePrefix)
+                          and a hash of image size and mode
+
+                      ACCEPT tensor key as argument
+
+                      RETURN file path or None when cache path is not set
+
+                      RETURN EXAMPLE :
+
+                                      * CACHE_FILE : 'cache/gallery/5f0b6b6c1f9e0f3f5b0d6c2b6a1d7e9c0e5f4a3b_2d1f0e8c7b6a59483726150f1e2d3c4b5a697887.npy'
+  """
+  if not _CACHE_PATH:
+    return None
+  digest = hashlib.sha1(repr(key[2:]).encode('utf-8')).hexdigest()
+  return _getFilePathAndName(_CACHE_PATH, '%s_%s.npy' % (_getSamplePrefix(key[0], key[1]), digest))
+
+def _removeStaleTensorFiles():
+  """
+  _removeStaleTensorFiles() : Remove persisted tensors which do not belong to a sample of indexed galleries (sample removed,
+                              overwritten or persisted by an older version)
+
+                      RETURN list of removed file
+  """
+  if not _CACHE_PATH or not os.path.isdir(_CACHE_PATH):
+    return []
+  with _GALLERY_LOCK:
+    prefixes = {_getSamplePrefix(sample, modified) for sample, modified in _SAMPLES.items()}
+
+  removed = []
+  for file_name in os.listdir(_CACHE_PATH):
+    if not file_name.endswith('.npy') or file_name.split('_', 1)[0] in prefixes:
+      continue
+    try:
+      os.remove(os.path.join(_CACHE_PATH, file_name))
+      removed.append(os.path.join(_CACHE_PATH, file_name))
+    except FileNotFoundError: # removed by another worker
+      continue
+  return removed
+
+def _refreshSample(sample, modified):
+  """
+  _refreshSample() : Keep the new modified time of a sample overwritten in place, its old tensors are dropped from memory and
+                     from cache path
+
+                      ACCEPT normalized sample path and its new modified time as argument
+  """
+  with _GALLERY_LOCK:
+    outdated = _SAMPLES.get(sample)
+    if outdated is None or outdated == modified:
+      return
+    _SAMPLES[sample] = modified
+    for key in [key for key in _TENSORS if key[0] == sample]:
+      _TENSORS.pop(key, None)
+
+  if _CACHE_PATH and os.path.isdir(_CACHE_PATH):
+    prefix = _getSamplePrefix(sample, outdated) + '_'
+    for file_name in os.listdir(_CACHE_PATH):
+      if file_name.startswith(prefix):
+        try:
+          os.remove(os.path.join(_CACHE_PATH, file_name))
+        except FileNotFoundError: # removed by another worker
+          continue
+
+def _isGallerySample(image_file):
+  """
+  _isGallerySample() : Check whether image_file is a sample image of an indexed gallery (its tensors are kept by the gallery)
+
+                      ACCEPT image_file as argument
+
+                      RETURN True or False
+  """
+  if not isinstance(image_file, str):
+    return False
+  with _GALLERY_LOCK:
+    return os.path.normpath(image_file) in _SAMPLES
+
+def _getGalleryTensor(image_file, image_size, mode, builder):
+  """
+  _getGalleryTensor() : Provide preprocessed tensor of an image. When image_file is a sample of an indexed gallery, its tensor
+                        is taken from memory, then from persisted .npy file, and only built by builder() when both are missing.
+                        Modified time of the sample is checked on each call, a sample overwritten in place is built again.
+                        Any other image (uploaded file, unknown path) is always built by builder().
+                        Tensors taken from the gallery are read only arrays.
+
+                      ACCEPT image_file, image_size, mode ('rgb' or 'gray') and builder function as argument
+
+                      RETURN a numpy array of image which is ready to use for prediction
+  """
+  if not isinstance(image_file, str):
+    return builder()
+
+  sample = os.path.normpath(image_file)
+  with _GALLERY_LOCK:
+    indexed = _SAMPLES.get(sample)
+  if indexed is None:
+    return builder()
+  try:
+    modified = _getFileModifiedTime(sample)
+  except FileNotFoundError: # sample is removed, builder reports the missing file
+    return builder()
+  if modified != indexed:
+    _refreshSample(sample, modified)
+
+  key = (sample, modified, tuple(image_size), mode)
+  with _GALLERY_LOCK:
+    tensor = _TENSORS.get(key)
+  if tensor is not None:
+    return tensor
+
+  cache_file = _getTensorCacheFile(key)
+  if cache_file and os.path.exists(cache_file):
+    tensor = _loadNumpyArray(cache_file, mmap_mode='r')
+  else:
+    with _unpooledScope(): # tensor is kept by the gallery, it must not be a pooled buffer
+      tensor = builder()
+    if cache_file:
+      _saveNumpyArray(cache_file, tensor)
+
+  tensor.setflags(write=False)
+  with _GALLERY_LOCK:
+    _TENSORS[key] = tensor
+  return tensor
+
+def _getGalleryInfo():
+  """
+  _getGalleryInfo() : Provide summary of gallery (indexed directory, number of samples and number of kept tensors)
+
+                      RETURN dictionary of gallery information
+
+                      RETURN EXAMPLE :
+
+                                      * INFO : {'galleries': {'static/queryImage/': 20}, 'tensors': 40, 'cache_path': 'cache/gallery/'}
+  """
+  with _GALLERY_LOCK:
+    info = {
+      'galleries'  : {path: len(index['queries']) for path, index in _GALLERY.items()},
+      'tensors'    : len(_TENSORS),
+      'cache_path' : _CACHE_PATH,
+    }
+  return info
@@ -0,0 +1,82 @@
+"""
+
+DOCUMENTATION:
+
+imports is part of configuration layer. It defers heavy machine learning packages (TensorFlow and Keras) until they are
+really needed, which is the first model load or the first compiled inference. Pages which only list files and render
+templates (/compare, /select) are served right after start, and a worker which never loads a model never has TensorFlow
+in memory at all. Import time of each deferred package is measured and kept, so it can be checked through /stats.
+
+"""
+# python package
+import importlib
+import logging
+import threading
+import time
+
+# Initialize deferred import state
+_LOGGER                         = logging.getLogger(__name__)
+_MODULES                        = {} # module name -> imported module (only fully imported modules)
+_IMPORT_TIMES                   = {} # module name -> {'seconds': import time, 'imported_at': timestamp, 'thread': name of importing thread}
+_IMPORT_LOCK                    = threading.Lock()
+
+def _importModule(name):
+  """
+  _importModule() : Provide an imported module. The module is imported on the first call only and its import time is recorded,
+                    concurrent callers wait for the first import instead of seeing a partially imported module.
+
+                      ACCEPT module name as argument
+
+                      RETURN imported module
+
+                      RETURN EXAMPLE :
+
+                                      * MODULE : <module 'tensorflow' from '.../site-packages/tensorflow/__init__.py'>
+  """
+  module = _MODULES.get(name)
+  if module is not None:
+    return module
+
+  with _IMPORT_LOCK:
+    module = _MODULES.get(name)
+    if module is None:
+      start               = time.perf_counter()
+      module              = importlib.import_module(name)
+      seconds             = time.perf_counter() - start
+      _IMPORT_TIMES[name] = {'seconds': round(seconds, 4), 'imported_at': time.time(), 'thread': threading.current_thread().name}
+      _MODULES[name]      = module
+      _LOGGER.info('deferred import of %s took %.3f s', name, seconds)
+  return module
+
+def _getTensorflow():
+  """
+  _getTensorflow() : Provide tensorflow module, it is imported on the first call
+
+                      RETURN tensorflow module
+  """
+  return _importModule('tensorflow')
+
+def _getKerasModels():
+  """
+  _getKerasModels() : Provide keras.models module (load_model and model_from_json), it is imported on the first call.
+                      tensorflow is imported first, so the recorded time of each module is its own import time.
+
+                      RETURN keras.models module
+  """
+  _getTensorflow()
+  return _importModule('keras.models')
+
+def _getImportInfo():
+  """
+  _getImportInfo() : Provide import time of every deferred module which is already imported
+
+                      RETURN dictionary of deferred import information
+
+                      RETURN EXAMPLE :
+
+                                      * INFO : {'tensorflow': {'seconds': 2.7184, 'imported_at': 1760781668.23, 'thread': 'preload_0'},
+                                                'keras.models': {'seconds': 0.0021, 'imported_at': 1760781668.23, 'thread': 'preload_0'}}
+  """
+  with _IMPORT_LOCK:
+    info = {name: dict(record) for name, record in _IMPORT_TIMES.items()}
+  return info
@@ -0,0 +1,367 @@
+"""
+
+DOCUMENTATION:
+
+jobs is part of configuration layer. It provides an asynchronous job queue for large prediction submissions.
+Jobs and their images are stored in a SQLite database, so a submitted job survives a restart and can be polled from any
+worker process of the service. Background threads take queued jobs (interactive lane before bulk lane), predict their
+images in small batches, report progress after each batch and keep results until their time to live (TTL) is over.
+Before each batch a job waits (for a bounded time) while interactive requests of the process are running, so bulk
+jobs never starve /pred_select and /pred_comp traffic.
+
+"""
+# python package
+import contextlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+
+# internal package
+from src.infra import infra
+
+# Initialize Global alias
+_postJsonData                   = infra._postJsonData
+_isHttpUrl                      = infra._isHttpUrl
+
+# Initialize job queue state
+_LANES                          = {'interactive': 0, 'bulk': 1} # lower value is taken first
+_DATABASE_PATH                  = None
+_BATCH_SIZE                     = 8 # images predicted by one batch of a job
+_RESULT_TTL                     = 3600 # seconds a finished job is kept
+_POLL_INTERVAL                  = 0.5 # seconds a worker sleeps when queue is empty
+_STALE_TIMEOUT                  = 300 # seconds without progress before a running job is taken again (its worker died)
+_INTERACTIVE_WAIT               = 2.0 # maximum seconds a batch waits for running interactive requests
+_CALLBACK_TIMEOUT               = 5
+_PROCESSOR                      = None # function predicting a batch of a job, set by _setupJobQueue
+_WORKER_COUNT                   = 1
+_WORKERS                        = {'pid': None, 'threads': []} # workers are started once in each process
+_INTERACTIVE                    = {'active': 0}
+_INTERACTIVE_CONDITION          = threading.Condition()
+_JOBS_LOCK                      = threading.Lock()
+_SCHEMA                         = (
+  "CREATE TABLE IF NOT EXISTS jobs (id TEXT PRIMARY KEY, lane INTEGER, status TEXT, model_path TEXT, models TEXT, "
+  "total INTEGER, done INTEGER, run_time REAL, callback_url TEXT, error TEXT, created REAL, updated REAL, expires REAL)",
+  "CREATE TABLE IF NOT EXISTS job_images (job_id TEXT, position INTEGER, name TEXT, path TEXT, data BLOB, result TEXT, "
+  "PRIMARY KEY (job_id, position))",
+  "CREATE INDEX IF NOT EXISTS jobs_queue ON jobs (status, lane, created)",
+)
+
+def _connect():
+  """
+  _connect() : Provide a new connection into job database. Connections are not shared between threads.
+
+                      RETURN sqlite3 connection in autocommit mode
+  """
+  connection = sqlite3.connect(_DATABASE_PATH, timeout=30, isolation_level=None)
+  connection.row_factory = sqlite3.Row
+  return connection
+
+def _setupJobQueue(database_path, batch_size=8, result_ttl=3600, processor=None, workers=1):
+  """
+  _setupJobQueue() : Create job database (when it does not exist) and configure job queue, no worker is started
+                     (see _startJobWorkers) so jobs can be submitted and polled as soon as the queue is configured
+
+                      ACCEPT database_path, batch_size, result_ttl (in seconds), processor function (see _processJob)
+                      and number of workers as argument
+
+                      RETURN dictionary of current configuration
+
+                      RETURN EXAMPLE :
+
+                                      * CONFIG : {'database': 'cache/jobs.sqlite3', 'batch_size': 8, 'result_ttl': 3600, 'workers': 1}
+  """
+  global _DATABASE_PATH, _BATCH_SIZE, _RESULT_TTL, _PROCESSOR, _WORKER_COUNT
+  folder = os.path.dirname(database_path)
+  if folder:
+    os.makedirs(folder, exist_ok=True)
+
+  with _JOBS_LOCK:
+    _DATABASE_PATH  = database_path
+    _BATCH_SIZE     = max(int(batch_size), 1)
+    _RESULT_TTL     = max(int(result_ttl), 1)
+    _PROCESSOR      = processor
+    _WORKER_COUNT   = max(int(workers), 1)
+
+  connection = _connect()
+  try:
+    connection.execute("PRAGMA journal_mode=WAL") # pollers never block workers
+    for statement in _SCHEMA:
+      connection.execute(statement)
+  finally:
+    connection.close()
+  return {'database': _DATABASE_PATH, 'batch_size': _BATCH_SIZE, 'result_ttl': _RESULT_TTL, 'workers': _WORKER_COUNT}
+
+@contextlib.contextmanager
+def _interactiveRequest():
+  """
+  _interactiveRequest() : Context manager which marks an interactive request as running, job batches wait until
+                          every interactive request is finished (see _waitInteractiveIdle)
+  """
+  with _INTERACTIVE_CONDITION:
+    _INTERACTIVE['active'] += 1
+  try:
+    yield
+  finally:
+    with _INTERACTIVE_CONDITION:
+      _INTERACTIVE['active'] -= 1
+      _INTERACTIVE_CONDITION.notify_all()
+
+def _waitInteractiveIdle():
+  """
+  _waitInteractiveIdle() : Wait while interactive requests are running, at most interactive wait time so jobs always progress
+
+                      RETURN True when no interactive request is running
+  """
+  with _INTERACTIVE_CONDITION:
+    return _INTERACTIVE_CONDITION.wait_for(lambda: _INTERACTIVE['active'] == 0, timeout=_INTERACTIVE_WAIT)
+
+def _submitJob(models, model_path, images, lane='bulk', callback_url=None):
+  """
+  _submitJob() : Queue a prediction job. Query image samples are stored by path, uploaded images by their bytes.
+
+                      ACCEPT models (list of model name), model_path, images (list of (image name, image path or image bytes)),
+                      lane ('interactive' or 'bulk') and callback_url (optional http or https url called when job is finished) as argument
+
+                      RAISE ValueError for an unknown lane or a callback_url which is not http or https
+
+                      RETURN job dictionary (see _getJob)
+  """
+  if lane not in _LANES:
+    raise ValueError('unknown lane %r, use one of %s' % (lane, sorted(_LANES)))
+  callback_url = callback_url or None
+  if callback_url is not None and not _isHttpUrl(callback_url):
+    raise ValueError('callback_url must be an http or https url')
+
+  jobId = uuid.uuid4().hex
+  now   = time.time()
+  rows  = []
+  for position, (name, image) in enumerate(images):
+    if isinstance(image, str):
+      rows.append((jobId, position, name, image, None))
+    else:
+      rows.append((jobId, position, name, None, sqlite3.Binary(image)))
+
+  connection = _connect()
+  try:
+    connection.execute("BEGIN IMMEDIATE")
+    connection.execute("INSERT INTO jobs (id, lane, status, model_path, models, total, done, run_time, callback_url, created, updated) "
+                       "VALUES (?, ?, 'queued', ?, ?, ?, 0, 0.0, ?, ?, ?)",
+                       (jobId, _LANES[lane], model_path, json.dumps(list(models)), len(rows), callback_url, now, now))
+    connection.executemany("INSERT INTO job_images (job_id, position, name, path, data) VALUES (?, ?, ?, ?, ?)", rows)
+    connection.execute("COMMIT")
+  finally:
+    connection.close()
+  return _getJob(jobId, with_results=False)
+
+def _claimJob():
+  """
+  _claimJob() : Take the next queued job, interactive lane first then the oldest job. A running job without progress
+                for stale timeout is taken again.
+
+                      RETURN job row or None when queue is empty
+  """
+  now         = time.time()
+  connection  = _connect()
+  try:
+    connection.execute("BEGIN IMMEDIATE") # only one worker (of any process) can claim at a time
+    job = connection.execute("SELECT * FROM jobs WHERE status = 'queued' OR (status = 'running' AND updated < ?) "
+                             "ORDER BY lane, created LIMIT 1", (now - _STALE_TIMEOUT,)).fetchone()
+    if job is not None:
+      connection.execute("UPDATE jobs SET status = 'running', updated = ? WHERE id = ?", (now, job['id']))
+    connection.execute("COMMIT")
+  finally:
+    connection.close()
+  return job
+
+def _processJob(job, processor):
+  """
+  _processJob() : Predict pending images of a job batch by batch, progress and results are saved after each batch
+
+                      ACCEPT job row and processor function (list_choosen_model, model_path, images) -> (predictionResult, predictionTime)
+                      as argument, predictionResult holds an (N, classes) array of each model
+  """
+  models      = json.loads(job['models'])
+  connection  = _connect()
+  try:
+    while True:
+      pending = connection.execute("SELECT position, path, data FROM job_images WHERE job_id = ? AND result IS NULL "
+                                   "ORDER BY position LIMIT ?", (job['id'], _BATCH_SIZE)).fetchall()
+      if not pending:
+        break
+
+      if job['lane'] != _LANES['interactive']:
+        _waitInteractiveIdle()
+      images                            = [row['path'] if row['path'] is not None else bytes(row['data']) for row in pending]
+      predictionResult, predictionTime  = processor(models, job['model_path'], images)
+
+      resultRows  = [modelResult.tolist() for modelResult in predictionResult] # each array is converted at once
+      rows        = []
+      for index, row in enumerate(pending):
+        result = {model: resultRows[modelIndex][index] for modelIndex, model in enumerate(models)}
+        rows.append((json.dumps(result), job['id'], row['position']))
+
+      connection.execute("BEGIN IMMEDIATE")
+      connection.executemany("UPDATE job_images SET result = ?, data = NULL WHERE job_id = ? AND position = ?", rows)
+      connection.execute("UPDATE jobs SET done = done + ?, run_time = run_time + ?, updated = ? WHERE id = ?",
+                         (len(rows), sum(predictionTime), time.time(), job['id']))
+      connection.execute("COMMIT")
+  finally:
+    connection.close()
+
+def _finishJob(job_id, status, error=None):
+  """
+  _finishJob() : Mark a job as done or failed, its result is kept until result TTL is over. Callback url of the job (if any)
+                 receives the job dictionary, a failing callback never fails the job.
+
+                      ACCEPT job_id, status ('done' or 'failed') and error message as argument
+
+                      RETURN job dictionary (see _getJob)
+  """
+  now         = time.time()
+  connection  = _connect()
+  try:
+    connection.execute("UPDATE jobs SET status = ?, error = ?, updated = ?, expires = ? WHERE id = ?",
+                       (status, error, now, now + _RESULT_TTL, job_id))
+  finally:
+    connection.close()
+
+  job = _getJob(job_id)
+  if job is not None and job['callback_url']:
+    try:
+      _postJsonData(job['callback_url'], job, _CALLBACK_TIMEOUT)
+    except Exception: # callback receiver is not reachable, result can still be polled
+      pass
+  return job
+
+def _purgeExpiredJobs():
+  """
+  _purgeExpiredJobs() : Remove finished jobs whose result TTL is over
+
+                      RETURN number of removed job
+  """
+  connection = _connect()
+  try:
+    connection.execute("BEGIN IMMEDIATE")
+    expired = [row['id'] for row in connection.execute("SELECT id FROM jobs WHERE expires < ?", (time.time(),))]
+    connection.executemany("DELETE FROM job_images WHERE job_id = ?", [(jobId,) for jobId in expired])
+    connection.executemany("DELETE FROM jobs WHERE id = ?", [(jobId,) for jobId in expired])
+    connection.execute("COMMIT")
+  finally:
+    connection.close()
+  return len(expired)
+
+def _runJobWorker():
+  """
+  _runJobWorker() : Worker loop, it takes queued jobs one after another and removes expired jobs while the queue is empty
+  """
+  while True:
+    try:
+      job = _claimJob()
+      if job is None:
+        _purgeExpiredJobs()
+        time.sleep(_POLL_INTERVAL)
+        continue
+
+      try:
+        _processJob(job, _PROCESSOR)
+      except Exception as error:
+        _finishJob(job['id'], 'failed', '%s: %s' % (type(error).__name__, error))
+        continue
+      _finishJob(job['id'], 'done')
+    except sqlite3.Error: # database is busy or locked by another process, try again later
+      time.sleep(_POLL_INTERVAL)
+
+def _startJobWorkers():
+  """
+  _startJobWorkers() : Start background job workers of the current process when job queue is configured. It is checked by process id,
+                       so every forked gunicorn worker starts its own workers and later calls of the same process do nothing.
+
+                      RETURN number of running workers of the current process
+  """
+  if _PROCESSOR is None or _WORKERS['pid'] == os.getpid():
+    return len(_WORKERS['threads'])
+  with _JOBS_LOCK:
+    if _WORKERS['pid'] != os.getpid():
+      _WORKERS['threads'] = [threading.Thread(target=_runJobWorker, daemon=True, name='job-worker-%d' % index)
+                             for index in range(_WORKER_COUNT)]
+      for worker in _WORKERS['threads']:
+        worker.start()
+      _WORKERS['pid'] = os.getpid()
+    return len(_WORKERS['threads'])
+
+def _getJob(job_id, with_results=True):
+  """
+  _getJob() : Provide status, progress and (when asked) results of a job
+
+                      ACCEPT job_id and with_results as argument
+
+                      RETURN job dictionary or None when job does not exist (or is expired)
+
+                      RETURN EXAMPLE :
+
+                                      * JOB : {
+                                                'id': '4f1c2b9e0a8d4e6f9b7c3d2a1e0f5b6c', 'lane': 'bulk', 'status': 'running',
+                                                'models': ['BALANCE_model'], 'progress': {'done': 8, 'total': 20, 'percent': 40.0},
+                                                'run_time': 0.8123, 'callback_url': None, 'error': None,
+                                                'created': 1634567890.1, 'updated': 1634567891.2, 'expires': None,
+                                                'results': [{'image': 'Glioma_1469.png', 'predictions': {'BALANCE_model': [0.003, 99.987, 0.01]}}]
+                                              }
+  """
+  connection = _connect()
+  try:
+    job = connection.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+    if job is None:
+      return None
+    images = []
+    if with_results:
+      images = connection.execute("SELECT name, result FROM job_images WHERE job_id = ? AND result IS NOT NULL "
+                                  "ORDER BY position", (job_id,)).fetchall()
+  finally:
+    connection.close()
+
+  lanes = {value: lane for lane, value in _LANES.items()}
+  info  = {
+    'id'           : job['id'],
+    'lane'         : lanes.get(job['lane'], job['lane']),
+    'status'       : job['status'],
+    'models'       : json.loads(job['models']),
+    'progress'     : {'done': job['done'], 'total': job['total'],
+                      'percent': round(job['done'] / job['total'] * 100, 2) if job['total'] else 100.0},
+    'run_time'     : round(job['run_time'], 4),
+    'callback_url' : job['callback_url'],
+    'error'        : job['error'],
+    'created'      : job['created'],
+    'updated'      : job['updated'],
+    'expires'      : job['expires'],
+  }
+  if with_results:
+    info['results'] = [{'image': row['name'], 'predictions': json.loads(row['result'])} for row in images]
+  return info
+
+def _getJobQueueInfo():
+  """
+  _getJobQueueInfo() : Provide summary of job queue (number of job for each status and lane, workers and running interactive requests)
+
+                      RETURN dictionary of job queue information
+
+                      RETURN EXAMPLE :
+
+                                      * INFO : {'database': 'cache/jobs.sqlite3', 'workers': 1, 'interactive_active': 0,
+                                                'jobs': {'queued': {'bulk': 2}, 'running': {'bulk': 1}, 'done': {'interactive': 4}}}
+  """
+  workers = len(_WORKERS['threads']) if _WORKERS['pid'] == os.getpid() else 0
+  info    = {'database': _DATABASE_PATH, 'workers': workers, 'interactive_active': _INTERACTIVE['active'], 'jobs': {}}
+  if not _DATABASE_PATH:
+    return info
+
+  lanes       = {value: lane for lane, value in _LANES.items()}
+  connection  = _connect()
+  try:
+    for row in connection.execute("SELECT status, lane, COUNT(*) AS total FROM jobs GROUP BY status, lane"):
+      info['jobs'].setdefault(row['status'], {})[lanes.get(row['lane'], row['lane'])] = row['total']
+  finally:
+    connection.close()
+  return info
@@ -0,0 +1,319 @@
+"""
+
+DOCUMENTATION:
+
+leaderboard is part of configuration layer. It evaluates every model of model directory over the labelled query image
+samples (static/queryImage/<ClassName_><currentImageName>), so models can be chosen by numbers instead of by the compare page:
+
+            * accuracy    : top-1 accuracy against class dictionary, per-class recall and confusion matrix
+            * throughput  : p50 / p95 latency of one prediction call and images per second for each benchmark batch size
+
+Samples are preprocessed once by the same batch preprocessing as the service, predictions and benchmark calls go straight to
+the inference engine (without micro-batching) so they measure the model itself. A report is kept in memory and saved into
+cache path as <model>_<key>.json, its key holds fingerprint of model files, query images, class dictionary and benchmark
+settings, so an unchanged model is never evaluated again (also by other workers or after a restart).
+Leaderboard pages only read saved reports, evaluation runs outside of requests: by evaluate_models.py or by a background
+thread of the serving process (one evaluation at a time), which competes with live requests and shares their model registry.
+
+"""
+# python package
+import hashlib
+import json
+import os
+import threading
+import time
+
+import numpy as np
+
+# internal package
+from src.config import config
+from src.config import engine
+from src.config import gallery
+from src.infra import infra
+
+# Initialize Global alias
+_getDictModel                   = config._getDictModel
+_getModelFingerprint            = config._getModelFingerprint
+_loadSelectModel                = config._loadSelectModel
+_batchImageProcessing           = config._batchImageProcessing
+_predictRows                    = engine._predictRows
+_getGalleryIndex                = gallery._getGalleryIndex
+_writeFileBytes                 = infra._writeFileBytes
+
+# Initialize leaderboard state
+_CACHE_PATH                     = 'cache/leaderboard/'
+_BATCH_SIZES                    = (1, 8, 32)
+_ITERATIONS                     = 20 # benchmark calls of each batch size
+_REPORTS                        = {} # (model name, key) -> (modified time of report file, model report)
+_LEADERBOARD_LOCK               = threading.Lock() # one evaluation at a time
+_EVALUATION                     = {'pid': None, 'thread': None} # background evaluation of the current process
+_EVALUATION_LOCK                = threading.Lock()
+
+def _setLeaderboard(cache_path='cache/leaderboard/', batch_sizes=(1, 8, 32), iterations=20):
+  """
+  _setLeaderboard() : Configure model leaderboard
+
+                      ACCEPT cache_path (None keeps reports in memory only), batch_sizes of throughput benchmark and iterations
+                      (benchmark calls of each batch size) as argument
+
+                      RETURN dictionary of current configuration
+
+                      RETURN EXAMPLE :
+
+                                      * CONFIG : {'cache_path': 'cache/leaderboard/', 'batch_sizes': [1, 8, 32], 'iterations': 20}
+  """
+  global _CACHE_PATH, _BATCH_SIZES, _ITERATIONS
+  _CACHE_PATH   = cache_path
+  _BATCH_SIZES  = tuple(sorted({max(int(batch_size), 1) for batch_size in batch_sizes}))
+  _ITERATIONS   = max(int(iterations), 1)
+  if _CACHE_PATH:
+    os.makedirs(_CACHE_PATH, exist_ok=True)
+  return {'cache_path': _CACHE_PATH, 'batch_sizes': list(_BATCH_SIZES), 'iterations': _ITERATIONS}
+
+def _getLabelledSamples(query_path, class_dict):
+  """
+  _getLabelledSamples() : Provide query image samples whose class name (case insensitive) is in class dictionary
+
+                      ACCEPT query_path and class_dict (class name -> class index) as argument
+
+                      RETURN list of sample file and numpy array of class index
+
+                      RETURN EXAMPLE :
+
+                                      * SAMPLES : (['static/queryImage/Glioma_1469.png', 'static/queryImage/Meningioma_1.jpg'], array([0, 1]))
+  """
+  index       = _getGalleryIndex(query_path)
+  class_index = {name.upper(): position for name, position in class_dict.items()}
+  samples     = [(query, class_index[name.upper()]) for name, query in zip(index['classes'], index['queries']) if name.upper() in class_index]
+  return [query for query, _ in samples], np.array([target for _, target in samples], dtype=np.int64)
+
+def _getReportKey(model_name, model_path, query_path, class_dict, mode):
+  """
+  _getReportKey() : Provide key of a model report, it is changed whenever model files, query images, class dictionary, mode or
+                    benchmark settings are changed
+
+                      ACCEPT model_name, model_path, query_path, class_dict and mode as argument
+
+                      RETURN report key
+
+                      RETURN EXAMPLE :
+
+                                      * KEY : '8d1f0c2a9e4b7f35'
+  """
+  samples = sorted(_getGalleryIndex(query_path)['modified'].items())
+  source  = (_getModelFingerprint(model_name, model_path), samples, sorted(class_dict.items()), mode, _BATCH_SIZES, _ITERATIONS)
+  key     = hashlib.sha1(repr(source).encode('utf-8')).hexdigest()[:16]
+  return key
+
+def _getAccuracyReport(predicted, targets, labels):
+  """
+  _getAccuracyReport() : Provide accuracy, recall of each class and confusion matrix (rows are true class, columns are predicted class)
+
+                      ACCEPT predicted class index, target class index and labels (class names ordered by class index) as argument
+
+                      RETURN accuracy report dictionary
+
+                      RETURN EXAMPLE :
+
+                                      * REPORT : {'accuracy': 85.0, 'recall': {'GLIOMA': 100.0, 'MENINGIOMA': 66.667, 'PITUITARY': None},
+                                                  'confusion': [[6, 0, 0], [2, 4, 0], [0, 0, 0]]}
+  """
+  classes   = len(labels)
+  confusion = np.bincount(targets * classes + predicted, minlength=classes * classes).reshape(classes, classes)
+  support   = confusion.sum(axis=1)
+  recall    = np.divide(np.diag(confusion) * 100.0, support, out=np.zeros(classes), where=support > 0)
+  return {'accuracy'  : round(float(np.mean(predicted == targets)) * 100, 3) if len(targets) else None,
+          'recall'    : {label: (round(float(value), 3) if count else None) for label, value, count in zip(labels, recall, support)},
+          'confusion' : confusion.tolist()}
+
+def _benchmarkModel(model, batch):
+  """
+  _benchmarkModel() : Provide latency and throughput of a model for each benchmark batch size. Each batch size is called once
+                      before it is measured, rows of the sample batch are repeated when batch size is larger than the samples.
+
+                      ACCEPT loaded model and preprocessed sample batch as argument
+
+                      RETURN list of benchmark result
+
+                      RETURN EXAMPLE :
+
+                                      * BENCHMARK : [{'batch_size': 1, 'p50_ms': 4.21, 'p95_ms': 5.03, 'images_per_second': 231.4},
+                                                     {'batch_size': 8, 'p50_ms': 9.87, 'p95_ms': 11.2, 'images_per_second': 801.9}]
+  """
+  benchmark = []
+  for batch_size in _BATCH_SIZES:
+    rows      = batch[np.arange(batch_size) % batch.shape[0]]
+    _predictRows(model, rows) # first call of a batch size is not measured
+    latencies = np.empty(_ITERATIONS)
+    for iteration in range(_ITERATIONS):
+      start                 = time.perf_counter_ns()
+      _predictRows(model, rows)
+      latencies[iteration]  = time.perf_counter_ns() - start
+    p50, p95  = np.percentile(latencies, [50, 95]) / 1e6
+    benchmark.append({'batch_size': batch_size, 'p50_ms': round(float(p50), 3), 'p95_ms': round(float(p95), 3),
+                      'images_per_second': round(batch_size * 1e9 / float(latencies.mean()), 1)})
+  return benchmark
+
+def _evaluateModel(model_name, model_path, samples, targets, labels, mode):
+  """
+  _evaluateModel() : Evaluate accuracy and throughput of a model over labelled samples
+
+                      ACCEPT model_name, model_path, samples, targets, labels and mode ('rgb' or 'gray') as argument
+
+                      RETURN model report (see _getAccuracyReport and _benchmarkModel)
+
+                      RETURN EXAMPLE :
+
+                                      * REPORT : {'model': 'VGG_model', 'samples': 20, 'accuracy': 85.0, 'recall': {...}, 'confusion': [...],
+                                                  'throughput': [...], 'evaluated_at': 1792328712.4, 'evaluation_time': 3.214}
+  """
+  start       = time.perf_counter()
+  model       = _loadSelectModel(model_name, model_path)
+  batch       = _batchImageProcessing(samples, [model], mode)[0]
+  step        = max(_BATCH_SIZES)
+  predictions = np.concatenate([_predictRows(model, batch[row:row + step]) for row in range(0, batch.shape[0], step)], axis=0)
+  report      = {'model': model_name, 'samples': len(samples)}
+  report.update(_getAccuracyReport(np.argmax(predictions, axis=1), targets, labels))
+  report['throughput']      = _benchmarkModel(model, batch)
+  report['evaluated_at']    = time.time()
+  report['evaluation_time'] = round(time.perf_counter() - start, 3)
+  return report
+
+def _getReportFile(model_name, key):
+  """
+  _getReportFile() : Provide file of a saved model report
+
+                      RETURN report file or None when reports are kept in memory only
+  """
+  if not _CACHE_PATH:
+    return None
+  return os.path.join(_CACHE_PATH, '%s_%s.json' % (model_name, key))
+
+def _getCachedReport(model_name, key):
+  """
+  _getCachedReport() : Provide model report of key from memory or from cache path, a report file written again (such by
+                        evaluate_models.py --refresh or by another worker) is read again
+
+                      RETURN model report or None when the model was not evaluated with this key
+  """
+  modified, report = _REPORTS.get((model_name, key), (None, None))
+  report_file      = _getReportFile(model_name, key)
+  if report_file is None:
+    return report
+  try:
+    if os.path.getmtime(report_file) == modified:
+      return report
+    modified = os.path.getmtime(report_file)
+    with open(report_file, 'r') as opened_file:
+      report = json.load(opened_file)
+  except (OSError, ValueError): # not evaluated yet or replaced by another worker
+    return None
+  _REPORTS[(model_name, key)] = (modified, report)
+  return report
+
+def _saveReport(model_name, key, report):
+  """
+  _saveReport() : Keep model report in memory and save it into cache path, reports of older keys of the model are removed
+  """
+  for cached in [cached for cached in _REPORTS if cached[0] == model_name]:
+    _REPORTS.pop(cached, None)
+  report_file = _getReportFile(model_name, key)
+  if report_file is None:
+    _REPORTS[(model_name, key)] = (None, report)
+    return
+  for old_file in os.listdir(_CACHE_PATH):
+    if old_file.startswith(model_name + '_') and old_file[len(model_name) + 1:-5].isalnum() and old_file != os.path.basename(report_file):
+      os.remove(os.path.join(_CACHE_PATH, old_file))
+  _writeFileBytes(report_file, json.dumps(report).encode('utf-8'))
+  _REPORTS[(model_name, key)] = (os.path.getmtime(report_file), report)
+
+def _evaluateLeaderboard(model_path, query_path, class_dict, mode='rgb', refresh=False):
+  """
+  _evaluateLeaderboard() : Evaluate every model of model directory without a report of the current key (every model when refresh is set)
+                           and save their reports, one evaluation runs at a time
+
+                      ACCEPT model_path, query_path, class_dict, mode ('rgb' or 'gray') and refresh as argument
+
+                      RETURN list of evaluated model name
+
+                      RETURN EXAMPLE :
+
+                                      * EVALUATED : ['SMALL_model']
+  """
+  labels           = sorted(class_dict, key=class_dict.get)
+  samples, targets = _getLabelledSamples(query_path, class_dict)
+  _, listModel, _  = _getDictModel(model_path)
+  evaluated        = []
+  if not samples:
+    return evaluated
+
+  with _LEADERBOARD_LOCK:
+    for model_name in listModel:
+      key = _getReportKey(model_name, model_path, query_path, class_dict, mode)
+      if not refresh and _getCachedReport(model_name, key) is not None: # such evaluated by another worker
+        continue
+      try:
+        report = _evaluateModel(model_name, model_path, samples, targets, labels, mode)
+      except Exception as error: # such a model which does not accept images of this mode
+        report = {'model': model_name, 'samples': len(samples), 'error': '%s: %s' % (type(error).__name__, error), 'evaluated_at': time.time()}
+      _saveReport(model_name, key, report)
+      evaluated.append(model_name)
+  return evaluated
+
+def _isEvaluating():
+  """
+  _isEvaluating() : Check whether a background evaluation of the current process is running
+
+                      RETURN True or False
+  """
+  thread = _EVALUATION['thread'] if _EVALUATION['pid'] == os.getpid() else None
+  return thread is not None and thread.is_alive()
+
+def _startEvaluation(model_path, query_path, class_dict, mode='rgb', refresh=False):
+  """
+  _startEvaluation() : Start evaluation of the leaderboard (see _evaluateLeaderboard) in a background thread of the current process,
+                       nothing is started while another evaluation of the process is running
+
+                      ACCEPT model_path, query_path, class_dict, mode ('rgb' or 'gray') and refresh as argument
+
+                      RETURN evaluation thread or None when an evaluation is already running
+  """
+  with _EVALUATION_LOCK:
+    if _isEvaluating():
+      return None
+    thread = threading.Thread(target=_evaluateLeaderboard, args=(model_path, query_path, class_dict, mode, refresh), daemon=True, name='leaderboard')
+    _EVALUATION.update({'pid': os.getpid(), 'thread': thread})
+    thread.start()
+  return thread
+def _getLeaderboard(model_path, query_path, class_dict, mode='rgb'):
+  """
+  _getLeaderboard() : Provide leaderboard of saved reports of every model of model directory sorted by accuracy, then by images per second of
+                      the largest benchmark batch size. Nothing is evaluated, models without a report of the current key are pending
+                      (see _evaluateLeaderboard and _startEvaluation).
+
+                      ACCEPT model_path, query_path, class_dict and mode ('rgb' or 'gray') as argument
+
+                      RETURN leaderboard dictionary
+
+                      RETURN EXAMPLE :
+
+                                      * LEADERBOARD : {'labels': ['GLIOMA', 'MENINGIOMA', 'PITUITARY'], 'samples': 20, 'batch_sizes': [1, 8, 32],
+                                                       'pending': ['SMALL_model'], 'evaluating': False, 'models': [{'model': 'VGG_model', 'accuracy': 85.0, ...}, ...]}
+  """
+  labels           = sorted(class_dict, key=class_dict.get)
+  samples, _       = _getLabelledSamples(query_path, class_dict)
+  _, listModel, _  = _getDictModel(model_path)
+  reports          = []
+  pending          = []
+
+  for model_name in listModel:
+    report = _getCachedReport(model_name, _getReportKey(model_name, model_path, query_path, class_dict, mode))
+    if report is not None:
+      reports.append(report)
+    elif samples:
+      pending.append(model_name)
+
+  throughput = lambda report: report['throughput'][-1]['images_per_second'] if report.get('throughput') else 0.0
+  reports.sort(key=lambda report: (report.get('accuracy') is not None, report.get('accuracy') or 0.0, throughput(report)), reverse=True)
+  return {'labels': labels, 'samples': len(samples), 'batch_sizes': list(_BATCH_SIZES), 'iterations': _ITERATIONS,
+          'mode': mode, 'pending': pending, 'evaluating': _isEvaluating(), 'models': reports}
@@ -0,0 +1,342 @@
+"""
+
+DOCUMENTATION:
+
+metrics is part of configuration layer. It keeps service metrics (counters, gauges and histograms) of the worker and
+renders them in Prometheus text format for /metrics:
+
+            * ml_http_request_duration_seconds : latency of each request by route, method and status
+            * ml_inference_duration_seconds    : inference latency of each model seen by a request (micro-batching queue wait included)
+            * ml_inference_batch_size          : rows of each forward pass of the micro-batching scheduler by model
+            * ml_batch_queue_wait_seconds      : wait of each request in the micro-batching queue by model
+            * ml_batch_queue_depth             : requests waiting in the micro-batching queue by model
+            * ml_job_queue_jobs                : prediction jobs by status and lane
+            * ml_model_load_duration_seconds   : load (and warm-up) time of each model load, its count is the number of loads
+            * ml_cache_lookups_total           : hit and miss of model registry, result cache and preprocessing buffer pool
+            * ml_cache_hit_ratio               : hit ratio of each cache over every worker
+            * ml_upload_size_bytes             : size of uploaded images
+            * ml_worker_resident_memory_bytes  : resident memory of each worker
+            * ml_worker_memory_bytes           : pss, uss and shared memory of each worker (memory shared with gunicorn master in pre-fork serving)
+            * ml_loaded_model_bytes            : size of models kept by model registry of each worker
+
+Gunicorn runs several worker processes and a scrape reaches only one of them, so each worker writes a snapshot of its metrics
+into metrics directory (metrics_<pid>.json, every flush interval seconds and on each scrape). /metrics merges the snapshots of
+every running worker: counters and histograms are summed and gauges are labelled by pid. Snapshots of finished workers (or
+snapshots which were not written for several flush intervals, left by a previous run whose pid is reused) are removed on
+scrape, so the directory does not grow with recycled workers and restarts, the sum of counters restarts lower when a worker
+exits (a counter reset for Prometheus rate()). Without metrics directory only the serving worker is reported.
+
+"""
+# python package
+import glob
+import json
+import os
+import threading
+import time
+
+# internal package
+from src.infra import infra
+
+# Initialize Global alias
+_writeFileBytes                 = infra._writeFileBytes
+_isProcessAlive                 = infra._isProcessAlive
+
+# Initialize metrics state
+_LATENCY_BUCKETS                = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+_FAMILIES                       = { # metric name -> type, help, histogram buckets, shared (gauge of a resource shared by every worker)
+  'ml_http_request_duration_seconds' : {'type': 'histogram', 'help': 'Request latency by route, method and status.', 'buckets': _LATENCY_BUCKETS},
+  'ml_inference_duration_seconds'    : {'type': 'histogram', 'help': 'Inference latency of a model seen by a request.', 'buckets': _LATENCY_BUCKETS},
+  'ml_inference_batch_size'          : {'type': 'histogram', 'help': 'Rows of each forward pass of the micro-batching scheduler.', 'buckets': (1, 2, 4, 8, 16, 32, 64)},
+  'ml_batch_queue_wait_seconds'      : {'type': 'histogram', 'help': 'Wait of a request in the micro-batching queue.', 'buckets': (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1)},
+  'ml_batch_queue_depth'             : {'type': 'gauge', 'help': 'Requests waiting in the micro-batching queue.'},
+  'ml_job_queue_jobs'                : {'type': 'gauge', 'help': 'Prediction jobs by status and lane.', 'shared': True},
+  'ml_model_load_duration_seconds'   : {'type': 'histogram', 'help': 'Load and warm-up time of a model.', 'buckets': (0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)},
+  'ml_cache_lookups_total'           : {'type': 'counter', 'help': 'Cache lookups by cache and result (hit or miss).'},
+  'ml_cache_hit_ratio'               : {'type': 'gauge', 'help': 'Cache hit ratio over every worker.', 'shared': True},
+  'ml_upload_size_bytes'             : {'type': 'histogram', 'help': 'Size of uploaded images.', 'buckets': (16384, 65536, 262144, 1048576, 4194304, 16777216)},
+  'ml_worker_resident_memory_bytes'  : {'type': 'gauge', 'help': 'Resident memory of a worker process.'},
+  'ml_worker_memory_bytes'           : {'type': 'gauge', 'help': 'Proportional (pss), unique (uss) and shared memory of a worker process.'},
+  'ml_loaded_model_bytes'            : {'type': 'gauge', 'help': 'Size of models kept by model registry of a worker.'},
+}
+_ENABLED                        = True
+_METRICS_PATH                   = None # directory of worker snapshots, None means only the serving worker is reported
+_FLUSH_INTERVAL                 = 5 # seconds between snapshots of a worker
+_STALE_FLUSHES                  = 12 # snapshot not written for this many flush intervals is stale
+_SAMPLES                        = {} # metric name -> labels (tuple of name, value) -> value (histogram : {'buckets', 'sum', 'count'})
+_COLLECTORS                     = [] # functions called on each snapshot, they provide (metric name, labels dictionary, value) of counters and gauges
+_FLUSHER                        = {'pid': None, 'thread': None}
+_METRICS_LOCK                   = threading.Lock()
+
+def _setMetrics(enabled=True, metrics_path=None, flush_interval=5):
+  """
+  _setMetrics() : Configure service metrics. Use metrics_path when the service runs several worker processes (gunicorn),
+                  every worker writes its snapshot into the directory and /metrics reports all of them.
+
+                      ACCEPT enabled, metrics_path (None means only the serving worker) and flush_interval (seconds) as argument
+
+                      RETURN dictionary of current configuration
+
+                      RETURN EXAMPLE :
+
+                                      * CONFIG : {'enabled': True, 'metrics_path': 'cache/metrics/', 'flush_interval': 5}
+  """
+  global _ENABLED, _METRICS_PATH, _FLUSH_INTERVAL
+  _ENABLED        = bool(enabled)
+  _METRICS_PATH   = metrics_path
+  _FLUSH_INTERVAL = max(float(flush_interval), 0.5)
+  if _ENABLED and _METRICS_PATH:
+    os.makedirs(_METRICS_PATH, exist_ok=True)
+  return {'enabled': _ENABLED, 'metrics_path': _METRICS_PATH, 'flush_interval': _FLUSH_INTERVAL}
+
+def _isMetricsEnabled():
+  """
+  _isMetricsEnabled() : Check whether service metrics are enabled
+
+                      RETURN True or False
+  """
+  return _ENABLED
+
+def _addCollector(collector):
+  """
+  _addCollector() : Add a function which provides counters and gauges read from other modules on each snapshot
+
+                      ACCEPT collector (function which returns a list of (metric name, labels dictionary, value)) as argument
+
+                      RETURN collector
+  """
+  with _METRICS_LOCK:
+    if collector not in _COLLECTORS:
+      _COLLECTORS.append(collector)
+  return collector
+
+def _getLabels(labels):
+  """
+  _getLabels() : Provide labels key of a sample, sorted by label name
+
+                      ACCEPT labels dictionary as argument
+
+                      RETURN tuple of (label name, label value)
+  """
+  return tuple(sorted((name, str(value)) for name, value in (labels or {}).items()))
+
+def _incrementCounter(name, labels=None, amount=1):
+  """
+  _incrementCounter() : Add amount into a counter
+
+                      ACCEPT metric name, labels dictionary and amount as argument
+  """
+  if not _ENABLED:
+    return
+  key = _getLabels(labels)
+  with _METRICS_LOCK:
+    samples      = _SAMPLES.setdefault(name, {})
+    samples[key] = samples.get(key, 0) + amount
+  _startFlusher()
+
+def _observeHistogram(name, value, labels=None):
+  """
+  _observeHistogram() : Add an observed value (such latency in seconds) into a histogram
+
+                      ACCEPT metric name, value and labels dictionary as argument
+  """
+  if not _ENABLED:
+    return
+  key     = _getLabels(labels)
+  buckets = _FAMILIES[name]['buckets']
+  with _METRICS_LOCK:
+    sample = _SAMPLES.setdefault(name, {}).get(key)
+    if sample is None:
+      sample = _SAMPLES[name][key] = {'buckets': [0] * (len(buckets) + 1), 'sum': 0.0, 'count': 0}
+    index = next((position for position, bound in enumerate(buckets) if value <= bound), len(buckets))
+    sample['buckets'][index] += 1 # count of values inside each bucket, they are accumulated when rendered
+    sample['sum']            += value
+    sample['count']          += 1
+  _startFlusher()
+
+def _getSnapshot():
+  """
+  _getSnapshot() : Provide snapshot of worker metrics, observed metrics and metrics of collectors
+
+                      RETURN dictionary of snapshot
+
+                      RETURN EXAMPLE :
+
+                                      * SNAPSHOT : {'pid': 4121, 'written': 1760781668.23,
+                                                    'samples': {'ml_cache_lookups_total': [[{'cache': 'results', 'result': 'hit'}, 12]]}}
+  """
+  with _METRICS_LOCK:
+    samples    = {name: [[dict(key), json.loads(json.dumps(value))] for key, value in values.items()] for name, values in _SAMPLES.items()}
+    collectors = list(_COLLECTORS)
+
+  for collector in collectors:
+    for name, labels, value in collector():
+      samples.setdefault(name, []).append([{key: str(label) for key, label in labels.items()}, value])
+  return {'pid': os.getpid(), 'written': time.time(), 'samples': samples}
+
+def _flushMetrics():
+  """
+  _flushMetrics() : Write snapshot of worker metrics into metrics directory (metrics_<pid>.json)
+
+                      RETURN snapshot
+  """
+  snapshot = _getSnapshot()
+  if _METRICS_PATH:
+    snapshot_file = os.path.join(_METRICS_PATH, 'metrics_%d.json' % snapshot['pid'])
+    _writeFileBytes(snapshot_file, json.dumps(snapshot).encode('utf-8'))
+  return snapshot
+
+def _runFlusher():
+  """
+  _runFlusher() : Flusher loop of a worker, it writes a snapshot every flush interval
+  """
+  while True:
+    time.sleep(_FLUSH_INTERVAL)
+    if _ENABLED and _METRICS_PATH:
+      try:
+        _flushMetrics()
+      except OSError: # metrics directory is removed, the next flush creates the snapshot again
+        pass
+
+def _startFlusher():
+  """
+  _startFlusher() : Start flusher thread of the current process when metrics directory is used. It is checked by process id,
+                    so every forked gunicorn worker starts its own flusher.
+  """
+  if not _METRICS_PATH or _FLUSHER['pid'] == os.getpid():
+    return
+  with _METRICS_LOCK:
+    if _FLUSHER['pid'] == os.getpid():
+      return
+    _FLUSHER['pid']    = os.getpid()
+    _FLUSHER['thread'] = threading.Thread(target=_runFlusher, daemon=True, name='metrics-flusher')
+    _FLUSHER['thread'].start()
+
+def _readSnapshots():
+  """
+  _readSnapshots() : Provide snapshot of every running worker, the serving worker is flushed first so its metrics are current.
+                     Snapshots of finished workers and stale snapshots are removed from metrics directory.
+
+                      RETURN list of snapshot
+  """
+  snapshots = [_flushMetrics()]
+  if not _METRICS_PATH:
+    return snapshots
+
+  stale_time = time.time() - _FLUSH_INTERVAL * _STALE_FLUSHES
+  for snapshot_file in glob.glob(os.path.join(_METRICS_PATH, 'metrics_*.json')):
+    try:
+      with open(snapshot_file, 'r') as opened_file:
+        snapshot = json.load(opened_file)
+    except (OSError, ValueError): # removed or replaced while it is read
+      continue
+    if snapshot.get('pid') == os.getpid():
+      continue
+    if not _isProcessAlive(snapshot['pid']) or snapshot.get('written', 0) < stale_time:
+      try:
+        os.remove(snapshot_file)
+      except FileNotFoundError: # removed by another worker
+        pass
+      continue
+    snapshots.append(snapshot)
+  return snapshots
+
+def _mergeSnapshots(snapshots):
+  """
+  _mergeSnapshots() : Merge snapshots of running workers. Counters and histograms are summed, gauges are labelled by pid,
+                      shared gauges are taken from the serving worker.
+
+                      ACCEPT list of snapshot (the serving worker first) as argument
+
+                      RETURN metric name -> labels -> value
+  """
+  merged = {}
+  for position, snapshot in enumerate(snapshots):
+    for name, samples in snapshot['samples'].items():
+      family = _FAMILIES.get(name)
+      if family is None:
+        continue
+      values = merged.setdefault(name, {})
+
+      for labels, value in samples:
+        if family['type'] == 'gauge':
+          if family.get('shared') and position > 0:
+            continue
+          if not family.get('shared'):
+            labels = dict(labels, pid=snapshot['pid'])
+        key = _getLabels(labels)
+
+        if family['type'] == 'histogram':
+          total = values.setdefault(key, {'buckets': [0] * len(value['buckets']), 'sum': 0.0, 'count': 0})
+          total['buckets'] = [count + added for count, added in zip(total['buckets'], value['buckets'])]
+          total['sum']    += value['sum']
+          total['count']  += value['count']
+        else:
+          values[key] = values.get(key, 0) + value
+  return merged
+
+def _addHitRatio(merged):
+  """
+  _addHitRatio() : Add hit ratio of each cache over every worker, from merged cache lookups
+
+                      ACCEPT merged metrics as argument
+
+                      RETURN merged metrics
+  """
+  lookups = {}
+  for key, value in merged.get('ml_cache_lookups_total', {}).items():
+    labels = dict(key)
+    totals = lookups.setdefault(labels.get('cache'), {'hit': 0, 'miss': 0})
+    totals[labels.get('result')] = totals.get(labels.get('result'), 0) + value
+
+  ratios = merged.setdefault('ml_cache_hit_ratio', {})
+  for cache, totals in lookups.items():
+    total = totals['hit'] + totals['miss']
+    ratios[_getLabels({'cache': cache})] = round(totals['hit'] / total, 4) if total else 0.0
+  return merged
+
+def _formatLabels(key, extra=()):
+  """
+  _formatLabels() : Provide Prometheus label set of a sample
+
+                      ACCEPT labels key and extra labels (tuple of label name, label value) as argument
+
+                      RETURN label set
+
+                      RETURN EXAMPLE :
+
+                                      * LABELS : '{model="VGG_model",le="0.005"}'
+  """
+  labels = list(key) + list(extra)
+  if not labels:
+    return ''
+  escape = lambda value: str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+  return '{%s}' % ','.join('%s="%s"' % (name, escape(value)) for name, value in labels)
+
+def _renderMetrics():
+  """
+  _renderMetrics() : Provide metrics of every worker in Prometheus text format (version 0.0.4)
+
+                      RETURN metrics text
+
+                      RETURN EXAMPLE :
+
+                                      * TEXT : '# HELP ml_inference_batch_size Rows of each forward pass ...\\n# TYPE ml_inference_batch_size histogram\\n
+                                                ml_inference_batch_size_bucket{model="VGG_model",le="1"} 12\\n ...'
+  """
+  merged = _addHitRatio(_mergeSnapshots(_readSnapshots()))
+  lines  = []
+
+  for name, family in _FAMILIES.items():
+    lines.append('# HELP %s %s' % (name, family['help']))
+    lines.append('# TYPE %s %s' % (name, family['type']))
+    for key, value in sorted(merged.get(name, {}).items()):
+      if family['type'] != 'histogram':
+        lines.append('%s%s %s' % (name, _formatLabels(key), repr(float(value))))
+        continue
+      cumulative = 0
+      for bound, count in zip(list(family['buckets']) + ['+Inf'], value['buckets']):
+        cumulative += count
+        lines.append('%s_bucket%s %d' % (name, _formatLabels(key, (('le', bound if bound == '+Inf' else repr(float(bound))),)), cumulative))
+      lines.append('%s_sum%s %s' % (name, _formatLabels(key), repr(float(value['sum']))))
+      lines.append('%s_count%s %d' % (name, _formatLabels(key), value['count']))
+  return '\n'.join(lines) + '\n'
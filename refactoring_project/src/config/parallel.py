@@ -0,0 +1,67 @@
+"""
+
+DOCUMENTATION:
+
+parallel is part of configuration layer. It provides a bounded thread pool used to run several models of one
+compare request concurrently. The pool is shared by every request of the worker, so comparing many models never
+runs more than max workers predictions at once and does not oversubscribe the CPU. Each item runs in a copy of the
+context of the request, so context variables of the request (such stage timing scope) are seen by the pool threads.
+
+"""
+# python package
+import contextvars
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+# Initialize pool state
+_MAX_WORKERS                    = min(4, os.cpu_count() or 1)
+_EXECUTOR                       = None
+_EXECUTOR_LOCK                  = threading.Lock()
+
+def _setMaxWorkers(max_workers):
+  """
+  _setMaxWorkers() : Set maximum number of models predicted concurrently. Use 1 to predict models one after another.
+
+                      ACCEPT max_workers as argument
+
+                      RETURN max_workers
+  """
+  global _MAX_WORKERS, _EXECUTOR
+  with _EXECUTOR_LOCK:
+    _MAX_WORKERS = max(int(max_workers), 1)
+    if _EXECUTOR is not None: # running tasks are finished by the old pool
+      _EXECUTOR.shutdown(wait=False)
+      _EXECUTOR = None
+  return _MAX_WORKERS
+
+def _getExecutor():
+  """
+  _getExecutor() : Provide shared thread pool, the pool is created on first use
+
+                      RETURN ThreadPoolExecutor
+  """
+  global _EXECUTOR
+  with _EXECUTOR_LOCK:
+    if _EXECUTOR is None:
+      _EXECUTOR = ThreadPoolExecutor(max_workers=_MAX_WORKERS, thread_name_prefix='compare')
+    return _EXECUTOR
+
+def _mapOrdered(function, items):
+  """
+  _mapOrdered() : Run function for each item on the shared thread pool, in a copy of the caller context. Result order follows the order of items.
+                  Items are run one after another when there is only one item or max workers is 1.
+
+                      ACCEPT function and items as argument
+
+                      RETURN list of function result
+
+                      RETURN EXAMPLE :
+
+                                      * RESULT : [([0.003, 99.987, 0.01], 0.1728), ([0.003, 99.987, 0.01], 0.1987)]
+  """
+  items = list(items)
+  if _MAX_WORKERS <= 1 or len(items) <= 1:
+    return [function(item) for item in items]
+  futures = [_getExecutor().submit(contextvars.copy_context().run, function, item) for item in items]
+  return [future.result() for future in futures]
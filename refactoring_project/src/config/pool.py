@@ -0,0 +1,417 @@
+"""
+
+DOCUMENTATION:
+
+pool is part of configuration layer. It provides the inference pool, long-lived worker processes which own the loaded models
+and run every prediction, so CPU heavy inference does not compete with request parsing and template rendering of request
+threads for the GIL, and inference concurrency (pool processes) is sized apart from request threads of a serving process:
+
+            * model     : the serving process keeps a small pool model in its registry (name, input_shape and nbytes of the
+                          real model, backend 'pool'), so registry, preprocessing, micro-batching and inference engine are unchanged
+            * load      : a model is loaded by every pool process (each one has its own model registry and inference engine)
+            * predict   : a preprocessed batch is copied into a shared memory segment (multiprocessing.shared_memory) and only
+                          its name, shape and dtype are sent to the least busy pool process, which predicts over the segment in place
+            * result    : prediction rows (images x classes) come back through the pipe of the pool process, a collector thread
+                          of the serving process hands them to the waiting request
+
+Shared memory segments are reused by later predictions (a segment is only created when no free one is large enough) and removed
+when the serving process exits. Pool processes are forked (so they share pages of gunicorn master in pre-fork serving), they are
+started before any other thread of the serving process and before TensorFlow runtime is initialized, a pool process exits
+when its serving process is gone. A pool process which dies is not started again, its waiting requests fail.
+
+The pool belongs to one serving process. In pre-fork serving every gunicorn worker starts its own pool, so there are
+workers x processes inference processes and each of them keeps its own copy of every model (a gunicorn worker itself loads
+no model), instead of one copy for each worker without the pool. Keep the pool disabled in pre-fork serving unless the extra
+copies fit in memory, or use few gunicorn workers with a pool each.
+
+"""
+# python package
+import atexit
+import itertools
+import logging
+import multiprocessing
+import os
+import signal
+import sys
+import threading
+import time
+from multiprocessing import connection
+from multiprocessing import resource_tracker
+from multiprocessing import shared_memory
+
+import numpy as np
+
+# internal package
+from src.config import backends
+from src.config import engine
+from src.config import metrics
+from src.config import prefork
+from src.config import registry
+from src.infra import infra
+
+# Initialize Global alias
+_loadBackendModel               = backends._loadBackendModel
+_getBackendName                 = backends._getBackendName
+_warmupEngine                   = engine._warmupEngine
+_finishEngineLoading            = engine._finishEngineLoading
+_predictRows                    = engine._predictRows
+_setMetrics                     = metrics._setMetrics
+_isTensorflowInitialized        = prefork._isTensorflowInitialized
+_getThreadCount                 = prefork._getThreadCount
+_acquireModel                   = registry._acquireModel
+_getImageSizeFromModel          = infra._getImageSizeFromModel
+_getModelSizeInBytes            = infra._getModelSizeInBytes
+_getProcessMemory               = infra._getProcessMemory
+
+# Initialize inference pool state
+_LOGGER                         = logging.getLogger(__name__)
+_TIMEOUT                        = 300 # seconds a request waits for its pool process (model load included)
+_MIN_SEGMENT                    = 1 << 16 # smallest shared memory segment in bytes
+_POOL                           = {'workers': [], 'collector': None, 'pid': None, 'stopping': False, 'requests': 0, 'errors': 0}
+_PENDING                        = {} # request id -> {'event', 'worker', 'result', 'error'}
+_SEGMENTS                       = {'free': [], 'all': {}} # free segments, segment name -> shared memory of the serving process
+_REQUEST_IDS                    = itertools.count(1)
+_POOL_LOCK                      = threading.Lock()
+
+class _PoolModel:
+  """
+  _PoolModel : Model loaded by the inference pool. It has the part of keras model interface used by the service (predict,
+               input_shape and name), predict sends the batch to a pool process through shared memory.
+  """
+  backend = 'pool'
+
+  def __init__(self, key, model_and_weight, fingerprint, metadata):
+    self.key              = key
+    self.model_and_weight = model_and_weight
+    self.fingerprint      = fingerprint
+    self.name             = metadata['name']
+    self.input_shape      = tuple(metadata['input_shape'])
+    self.nbytes           = metadata['nbytes']
+    self.model_backend    = metadata['backend']
+
+  def predict(self, batch, **kwargs):
+    return _predictOnPool(self, batch)
+
+def _isPoolRunning():
+  """
+  _isPoolRunning() : Check whether inference pool is started by the current process
+
+                      RETURN True or False
+  """
+  return bool(_POOL['workers']) and _POOL['pid'] == os.getpid()
+
+def _startPool(processes=2):
+  """
+  _startPool() : Fork pool processes and start the collector thread of their results. It must be called before any other thread
+                 is started and before TensorFlow runtime is initialized, a forked process only gets the calling thread.
+
+                      ACCEPT processes (number of pool processes, 0 means inference runs in request threads) as argument
+
+                      RETURN number of running pool processes
+
+                      RAISE RuntimeError when the process can not be forked safely
+  """
+  processes = max(int(processes), 0)
+  if not processes or _isPoolRunning():
+    return len(_POOL['workers']) if _isPoolRunning() else 0
+  if 'fork' not in multiprocessing.get_all_start_methods():
+    _LOGGER.warning('inference pool needs fork start method, inference runs in request threads')
+    return 0
+  if _isTensorflowInitialized() or _getThreadCount() > 1:
+    raise RuntimeError('inference pool must be started before TensorFlow runtime is initialized and before other threads are started '
+                       '(start it first in app.start_worker_services)')
+  if prefork._PREFORK['enabled']:
+    _LOGGER.warning('gunicorn worker %d starts its own inference pool of %d processes, every gunicorn worker keeps %d copies of each model',
+                    os.getpid(), processes, processes)
+
+  context = multiprocessing.get_context('fork')
+  parent  = os.getpid()
+  for index in range(processes):
+    local_end, worker_end = context.Pipe()
+    process               = context.Process(target=_runPoolWorker, args=(worker_end, parent), daemon=True, name='inference-%d' % index)
+    process.start()
+    worker_end.close()
+    _POOL['workers'].append({'process': process, 'connection': local_end, 'lock': threading.Lock(), 'pending': 0, 'requests': 0, 'alive': True})
+
+  _POOL['pid']        = parent
+  _POOL['collector']  = threading.Thread(target=_runCollector, daemon=True, name='inference-collector')
+  _POOL['collector'].start()
+  atexit.register(_stopPool)
+  return processes
+
+def _stopPool():
+  """
+  _stopPool() : Stop pool processes and remove shared memory segments of the serving process
+  """
+  if _POOL['pid'] != os.getpid():
+    return
+  _POOL['stopping'] = True
+  for worker in _POOL['workers']:
+    try:
+      with worker['lock']:
+        worker['connection'].send(None)
+    except (OSError, ValueError):
+      pass
+  for worker in _POOL['workers']:
+    worker['process'].join(timeout=2)
+  with _POOL_LOCK:
+    for segment in _SEGMENTS['all'].values():
+      segment.close()
+      segment.unlink()
+    _SEGMENTS['all'].clear()
+    _SEGMENTS['free'].clear()
+
+def _attachSegment(name, segments):
+  """
+  _attachSegment() : Provide a shared memory segment of the serving process inside a pool process, it is attached once and kept.
+                     The segment is owned (and removed) by the serving process, so it is not tracked by resource tracker of the pool process.
+
+                      ACCEPT segment name and attached segments (segment name -> shared memory) as argument
+
+                      RETURN shared memory
+  """
+  segment = segments.get(name)
+  if segment is None:
+    if sys.version_info >= (3, 13):
+      segment = shared_memory.SharedMemory(name=name, track=False)
+    else:
+      segment = shared_memory.SharedMemory(name=name)
+      resource_tracker.unregister(segment._name, 'shared_memory')
+    segments[name] = segment
+  return segment
+
+def _getPoolWorkerModel(key, model_and_weight, fingerprint):
+  """
+  _getPoolWorkerModel() : Provide a model inside a pool process from its own model registry, a newly loaded model is warmed up by
+                          inference engine like in the serving process
+
+                      ACCEPT registry key, model_and_weight and fingerprint of model files as argument
+
+                      RETURN loaded model
+  """
+  return _finishEngineLoading(_acquireModel(key, lambda: _warmupEngine(_loadBackendModel(model_and_weight)), fingerprint))
+
+def _runPoolTask(task, segments):
+  """
+  _runPoolTask() : Run a task of the serving process inside a pool process
+
+                      ACCEPT task (kind, request id, registry key, model_and_weight, fingerprint and segment of predict task) and attached segments as argument
+
+                      RETURN task result (model metadata of load task, prediction rows and prediction time of predict task)
+  """
+  kind, _, key, model_and_weight, fingerprint = task[:5]
+  model = _getPoolWorkerModel(key, model_and_weight, fingerprint)
+  if kind == 'load':
+    input_layer, _ = _getImageSizeFromModel(model)
+    input_shape    = input_layer.input_shape[0] if type(input_layer.input_shape) is list else input_layer.input_shape
+    return {'name': getattr(model, 'name', key[1]), 'input_shape': list(input_shape), 'nbytes': _getModelSizeInBytes(model), 'backend': _getBackendName(model)}
+
+  segment_name, shape, dtype = task[5:]
+  batch = np.ndarray(shape, dtype=dtype, buffer=_attachSegment(segment_name, segments).buf)
+  start = time.perf_counter()
+  try:
+    rows = np.array(_predictRows(model, batch), dtype=np.float32) # a copy, so nothing refers to the segment after the task
+  finally:
+    del batch
+  return rows, time.perf_counter() - start
+
+def _runPoolWorker(worker_end, parent):
+  """
+  _runPoolWorker() : Main loop of a pool process, it runs tasks from its pipe until it gets None or its serving process is gone.
+                     Signals of the serving process (such gunicorn handlers) are reset, ctrl+c is handled by the serving process.
+
+                      ACCEPT pipe end of the pool process and process id of the serving process as argument
+  """
+  signal.signal(signal.SIGINT, signal.SIG_IGN)
+  for signal_number in (signal.SIGTERM, signal.SIGHUP, signal.SIGQUIT, signal.SIGUSR1, signal.SIGUSR2, signal.SIGCHLD):
+    signal.signal(signal_number, signal.SIG_DFL)
+  _setMetrics(False) # requests and model loads are reported by the serving process
+  segments = {}
+  while os.getppid() == parent:
+    if not worker_end.poll(1.0):
+      continue
+    try:
+      task = worker_end.recv()
+    except EOFError:
+      break
+    if task is None:
+      break
+    try:
+      worker_end.send((task[1], _runPoolTask(task, segments), None))
+    except Exception as error: # such a model which can not be loaded, the request gets the error
+      worker_end.send((task[1], None, '%s: %s' % (type(error).__name__, error)))
+  for segment in segments.values():
+    segment.close()
+
+def _runCollector():
+  """
+  _runCollector() : Collector loop of the serving process, it hands every result of pool processes to its waiting request.
+                    Waiting requests of a pool process which is gone fail with an error.
+  """
+  connections = {worker['connection']: worker for worker in _POOL['workers']}
+  while connections:
+    for ready in connection.wait(list(connections), timeout=1.0):
+      worker = connections[ready]
+      try:
+        request_id, result, error = ready.recv()
+      except (EOFError, OSError):
+        connections.pop(ready)
+        _failWorker(worker)
+        continue
+      with _POOL_LOCK:
+        pending = _PENDING.pop(request_id, None)
+        worker['pending'] -= 1
+        _POOL['errors'] += error is not None
+      if pending is not None:
+        pending['result'], pending['error'] = result, error
+        pending['event'].set()
+
+def _failWorker(worker):
+  """
+  _failWorker() : Mark a pool process as gone and fail its waiting requests
+  """
+  if not _POOL['stopping']:
+    _LOGGER.error('inference pool process %s is gone', worker['process'].pid)
+  with _POOL_LOCK:
+    worker['alive'] = False
+    failed          = [request_id for request_id, pending in _PENDING.items() if pending['worker'] is worker]
+    for request_id in failed:
+      pending = _PENDING.pop(request_id)
+      pending['error'] = 'RuntimeError: inference pool process %s is gone' % worker['process'].pid
+      pending['event'].set()
+
+def _sendTask(worker, kind, model_key, model_and_weight, fingerprint, *payload):
+  """
+  _sendTask() : Send a task to a pool process
+
+                      ACCEPT pool process, task kind ('load' or 'predict'), registry key, model_and_weight, fingerprint and payload of the task as argument
+
+                      RETURN pending request (wait for it by _waitTask)
+  """
+  request_id = next(_REQUEST_IDS)
+  pending    = {'event': threading.Event(), 'worker': worker, 'result': None, 'error': None}
+  with _POOL_LOCK:
+    if not worker['alive']:
+      raise RuntimeError('inference pool process %s is gone' % worker['process'].pid)
+    _PENDING[request_id] = pending
+    worker['pending']   += 1
+    worker['requests']  += 1
+    _POOL['requests']   += 1
+  with worker['lock']:
+    worker['connection'].send((kind, request_id, model_key, model_and_weight, fingerprint) + payload)
+  return pending
+
+def _waitTask(pending):
+  """
+  _waitTask() : Wait for result of a task sent to a pool process
+
+                      ACCEPT pending request as argument
+
+                      RETURN task result
+
+                      RAISE RuntimeError when the task fails or the pool process does not answer in time
+  """
+  if not pending['event'].wait(_TIMEOUT):
+    raise RuntimeError('inference pool process %s did not answer in %d seconds' % (pending['worker']['process'].pid, _TIMEOUT))
+  if pending['error'] is not None:
+    raise RuntimeError(pending['error'])
+  return pending['result']
+
+def _getAliveWorkers():
+  """
+  _getAliveWorkers() : Provide running pool processes
+
+                      RETURN list of pool process
+
+                      RAISE RuntimeError when no pool process is running
+  """
+  with _POOL_LOCK:
+    workers = [worker for worker in _POOL['workers'] if worker['alive']]
+  if not workers:
+    raise RuntimeError('no inference pool process is running')
+  return workers
+
+def _loadPoolModel(key, model_and_weight, fingerprint):
+  """
+  _loadPoolModel() : Load a model by every running pool process, so any of them can predict it right away
+
+                      ACCEPT registry key (tuple of model path and model name), model_and_weight and fingerprint of model files as argument
+
+                      RETURN pool model  <_PoolModel object at 0x7f3a2c1d5e80>
+  """
+  pending  = [_sendTask(worker, 'load', key, model_and_weight, fingerprint) for worker in _getAliveWorkers()]
+  metadata = [_waitTask(request) for request in pending]
+  return _PoolModel(key, model_and_weight, fingerprint, metadata[0])
+
+def _acquireSegment(nbytes):
+  """
+  _acquireSegment() : Provide the smallest free shared memory segment which holds nbytes, a new segment (size rounded up to a power
+                      of two) is created when no free segment is large enough
+
+                      ACCEPT nbytes as argument
+
+                      RETURN shared memory
+  """
+  with _POOL_LOCK:
+    fitting = [segment for segment in _SEGMENTS['free'] if segment.size >= nbytes]
+    if fitting:
+      segment = min(fitting, key=lambda free: free.size)
+      _SEGMENTS['free'].remove(segment)
+      return segment
+  segment = shared_memory.SharedMemory(create=True, size=max(_MIN_SEGMENT, 1 << (int(nbytes) - 1).bit_length()))
+  with _POOL_LOCK:
+    _SEGMENTS['all'][segment.name] = segment
+  return segment
+
+def _releaseSegment(segment):
+  """
+  _releaseSegment() : Give a shared memory segment back, so it is reused by the next prediction
+  """
+  with _POOL_LOCK:
+    _SEGMENTS['free'].append(segment)
+
+def _predictOnPool(model, batch):
+  """
+  _predictOnPool() : Predict a preprocessed batch by the least busy pool process. The batch is copied into a shared memory segment,
+                     only segment name, shape and dtype are sent to the pool process.
+
+                      ACCEPT pool model and batch (numpy array with batch dimension) as argument
+
+                      RETURN prediction result of each image of the batch
+  """
+  batch   = np.ascontiguousarray(batch, dtype=np.float32)
+  segment = _acquireSegment(batch.nbytes)
+  pending = None
+  try:
+    shared  = np.ndarray(batch.shape, dtype=batch.dtype, buffer=segment.buf)
+    shared[...] = batch
+    del shared
+    worker  = min(_getAliveWorkers(), key=lambda alive: alive['pending'])
+    pending = _sendTask(worker, 'predict', model.key, model.model_and_weight, model.fingerprint, segment.name, batch.shape, batch.dtype.str)
+    rows, _ = _waitTask(pending)
+  finally:
+    if pending is None or pending['event'].is_set(): # a segment of an unanswered task might still be read, it is not reused
+      _releaseSegment(segment)
+  return rows
+
+def _getPoolInfo():
+  """
+  _getPoolInfo() : Provide information of inference pool (requests, shared memory segments and each pool process with its memory)
+
+                      RETURN dictionary of inference pool information
+
+                      RETURN EXAMPLE :
+
+                                      * INFO : {'enabled': True, 'requests': 120, 'errors': 0, 'segments': 3, 'segment_bytes': 12845056,
+                                                'workers': [{'pid': 4130, 'alive': True, 'pending': 0, 'requests': 61,
+                                                             'memory': {'rss': 734003200, 'pss': 301989888, 'uss': 209715200, 'shared': 524288000}}]}
+  """
+  running = _isPoolRunning()
+  with _POOL_LOCK:
+    info    = {'enabled': running, 'requests': _POOL['requests'], 'errors': _POOL['errors'], 'segments': len(_SEGMENTS['all']),
+               'segment_bytes': sum(segment.size for segment in _SEGMENTS['all'].values()),
+               'workers': [{'pid': worker['process'].pid, 'alive': worker['alive'], 'pending': worker['pending'], 'requests': worker['requests']}
+                           for worker in (_POOL['workers'] if running else [])]}
+  for worker in info['workers']:
+    worker['memory'] = _getProcessMemory(worker['pid']) if worker['alive'] else None
+  return info
@@ -0,0 +1,127 @@
+"""
+
+DOCUMENTATION:
+
+prefork is part of configuration layer. It prepares pre-fork serving (gunicorn.conf.py with preload_app), the gunicorn master
+imports the application once and forks its workers, so pages of the master are shared copy-on-write by every worker:
+
+            * TensorFlow / Keras : imported by the master, python modules and libraries of TensorFlow are shared by all workers
+            * TFLite models      : model files are read by the master, every worker builds its interpreter over the same bytes
+            * keras / onnx       : loaded by each worker after fork, their weights are copied into tensors owned by the runtime
+                                   (a keras variable never points to shared memory), export them into TFLite by convert_models.py
+                                   to share their weights
+
+TensorFlow is not fork safe once its runtime is initialized (the first op or keras model load creates thread pools and the
+eager context), a worker forked after that hangs on its first prediction. So the master only imports TensorFlow and never loads
+a keras model or runs an op, and _checkForkSafety refuses to fork a worker when the runtime is initialized (or when a thread
+of the service runs in the master once it is prepared). The inference pool and background threads (prediction jobs, model preload, micro-batching and metrics flusher) are started by
+each worker after fork. Memory of each worker is reported as rss, pss and uss (see infra._getProcessMemory), the gap between
+rss and uss is the memory shared with the master.
+
+"""
+# python package
+import gc
+import os
+import sys
+import threading
+import time
+
+# internal package
+from src.config import backends
+from src.config import imports
+from src.infra import infra
+
+# Initialize Global alias
+_getKerasModels                 = imports._getKerasModels
+_shareModelBytes                = backends._shareModelBytes
+_getProcessMemory               = infra._getProcessMemory
+
+# Initialize pre-fork state
+_PREFORK                        = {'enabled': False, 'master_pid': None, 'prepared_at': None, 'prepare_time': None,
+                                   'shared_models': {}, 'worker_models': []} # shared_models : model name -> shared bytes
+
+def _prepareForkServing(dict_model, share_tflite_weights=True):
+  """
+  _prepareForkServing() : Prepare gunicorn master before its workers are forked. TensorFlow and Keras are imported (import does
+                          not initialize TensorFlow runtime) and TFLite models are read into memory, other models are loaded by each worker.
+
+                      ACCEPT dict_model (model name -> model file or list of json model and weight) and share_tflite_weights as argument
+
+                      RETURN pre-fork information (see _getPreforkInfo)
+  """
+  start = time.perf_counter()
+  _getKerasModels()
+  for model_name, model_and_weight in dict_model.items():
+    shared_bytes = _shareModelBytes(model_and_weight) if share_tflite_weights else 0
+    if shared_bytes:
+      _PREFORK['shared_models'][model_name] = shared_bytes
+    else:
+      _PREFORK['worker_models'].append(model_name)
+  _PREFORK.update({'enabled': True, 'master_pid': os.getpid(), 'prepared_at': time.time(), 'prepare_time': round(time.perf_counter() - start, 4)})
+  _checkForkSafety(check_threads=True)
+  return _getPreforkInfo()
+
+def _isTensorflowInitialized():
+  """
+  _isTensorflowInitialized() : Check whether TensorFlow runtime (eager context) is initialized in the current process.
+                               TensorFlow is never imported here, a process which did not import it is not initialized.
+
+                      RETURN True or False
+  """
+  context = sys.modules.get('tensorflow.python.eager.context')
+  if context is None:
+    return False
+  eager_context = context.context_safe()
+  return eager_context is not None and bool(eager_context._initialized)
+
+def _getThreadCount():
+  """
+  _getThreadCount() : Provide number of python threads of the current process. Native thread pools (such OpenBLAS of numpy) are
+                      not counted, they are reset by their own fork handlers and TensorFlow runtime is checked by _isTensorflowInitialized.
+
+                      RETURN number of threads
+  """
+  return threading.active_count()
+
+def _checkForkSafety(check_threads=False):
+  """
+  _checkForkSafety() : Check that the current process can be forked into serving workers and freeze objects allocated so far
+                       (gc.freeze), so the garbage collector of a worker does not write into pages shared with the master.
+                       Threads are only checked when the master is prepared, gunicorn starts threads of its own afterwards.
+
+                      ACCEPT check_threads (refuse when another thread is running) as argument
+
+                      RETURN number of frozen objects
+
+                      RAISE RuntimeError when TensorFlow runtime is initialized or another thread is running
+  """
+  if _isTensorflowInitialized():
+    raise RuntimeError('TensorFlow runtime is initialized in gunicorn master, forked workers would hang on their first prediction. '
+                       'Do not load models or run TensorFlow ops while app.py is imported in pre-fork serving (set PRELOAD_MODELS in workers only)')
+  threads = _getThreadCount()
+  if check_threads and threads > 1:
+    names = ', '.join(thread.name for thread in threading.enumerate() if thread is not threading.main_thread())
+    raise RuntimeError('%d threads are running in gunicorn master (%s), locks held by them would be copied locked into forked workers. '
+                       'Start background threads after fork (app.start_worker_services)' % (threads, names))
+  gc.freeze()
+  return gc.get_freeze_count()
+
+def _getPreforkInfo():
+  """
+  _getPreforkInfo() : Provide pre-fork serving information with memory of the current process and of gunicorn master
+
+                      RETURN dictionary of pre-fork information
+
+                      RETURN EXAMPLE :
+
+                                      * INFO : {'enabled': True, 'master_pid': 4120, 'pid': 4121, 'prepared_at': 1792328712.4, 'prepare_time': 3.102,
+                                                'shared_models': {'VGG_int8_model': 20621440}, 'worker_models': ['VGG_model'],
+                                                'memory': {'rss': 734003200, 'pss': 301989888, 'uss': 209715200, 'shared': 524288000},
+                                                'master_memory': {'rss': 612368384, 'pss': 198180864, 'uss': 31457280, 'shared': 580911104}}
+  """
+  info = {'enabled': _PREFORK['enabled'], 'master_pid': _PREFORK['master_pid'], 'pid': os.getpid(), 'prepared_at': _PREFORK['prepared_at'],
+          'prepare_time': _PREFORK['prepare_time'], 'shared_models': dict(_PREFORK['shared_models']), 'worker_models': list(_PREFORK['worker_models']),
+          'memory': _getProcessMemory()}
+  if _PREFORK['enabled'] and _PREFORK['master_pid'] != os.getpid():
+    info['master_memory'] = _getProcessMemory(_PREFORK['master_pid'])
+  return info
@@ -0,0 +1,123 @@
+"""
+
+DOCUMENTATION:
+
+preload is part of configuration layer. It provides the eager preload mode of the service: every model of the model
+directory is loaded in parallel (by background threads, so the worker can already answer health probes) and predicts
+one dummy image, before the worker reports ready. Without preload, the first request of each model pays for
+TensorFlow initialization, model deserialization and graph tracing. Load and warm-up time of each model is logged and
+kept for the readiness endpoint. When preload is not used the worker is always ready (models are loaded on first use).
+
+"""
+# python package
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# Initialize preload state
+_LOGGER                         = logging.getLogger(__name__)
+_PRELOAD                        = {'status': 'disabled', 'pid': None, 'started': None, 'finished': None, 'models': {}} # status : disabled, loading, ready or failed
+_PRELOAD_LOCK                   = threading.Lock()
+
+def _preloadModel(model_name, load_model, warm_model):
+  """
+  _preloadModel() : Load one model and run a dummy inference on it, load and warm-up time are recorded into preload state.
+                    An error is recorded instead of raised, so other models are still preloaded.
+
+                      ACCEPT model_name, load_model (function of model name which provides loaded model) and warm_model (function of loaded model) as argument
+
+                      RETURN True when the model is ready else False
+  """
+  with _PRELOAD_LOCK:
+    _PRELOAD['models'][model_name] = {'status': 'loading', 'load_time': None, 'warmup_time': None, 'error': None}
+  record = {}
+
+  try:
+    start                 = time.perf_counter()
+    model                 = load_model(model_name)
+    record['load_time']   = round(time.perf_counter() - start, 4)
+
+    start                 = time.perf_counter()
+    warm_model(model)
+    record['warmup_time'] = round(time.perf_counter() - start, 4)
+    record['status']      = 'ready'
+    _LOGGER.info('preload model %s loaded in %.3f s, warm-up inference in %.3f s', model_name, record['load_time'], record['warmup_time'])
+  except Exception as error: # broken model file, the worker would not be ready
+    record['status']      = 'failed'
+    record['error']       = '%s: %s' % (type(error).__name__, error)
+    _LOGGER.error('preload model %s failed, %s', model_name, record['error'])
+
+  with _PRELOAD_LOCK:
+    _PRELOAD['models'][model_name].update(record)
+  return record['status'] == 'ready'
+
+def _runPreload(model_names, load_model, warm_model, max_workers):
+  """
+  _runPreload() : Preload every model with a bounded thread pool and set final preload status
+
+                      ACCEPT model_names, load_model, warm_model and max_workers as argument
+  """
+  with ThreadPoolExecutor(max_workers=max(int(max_workers), 1), thread_name_prefix='preload') as executor:
+    ready = list(executor.map(lambda model_name: _preloadModel(model_name, load_model, warm_model), model_names))
+
+  with _PRELOAD_LOCK:
+    status                = 'ready' if all(ready) else 'failed'
+    _PRELOAD['status']    = status
+    _PRELOAD['finished']  = time.time()
+    total_time            = _PRELOAD['finished'] - _PRELOAD['started']
+  _LOGGER.info('preload of %d models finished in %.3f s, status %s', len(model_names), total_time, status)
+
+def _startPreload(model_names, load_model, warm_model, max_workers=4, wait=False):
+  """
+  _startPreload() : Start eager preload of models. Preload runs in a background thread unless wait is True,
+                    the worker is not ready until every model is loaded and warmed up. Preload is started once in each
+                    process (checked by process id), later calls of the same process do nothing.
+
+                      ACCEPT model_names, load_model (function of model name which provides loaded model), warm_model (function of loaded model),
+                      max_workers (models loaded at once) and wait as argument
+
+                      RETURN preload thread (None when wait is True or preload is already started in this process)
+  """
+  model_names = list(model_names)
+  with _PRELOAD_LOCK:
+    if _PRELOAD['pid'] == os.getpid():
+      return None
+    _PRELOAD.update({'status': 'loading', 'pid': os.getpid(), 'started': time.time(), 'finished': None, 'models': {}})
+  _LOGGER.info('preload of %d models started with %d workers', len(model_names), max_workers)
+
+  if wait:
+    _runPreload(model_names, load_model, warm_model, max_workers)
+    return None
+
+  thread = threading.Thread(target=_runPreload, args=(model_names, load_model, warm_model, max_workers), daemon=True, name='preload')
+  thread.start()
+  return thread
+
+def _isReady():
+  """
+  _isReady() : Check whether the worker is ready to serve predictions (preload is finished, or preload is not used)
+
+                      RETURN True or False
+  """
+  with _PRELOAD_LOCK:
+    return _PRELOAD['status'] in ('disabled', 'ready')
+
+def _getPreloadInfo():
+  """
+  _getPreloadInfo() : Provide preload status and load / warm-up time of each model
+
+                      RETURN dictionary of preload information
+
+                      RETURN EXAMPLE :
+
+                                      * INFO : {'status': 'ready', 'ready': True, 'elapsed': 2.8123,
+                                                'models': {'BALANCE_model': {'status': 'ready', 'load_time': 2.4521, 'warmup_time': 0.0312, 'error': None}}}
+  """
+  with _PRELOAD_LOCK:
+    info = {'status': _PRELOAD['status'], 'ready': _PRELOAD['status'] in ('disabled', 'ready'),
+            'models': {name: dict(model) for name, model in _PRELOAD['models'].items()}}
+    if _PRELOAD['started'] is not None:
+      info['elapsed'] = round((_PRELOAD['finished'] or time.time()) - _PRELOAD['started'], 4)
+  return info
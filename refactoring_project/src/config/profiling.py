@@ -0,0 +1,241 @@
+"""
+
+DOCUMENTATION:
+
+profiling is part of configuration layer. It provides opt-in profiling of single requests, to find where the time of a slow
+model or a slow image type goes (PIL decode, cv2 resize, Keras overhead or template rendering). A request is profiled when
+it has the profile header (such X-Profile: 1) or when it is picked by the sample rate. For a profiled request:
+
+            * cprofile    : cProfile of the request thread, saved as <id>.prof (pstats, open it with snakeviz) and <id>.txt (top functions)
+            * pyinstrument: pyinstrument profile of the request thread saved as <id>.html (optional package pyinstrument)
+            * tf trace    : TensorFlow profiler trace of the predict step saved into <id>_tf/ (open it with TensorBoard profile plugin)
+
+The forward pass runs on micro-batching and compare threads, so it is covered by the TensorFlow trace rather than by the
+request thread profile. TensorFlow profiler traces the whole process, so only one trace runs at a time. When inference pool
+is running the forward pass runs in pool processes, the predict step is not traced (it would be empty and would initialize
+TensorFlow in the serving process) and the profile records why.
+Metadata of each profile is saved as <id>.json and listed by the /profiles index page, only the newest max profiles are kept.
+When profiling is disabled no request is profiled and the predict step only checks one flag.
+
+"""
+# python package
+import contextlib
+import contextvars
+import cProfile
+import glob
+import io
+import json
+import os
+import pstats
+import random
+import shutil
+import threading
+import time
+import uuid
+
+# internal package
+from src.config import imports
+from src.config import pool
+
+# Initialize Global alias
+_getTensorflow                  = imports._getTensorflow
+_importModule                   = imports._importModule
+_isPoolRunning                  = pool._isPoolRunning
+
+# Initialize profiling state
+_PROFILERS                      = ('cprofile', 'pyinstrument')
+_ENABLED                        = False
+_PROFILE_PATH                   = 'cache/profiles/'
+_SAMPLE_RATE                    = 0.0 # share of requests profiled without profile header
+_PROFILER                       = 'cprofile'
+_TF_TRACE                       = True
+_MAX_PROFILES                   = 50
+_SESSION                        = contextvars.ContextVar('profile_session', default=None)
+_TRACE_LOCK                     = threading.Lock() # TensorFlow profiler traces the whole process, one trace at a time
+_PROFILING_LOCK                 = threading.Lock()
+
+def _setProfiling(enabled=False, profile_path='cache/profiles/', sample_rate=0.0, profiler='cprofile', tf_trace=True, max_profiles=50):
+  """
+  _setProfiling() : Configure request profiling
+
+                      ACCEPT enabled, profile_path, sample_rate (0.0 - 1.0), profiler ('cprofile' or 'pyinstrument'),
+                      tf_trace (trace predict step with TensorFlow profiler) and max_profiles (newest profiles kept) as argument
+
+                      RETURN dictionary of current configuration
+
+                      RETURN EXAMPLE :
+
+                                      * CONFIG : {'enabled': True, 'profile_path': 'cache/profiles/', 'sample_rate': 0.01, 'profiler': 'cprofile',
+                                                  'tf_trace': True, 'max_profiles': 50}
+  """
+  global _ENABLED, _PROFILE_PATH, _SAMPLE_RATE, _PROFILER, _TF_TRACE, _MAX_PROFILES
+  if profiler not in _PROFILERS:
+    raise ValueError('unknown profiler %r, use one of %s' % (profiler, ', '.join(_PROFILERS)))
+  if enabled and profiler == 'pyinstrument':
+    _importModule('pyinstrument') # fail at startup instead of on the first profiled request
+
+  _ENABLED      = bool(enabled)
+  _PROFILE_PATH = profile_path
+  _SAMPLE_RATE  = min(max(float(sample_rate), 0.0), 1.0)
+  _PROFILER     = profiler
+  _TF_TRACE     = bool(tf_trace)
+  _MAX_PROFILES = max(int(max_profiles), 1)
+  if _ENABLED:
+    os.makedirs(_PROFILE_PATH, exist_ok=True)
+  return {'enabled': _ENABLED, 'profile_path': _PROFILE_PATH, 'sample_rate': _SAMPLE_RATE, 'profiler': _PROFILER,
+          'tf_trace': _TF_TRACE, 'max_profiles': _MAX_PROFILES}
+
+def _isProfilingEnabled():
+  """
+  _isProfilingEnabled() : Check whether request profiling is enabled
+
+                      RETURN True or False
+  """
+  return _ENABLED
+
+def _getProfilePath():
+  """
+  _getProfilePath() : Provide directory of profile artifacts
+
+                      RETURN profile path
+  """
+  return _PROFILE_PATH
+
+def _startProfile(header_value=None):
+  """
+  _startProfile() : Start profiling of the current request when it has the profile header (any value except '', '0' or 'false')
+                    or when it is picked by the sample rate
+
+                      ACCEPT header_value (value of profile header or None) as argument
+
+                      RETURN profile session or None when the request is not profiled
+  """
+  if not _ENABLED:
+    return None
+  if header_value is not None and header_value.strip().lower() not in ('', '0', 'false'):
+    trigger = 'header'
+  elif _SAMPLE_RATE and random.random() < _SAMPLE_RATE:
+    trigger = 'sample'
+  else:
+    return None
+
+  session = {'id': '%s_%d_%s' % (time.strftime('%Y%m%d-%H%M%S'), os.getpid(), uuid.uuid4().hex[:8]), 'trigger': trigger,
+             'profiler': _PROFILER, 'traced': False, 'started': time.time(), 'start': time.perf_counter()}
+  if _PROFILER == 'pyinstrument':
+    session['profile'] = _importModule('pyinstrument').Profiler()
+    session['profile'].start()
+  else:
+    session['profile'] = cProfile.Profile()
+    session['profile'].enable()
+  session['token'] = _SESSION.set(session)
+  return session
+
+@contextlib.contextmanager
+def _traceStep():
+  """
+  _traceStep() : Context manager around the predict step. When the current request is profiled (and no other trace is running)
+                 the step is traced by TensorFlow profiler into <id>_tf/, it is skipped when inference runs in inference pool processes
+  """
+  session = _SESSION.get() if _ENABLED and _TF_TRACE else None
+  if session is not None and not session['traced'] and _isPoolRunning():
+    session['trace_error'] = 'inference runs in inference pool processes, predict step is not traced'
+    yield
+    return
+  if session is None or session['traced'] or not _TRACE_LOCK.acquire(blocking=False):
+    yield
+    return
+
+  try:
+    tf = _getTensorflow()
+    tf.profiler.experimental.start(os.path.join(_PROFILE_PATH, session['id'] + '_tf'))
+  except Exception as error: # profiler is not available or already started by another tool
+    _TRACE_LOCK.release()
+    session['trace_error'] = '%s: %s' % (type(error).__name__, error)
+    yield
+    return
+
+  try:
+    yield
+  finally:
+    try:
+      tf.profiler.experimental.stop()
+      session['traced'] = True
+    finally:
+      _TRACE_LOCK.release()
+
+def _finishProfile(session, route, method, status):
+  """
+  _finishProfile() : Stop profiling of a request and save its artifacts and metadata into profile path
+
+                      ACCEPT profile session, route, method and status code of the request as argument
+
+                      RETURN profile metadata
+
+                      RETURN EXAMPLE :
+
+                                      * METADATA : {'id': '20261018-130512_4121_9f86d081', 'route': '/pred_select', 'method': 'POST', 'status': 200,
+                                                    'trigger': 'header', 'profiler': 'cprofile', 'duration_ms': 84.2, 'created': 1792328712.4,
+                                                    'files': ['20261018-130512_4121_9f86d081.prof', '20261018-130512_4121_9f86d081.txt'],
+                                                    'tf_trace': '20261018-130512_4121_9f86d081_tf'}
+  """
+  duration = time.perf_counter() - session['start']
+  _SESSION.reset(session['token'])
+  base     = os.path.join(_PROFILE_PATH, session['id'])
+  files    = []
+
+  if session['profiler'] == 'pyinstrument':
+    session['profile'].stop()
+    with open(base + '.html', 'w') as opened_file:
+      opened_file.write(session['profile'].output_html())
+    files.append(session['id'] + '.html')
+  else:
+    session['profile'].disable()
+    session['profile'].dump_stats(base + '.prof')
+    summary = io.StringIO()
+    pstats.Stats(session['profile'], stream=summary).sort_stats('cumulative').print_stats(60)
+    with open(base + '.txt', 'w') as opened_file:
+      opened_file.write(summary.getvalue())
+    files.extend([session['id'] + '.prof', session['id'] + '.txt'])
+
+  metadata = {'id': session['id'], 'route': route, 'method': method, 'status': status, 'trigger': session['trigger'],
+              'profiler': session['profiler'], 'duration_ms': round(duration * 1000, 3), 'created': session['started'],
+              'files': files, 'tf_trace': session['id'] + '_tf' if session['traced'] else None}
+  if 'trace_error' in session:
+    metadata['tf_trace_error'] = session['trace_error']
+  with open(base + '.json', 'w') as opened_file:
+    json.dump(metadata, opened_file)
+
+  _pruneProfiles()
+  return metadata
+
+def _getProfileIndex():
+  """
+  _getProfileIndex() : Provide metadata of saved profiles, newest first
+
+                      RETURN list of profile metadata (see _finishProfile)
+  """
+  profiles = []
+  for metadata_file in glob.glob(os.path.join(_PROFILE_PATH, '*.json')):
+    try:
+      with open(metadata_file, 'r') as opened_file:
+        profiles.append(json.load(opened_file))
+    except (OSError, ValueError): # removed by another worker
+      continue
+  return sorted(profiles, key=lambda metadata: metadata.get('created', 0), reverse=True)
+
+def _pruneProfiles():
+  """
+  _pruneProfiles() : Remove artifacts of profiles older than the newest max profiles
+
+                      RETURN list of removed profile id
+  """
+  with _PROFILING_LOCK:
+    removed = [metadata['id'] for metadata in _getProfileIndex()[_MAX_PROFILES:]]
+    for profile_id in removed:
+      for artifact in glob.glob(os.path.join(_PROFILE_PATH, profile_id + '*')):
+        if os.path.isdir(artifact):
+          shutil.rmtree(artifact, ignore_errors=True)
+        else:
+          with contextlib.suppress(FileNotFoundError):
+            os.remove(artifact)
+  return removed
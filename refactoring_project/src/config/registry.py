@@ -0,0 +1,229 @@
+"""
+
+DOCUMENTATION:
+
+registry is part of configuration layer. It keeps every loaded model inside process memory, so each model in
+static/model/ folder is deserialized only once and reused by every request (and every thread) of the worker.
+Each registry entry also keeps model metadata (input layer, image size and model size) that is calculated once
+when the model is loaded. When total size of loaded models is bigger than the memory budget, the least recently
+used model would be evicted from the registry.
+
+"""
+# python package
+import threading
+import time
+from collections import OrderedDict
+
+# internal package
+from src.config import backends
+from src.config import metrics
+from src.infra import infra
+
+# Initialize Global alias
+_getImageSizeFromModel          = infra._getImageSizeFromModel
+_getModelSizeInBytes            = infra._getModelSizeInBytes
+_getBackendName                 = backends._getBackendName
+_incrementCounter               = metrics._incrementCounter
+_observeHistogram               = metrics._observeHistogram
+
+# Initialize registry state
+_MEMORY_BUDGET                  = 1024 * 1024 * 1024 # default budget is 1 GB of loaded model weights
+_REGISTRY                       = OrderedDict() # registry key -> registry entry (ordered from least to most recently used)
+_METADATA                       = {} # id of loaded model -> registry entry
+_LOADING_LOCKS                  = {} # registry key -> lock, used to make sure each model only loaded once
+_REGISTRY_LOCK                  = threading.RLock()
+
+def _setMemoryBudget(budget_bytes):
+  """
+  _setMemoryBudget() : Set maximum size (in bytes) of all loaded model that may be kept in the registry.
+                       Least recently used model would be evicted right away when the registry already exceed the new budget.
+
+                      ACCEPT budget_bytes as argument
+
+                      RETURN current memory budget in bytes
+  """
+  global _MEMORY_BUDGET
+  with _REGISTRY_LOCK:
+    _MEMORY_BUDGET = int(budget_bytes)
+    _evictLeastRecentlyUsed()
+  return _MEMORY_BUDGET
+
+def _buildRegistryEntry(key, model, load_time, fingerprint=None):
+  """
+  _buildRegistryEntry() : Provide a registry entry of loaded model. Model metadata is calculated here once,
+                          so it does not need to be calculated again from model.layers on every request.
+
+                      ACCEPT registry key, loaded model, load_time and fingerprint of model files as argument
+
+                      RETURN registry entry dictionary
+
+                      RETURN EXAMPLE :
+
+                                      * ENTRY : {
+                                                  'key': ('static/model/', 'BALANCE_model'),
+                                                  'model': <keras.engine.sequential.Sequential object at 0x000002C8C8AB8550>,
+                                                  'input_layer': <keras.layers.convolutional.Conv2D object at 0x000002C8C8AB8A90>,
+                                                  'backend': 'keras',
+                                                  'image_size': (224, 224),
+                                                  'size': 80123904,
+                                                  'load_time': 2.4521,
+                                                  'fingerprint': '3f2a9c1d7b4e8f60',
+                                                  'hits': 0
+                                                }
+  """
+  input_layer, image_size = _getImageSizeFromModel(model, 0, 1, 3)
+  entry = {
+    'key'         : key,
+    'model'       : model,
+    'input_layer' : input_layer,
+    'backend'     : _getBackendName(model),
+    'image_size'  : tuple(image_size),
+    'size'        : _getModelSizeInBytes(model),
+    'load_time'   : load_time,
+    'fingerprint' : fingerprint,
+    'hits'        : 0,
+  }
+  return entry
+
+def _evictLeastRecentlyUsed():
+  """
+  _evictLeastRecentlyUsed() : Evict least recently used model until total size of loaded model fit the memory budget.
+                              The most recently used model is always kept, even when its size is bigger than the budget.
+                              Caller should hold _REGISTRY_LOCK.
+
+                      RETURN list of evicted registry key
+  """
+  evicted    = []
+  total_size = sum(entry['size'] for entry in _REGISTRY.values())
+
+  while total_size > _MEMORY_BUDGET and len(_REGISTRY) > 1:
+    key, entry = _REGISTRY.popitem(last=False) # pop least recently used model
+    _METADATA.pop(id(entry['model']), None)
+    total_size -= entry['size']
+    evicted.append(key)
+
+  return evicted
+
+def _acquireModel(key, loader, fingerprint=None):
+  """
+  _acquireModel() : Provide loaded model from the registry. The model is loaded by loader() only when it does not
+                    exist in the registry yet (or its fingerprint is changed, which means model file is changed).
+                    Concurrent request for the same model would wait for the first load instead of loading the same model twice.
+
+                      ACCEPT registry key (tuple of model path and model name), loader function and fingerprint of model files as argument
+
+                      RETURN loaded model
+
+                      RETURN EXAMPLE :
+
+                                      * LOADED_MODEL :  <keras.engine.sequential.Sequential object at 0x000002C8C8AB8550>
+  """
+  with _REGISTRY_LOCK:
+    entry = _REGISTRY.get(key)
+    if entry is not None and entry['fingerprint'] != fingerprint: # model file is changed, evict outdated model
+      _REGISTRY.pop(key)
+      _METADATA.pop(id(entry['model']), None)
+      entry = None
+    if entry is not None: # registry hit, mark model as most recently used
+      _REGISTRY.move_to_end(key)
+      entry['hits'] += 1
+      _incrementCounter('ml_cache_lookups_total', {'cache': 'registry', 'result': 'hit'})
+      return entry['model']
+    loading_lock = _LOADING_LOCKS.setdefault(key, threading.Lock())
+
+  with loading_lock:
+    with _REGISTRY_LOCK: # model might be loaded by another thread while this thread waiting
+      entry = _REGISTRY.get(key)
+      if entry is not None and entry['fingerprint'] == fingerprint:
+        _REGISTRY.move_to_end(key)
+        entry['hits'] += 1
+        _incrementCounter('ml_cache_lookups_total', {'cache': 'registry', 'result': 'hit'})
+        return entry['model']
+
+    start = time.perf_counter()
+    model = loader() # load model outside registry lock, so other models still can be acquired
+    entry = _buildRegistryEntry(key, model, time.perf_counter() - start, fingerprint)
+    _incrementCounter('ml_cache_lookups_total', {'cache': 'registry', 'result': 'miss'})
+    _observeHistogram('ml_model_load_duration_seconds', entry['load_time'], {'model': key[1], 'backend': entry['backend']})
+
+    with _REGISTRY_LOCK:
+      outdated = _REGISTRY.pop(key, None) # outdated model evicted by another thread
+      if outdated is not None:
+        _METADATA.pop(id(outdated['model']), None)
+      _REGISTRY[key]          = entry
+      _METADATA[id(model)]    = entry
+      _LOADING_LOCKS.pop(key, None)
+      _evictLeastRecentlyUsed()
+
+  return model
+
+def _getModelMetadata(model):
+  """
+  _getModelMetadata() : Provide registry entry of a loaded model. It would return None when the model is not
+                        (or no longer) kept by the registry.
+
+                      ACCEPT loaded model as argument
+
+                      RETURN registry entry or None
+  """
+  with _REGISTRY_LOCK:
+    entry = _METADATA.get(id(model))
+  if entry is not None and entry['model'] is model:
+    return entry
+  return None
+
+def _evictModel(key):
+  """
+  _evictModel() : Remove a model from the registry, the model would be loaded again on the next request.
+
+                      ACCEPT registry key as argument
+
+                      RETURN True when the model was in the registry else False
+  """
+  with _REGISTRY_LOCK:
+    entry = _REGISTRY.pop(key, None)
+    if entry is None:
+      return False
+    _METADATA.pop(id(entry['model']), None)
+  return True
+
+def _clearRegistry():
+  """
+  _clearRegistry() : Remove all loaded models from the registry.
+  """
+  with _REGISTRY_LOCK:
+    _REGISTRY.clear()
+    _METADATA.clear()
+
+def _getRegistryInfo():
+  """
+  _getRegistryInfo() : Provide summary of the registry (memory budget, total size and each loaded model information)
+
+                      RETURN dictionary of registry information
+
+                      RETURN EXAMPLE :
+
+                                      * INFO : {
+                                                 'budget': 1073741824,
+                                                 'size': 80123904,
+                                                 'models': [{'path': 'static/model/', 'name': 'BALANCE_model', 'backend': 'keras', 'image_size': (224, 224),
+                                                             'size': 80123904, 'load_time': 2.4521, 'hits': 12}]
+                                               }
+  """
+  with _REGISTRY_LOCK:
+    models = [{
+      'path'       : entry['key'][0],
+      'name'       : entry['key'][1],
+      'backend'    : entry['backend'],
+      'image_size' : entry['image_size'],
+      'size'       : entry['size'],
+      'load_time'  : round(entry['load_time'], 4),
+      'hits'       : entry['hits'],
+    } for entry in _REGISTRY.values()]
+
+  info = {
+    'budget' : _MEMORY_BUDGET,
+    'size'   : sum(model['size'] for model in models),
+    'models' : models,
+  }
+  return info
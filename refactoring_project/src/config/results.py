@@ -0,0 +1,280 @@
+"""
+
+DOCUMENTATION:
+
+results is part of configuration layer. It provides a content-addressed cache of prediction results keyed by
+(hash of image bytes, model, fingerprint of model files, preprocessing mode). Resubmitting the same scan, or comparing
+it against more models, only predicts the models which have not predicted the image yet. Results are kept in memory
+(least recently used result is evicted first) and optionally persisted as small json files, so they survive restart.
+A changed model file has a new fingerprint, so its old results are never used again and are removed.
+
+"""
+# python package
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+
+# internal package
+from src.infra import infra
+
+# Initialize Global alias
+_getFilePathAndName             = infra._getFilePathAndName
+_getFileModifiedTime            = infra._getFileModifiedTime
+_writeFileBytes                 = infra._writeFileBytes
+_getBytesDigest                 = infra._getBytesDigest
+
+# Initialize result cache state
+_ENABLED                        = True
+_MAX_ENTRIES                    = 4096 # results kept in memory
+_CACHE_PATH                     = None # directory of persisted results, None means results are only kept in memory
+_RESULTS                        = OrderedDict() # result key -> (prediction, run time)
+_FINGERPRINTS                   = {} # (model path, model name) -> latest known fingerprint of model files
+_DIGESTS                        = {} # (normalized image path, modified time) -> digest of image file
+_STATS                          = {'hits': 0, 'disk_hits': 0, 'misses': 0, 'stores': 0, 'evictions': 0, 'invalidations': 0}
+_RESULTS_LOCK                   = threading.Lock()
+
+class _CachedTime(float):
+  """
+  _CachedTime : prediction time of a result taken from result cache. It is the time measured when the result was predicted,
+                and it can be used as a float (min, max, division) by result pages, which show it with a (cached) mark.
+  """
+  cached = True
+
+def _setResultCache(enabled=True, max_entries=4096, cache_path=None):
+  """
+  _setResultCache() : Configure result cache. Use cache_path None to keep results in memory only.
+
+                      ACCEPT enabled, max_entries (results kept in memory) and cache_path as argument
+
+                      RETURN dictionary of current configuration
+
+                      RETURN EXAMPLE :
+
+                                      * CONFIG : {'enabled': True, 'max_entries': 4096, 'cache_path': 'cache/results/'}
+  """
+  global _ENABLED, _MAX_ENTRIES, _CACHE_PATH
+  if cache_path:
+    os.makedirs(cache_path, exist_ok=True)
+
+  with _RESULTS_LOCK:
+    _ENABLED      = bool(enabled)
+    _MAX_ENTRIES  = max(int(max_entries), 1)
+    _CACHE_PATH   = cache_path
+    while len(_RESULTS) > _MAX_ENTRIES:
+      _RESULTS.popitem(last=False)
+  return {'enabled': _ENABLED, 'max_entries': _MAX_ENTRIES, 'cache_path': _CACHE_PATH}
+
+def _getImageDigest(image_file):
+  """
+  _getImageDigest() : Provide content hash of an image (image bytes or image path). Digest of an image path is kept until the file is changed.
+
+                      ACCEPT image_file (image path or image bytes) as argument
+
+                      RETURN hexadecimal digest or None when result cache is disabled
+
+                      RETURN EXAMPLE :
+
+                                      * DIGEST : '9f86d081884c7d659a2feaa0c55ad015a3bf4f1b2b0b822cd15d6c15b0f00a08'
+  """
+  if not _ENABLED:
+    return None
+  if not isinstance(image_file, str):
+    return _getBytesDigest(image_file)
+
+  key = (os.path.normpath(image_file), _getFileModifiedTime(image_file))
+  with _RESULTS_LOCK:
+    digest = _DIGESTS.get(key)
+  if digest is None:
+    with open(image_file, 'rb') as opened_file:
+      digest = _getBytesDigest(opened_file.read())
+    with _RESULTS_LOCK:
+      if len(_DIGESTS) >= _MAX_ENTRIES:
+        _DIGESTS.clear()
+      _DIGESTS[key] = digest
+  return digest
+
+def _getResultFilePrefix(model_key):
+  """
+  _getResultFilePrefix() : Provide file name prefix of persisted results of a model
+
+                      ACCEPT model_key (tuple of model path and model name) as argument
+
+                      RETURN file name prefix
+
+                      RETURN EXAMPLE :
+
+                                      * PREFIX : 'BALANCE_model_5f0b6b6c1f9e_'
+  """
+  return '%s_%s_' % (model_key[1], hashlib.sha1(repr(model_key).encode('utf-8')).hexdigest()[:12])
+
+def _getResultFile(key):
+  """
+  _getResultFile() : Provide json file path of persisted result, file name is prefix of the model, fingerprint and a hash of the result key
+
+                      ACCEPT result key as argument
+
+                      RETURN file path or None when cache path is not set
+
+                      RETURN EXAMPLE :
+
+                                      * RESULT_FILE : 'cache/results/BALANCE_model_5f0b6b6c1f9e_3f2a9c1d7b4e8f60_0e5f4a3b6b6c1f9e.json'
+  """
+  if not _CACHE_PATH:
+    return None
+  digest = hashlib.sha1(repr(key).encode('utf-8')).hexdigest()[:16]
+  return _getFilePathAndName(_CACHE_PATH, '%s%s_%s.json' % (_getResultFilePrefix(key[1]), key[2], digest))
+
+def _invalidateModelResults(model_key, fingerprint):
+  """
+  _invalidateModelResults() : Remove results of a model predicted with other model files than fingerprint, from memory and from disk.
+                              Caller should hold _RESULTS_LOCK.
+
+                      ACCEPT model_key (tuple of model path and model name) and fingerprint as argument
+
+                      RETURN number of removed result
+  """
+  outdated = [key for key in _RESULTS if key[1] == model_key and key[2] != fingerprint]
+  for key in outdated:
+    _RESULTS.pop(key, None)
+
+  removed = len(outdated)
+  if _CACHE_PATH and os.path.isdir(_CACHE_PATH):
+    prefix = _getResultFilePrefix(model_key)
+    for file_name in os.listdir(_CACHE_PATH):
+      if file_name.startswith(prefix) and not file_name.startswith(prefix + fingerprint + '_'):
+        try:
+          os.remove(_getFilePathAndName(_CACHE_PATH, file_name))
+          removed += 1
+        except FileNotFoundError: # removed by another worker
+          continue
+  return removed
+
+def _getResultKey(image_digest, model_key, fingerprint, mode):
+  """
+  _getResultKey() : Provide result key of an image predicted by a model. When a model file is changed (new fingerprint)
+                    its outdated results are removed.
+
+                      ACCEPT image_digest, model_key (tuple of model path and model name), fingerprint of model files and mode ('rgb' or 'gray') as argument
+
+                      RETURN result key or None when image digest or fingerprint is missing (cache disabled or unknown model)
+
+                      RETURN EXAMPLE :
+
+                                      * KEY : ('9f86d081884c7d65...', ('static/model/', 'BALANCE_model'), '3f2a9c1d7b4e8f60', 'rgb')
+  """
+  if image_digest is None or fingerprint is None:
+    return None
+
+  with _RESULTS_LOCK:
+    known = _FINGERPRINTS.get(model_key)
+    if known != fingerprint:
+      _FINGERPRINTS[model_key] = fingerprint
+      if known is not None or _CACHE_PATH: # also remove results persisted by a previous run
+        _STATS['invalidations'] += _invalidateModelResults(model_key, fingerprint)
+
+  return (image_digest, model_key, fingerprint, mode)
+
+def _getCachedResult(key):
+  """
+  _getCachedResult() : Provide cached result of a result key, from memory then from persisted json file
+
+                      ACCEPT result key as argument
+
+                      RETURN (prediction, run time marked as cached) or None when result is not cached
+
+                      RETURN EXAMPLE :
+
+                                      * RESULT : ([0.003, 99.987, 0.01], 0.1728)
+  """
+  if key is None:
+    return None
+
+  with _RESULTS_LOCK:
+    result = _RESULTS.get(key)
+    if result is not None:
+      _RESULTS.move_to_end(key)
+      _STATS['hits'] += 1
+      return list(result[0]), _CachedTime(result[1])
+
+  result_file = _getResultFile(key)
+  if result_file and os.path.exists(result_file):
+    try:
+      with open(result_file, 'r') as opened_file:
+        persisted = json.load(opened_file)
+      result = (tuple(persisted['prediction']), persisted['run_time'])
+    except (OSError, ValueError, KeyError): # file is removed or broken, predict again
+      result = None
+
+  with _RESULTS_LOCK:
+    if result is None:
+      _STATS['misses'] += 1
+      return None
+    _STATS['disk_hits'] += 1
+    _storeResult(key, result)
+  return list(result[0]), _CachedTime(result[1])
+
+def _storeResult(key, result):
+  """
+  _storeResult() : Keep result in memory and evict least recently used results above max entries. Caller should hold _RESULTS_LOCK.
+
+                      ACCEPT result key and result (prediction, run time) as argument
+  """
+  _RESULTS[key] = result
+  _RESULTS.move_to_end(key)
+  while len(_RESULTS) > _MAX_ENTRIES:
+    _RESULTS.popitem(last=False)
+    _STATS['evictions'] += 1
+
+def _putCachedResult(key, prediction, run_time):
+  """
+  _putCachedResult() : Keep predicted result in result cache (and persist it when cache path is set)
+
+                      ACCEPT result key, prediction and run_time as argument
+  """
+  if key is None:
+    return
+
+  result = (tuple(float(value) for value in prediction), float(run_time))
+  with _RESULTS_LOCK:
+    _storeResult(key, result)
+    _STATS['stores'] += 1
+
+  result_file = _getResultFile(key)
+  if result_file:
+    _writeFileBytes(result_file, json.dumps({'prediction': result[0], 'run_time': result[1]}).encode('utf-8'))
+
+def _markCachedTime(run_times, cached):
+  """
+  _markCachedTime() : Provide run times of several results, run time of a result taken from result cache is marked as cached
+
+                      ACCEPT run_times (list of run time) and cached (list of True when the result was taken from result cache) as argument
+
+                      RETURN list of run time
+
+                      RETURN EXAMPLE :
+
+                                      * RUN_TIMES : [0.1728 (cached), 0.0864]
+  """
+  return [_CachedTime(run_time) if is_cached else run_time for run_time, is_cached in zip(run_times, cached)]
+
+def _getResultCacheInfo():
+  """
+  _getResultCacheInfo() : Provide configuration and hit / miss counters of result cache
+
+                      RETURN dictionary of result cache information
+
+                      RETURN EXAMPLE :
+
+                                      * INFO : {'enabled': True, 'max_entries': 4096, 'cache_path': 'cache/results/', 'entries': 12,
+                                                'hits': 30, 'disk_hits': 2, 'misses': 12, 'stores': 12, 'evictions': 0, 'invalidations': 0,
+                                                'hit_rate': 0.7273}
+  """
+  with _RESULTS_LOCK:
+    info = {'enabled': _ENABLED, 'max_entries': _MAX_ENTRIES, 'cache_path': _CACHE_PATH, 'entries': len(_RESULTS)}
+    info.update(_STATS)
+
+  lookups           = info['hits'] + info['disk_hits'] + info['misses']
+  info['hit_rate']  = round((info['hits'] + info['disk_hits']) / lookups, 4) if lookups else 0.0
+  return info
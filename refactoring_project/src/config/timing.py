@@ -0,0 +1,171 @@
+"""
+
+DOCUMENTATION:
+
+timing is part of configuration layer. It measures where the time of a request goes, stage by stage:
+
+            * decode     : image file opened and decoded into an array
+            * preprocess : resize, color conversion and normalize into the model tensor
+            * model      : loaded model taken from model registry (loaded from disk and warmed up on first use)
+            * inference  : forward pass of the model (including micro-batching queue wait)
+            * postprocess: prediction rounded into percentage
+            * render     : result page or json response rendered
+
+Each stage is measured with time.perf_counter_ns and added into the timing scope of the current request. The scope is a
+context variable, so concurrent requests never mix their stages and compare threads add into the scope of their request.
+When stage timing is disabled no scope is opened, and a stage only reads the clock twice. Prediction time shown on result
+pages is the inference stage. Total time of each stage over every request of the worker is kept for /stats.
+
+"""
+# python package
+import contextvars
+import threading
+import time
+
+# Initialize stage timing state
+_STAGES                         = ('decode', 'preprocess', 'model', 'inference', 'postprocess', 'render')
+_ENABLED                        = True
+_SCOPE                          = contextvars.ContextVar('timing_scope', default=None) # {'started': perf_counter_ns, 'stages': name -> [nanoseconds, calls]}
+_TOTALS                         = {} # stage name -> {'calls', 'nanoseconds', 'max_nanoseconds'} over every finished scope
+_SCOPES                         = {'finished': 0}
+_TIMING_LOCK                    = threading.Lock()
+
+class _StageTimer:
+  """
+  _StageTimer : Context manager which measures one stage with perf_counter_ns. Elapsed time is kept in elapsed (nanoseconds)
+                and added into the timing scope of the current request, if there is one.
+  """
+  __slots__ = ('name', 'start', 'elapsed')
+
+  def __init__(self, name):
+    self.name    = name
+    self.start   = 0
+    self.elapsed = 0
+
+  def __enter__(self):
+    self.start   = time.perf_counter_ns()
+    return self
+
+  def __exit__(self, *exc_info):
+    self.elapsed = time.perf_counter_ns() - self.start
+    scope        = _SCOPE.get()
+    if scope is not None:
+      with _TIMING_LOCK:
+        record     = scope['stages'].setdefault(self.name, [0, 0])
+        record[0] += self.elapsed
+        record[1] += 1
+    return False
+
+def _setStageTiming(enabled=True):
+  """
+  _setStageTiming() : Enable or disable per request stage timing
+
+                      ACCEPT enabled as argument
+
+                      RETURN enabled
+  """
+  global _ENABLED
+  _ENABLED = bool(enabled)
+  return _ENABLED
+
+def _stageTimer(name):
+  """
+  _stageTimer() : Provide a stage timer, use it as context manager around the stage
+
+                      ACCEPT stage name as argument
+
+                      RETURN _StageTimer
+
+                      RETURN EXAMPLE :
+
+                                      * with _stageTimer('decode') as timer: ... -> timer.elapsed : 812345 (nanoseconds)
+  """
+  return _StageTimer(name)
+
+def _startTimingScope():
+  """
+  _startTimingScope() : Open timing scope of a request in the current context, nothing is opened when stage timing is disabled
+
+                      RETURN context token (None when stage timing is disabled)
+  """
+  if not _ENABLED:
+    return None
+  return _SCOPE.set({'started': time.perf_counter_ns(), 'stages': {}})
+
+def _finishTimingScope(token):
+  """
+  _finishTimingScope() : Close timing scope of a request, its stages are added into worker totals
+
+                      ACCEPT context token of _startTimingScope as argument
+
+                      RETURN stage timings of the request (see _getStageTimings) or None when no scope was opened
+  """
+  if token is None:
+    return None
+  timings = _getStageTimings()
+  scope   = _SCOPE.get()
+  _SCOPE.reset(token)
+
+  with _TIMING_LOCK:
+    _SCOPES['finished'] += 1
+    for name, (nanoseconds, calls) in scope['stages'].items():
+      total                    = _TOTALS.setdefault(name, {'calls': 0, 'nanoseconds': 0, 'max_nanoseconds': 0})
+      total['calls']          += calls
+      total['nanoseconds']    += nanoseconds
+      total['max_nanoseconds'] = max(total['max_nanoseconds'], nanoseconds)
+  return timings
+
+def _getStageTimings():
+  """
+  _getStageTimings() : Provide stage timings (milliseconds) measured so far by the current request. Stages run by concurrent compare
+                       threads are summed, so their total can be larger than elapsed time.
+
+                      RETURN dictionary of stage timings or None when there is no timing scope
+
+                      RETURN EXAMPLE :
+
+                                      * TIMINGS : {'stages': {'decode': {'ms': 3.1021, 'calls': 1}, 'preprocess': {'ms': 0.4112, 'calls': 2},
+                                                              'model': {'ms': 0.0123, 'calls': 1}, 'inference': {'ms': 4.8802, 'calls': 2}},
+                                                   'elapsed_ms': 9.2817}
+  """
+  scope = _SCOPE.get()
+  if scope is None:
+    return None
+  with _TIMING_LOCK:
+    stages = {name: {'ms': round(nanoseconds / 1e6, 4), 'calls': calls} for name, (nanoseconds, calls) in scope['stages'].items()}
+  ordered = {name: stages.pop(name) for name in _STAGES if name in stages}
+  ordered.update(stages)
+  return {'stages': ordered, 'elapsed_ms': round((time.perf_counter_ns() - scope['started']) / 1e6, 4)}
+
+def _getServerTimingHeader(timings):
+  """
+  _getServerTimingHeader() : Provide Server-Timing http header value of stage timings, shown by browser developer tools
+
+                      ACCEPT stage timings (see _getStageTimings) as argument
+
+                      RETURN header value
+
+                      RETURN EXAMPLE :
+
+                                      * HEADER : 'decode;dur=3.102, preprocess;dur=0.411, inference;dur=4.88, total;dur=9.282'
+  """
+  entries = ['%s;dur=%s' % (name, round(stage['ms'], 3)) for name, stage in timings['stages'].items()]
+  entries.append('total;dur=%s' % round(timings['elapsed_ms'], 3))
+  return ', '.join(entries)
+
+def _getTimingInfo():
+  """
+  _getTimingInfo() : Provide stage timing configuration and total time of each stage over every finished request of the worker
+
+                      RETURN dictionary of stage timing information
+
+                      RETURN EXAMPLE :
+
+                                      * INFO : {'enabled': True, 'requests': 120,
+                                                'stages': {'decode': {'calls': 40, 'total_ms': 121.3, 'mean_ms': 3.0325, 'max_ms': 9.81}}}
+  """
+  with _TIMING_LOCK:
+    stages = {name: {'calls': total['calls'], 'total_ms': round(total['nanoseconds'] / 1e6, 4),
+                     'mean_ms': round(total['nanoseconds'] / 1e6 / total['calls'], 4) if total['calls'] else 0.0,
+                     'max_ms': round(total['max_nanoseconds'] / 1e6, 4)} for name, total in _TOTALS.items()}
+    return {'enabled': _ENABLED, 'requests': _SCOPES['finished'], 'stages': stages}
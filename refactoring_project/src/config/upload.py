@@ -0,0 +1,88 @@
+"""
+
+DOCUMENTATION:
+
+upload is part of configuration layer. Uploaded images are decoded straight from the request bytes in memory.
+Only the preview shown on result page is written into static/queryUpload/ folder, using a content-addressed file name
+(hash of the image bytes), so concurrent requests and workers never overwrite each other image. Previews are removed
+after their time to live (TTL) is over.
+
+"""
+# python package
+import os
+import threading
+import time
+
+# internal package
+from src.infra import infra
+
+# Initialize Global alias
+_getFilePathAndName             = infra._getFilePathAndName
+_getFileExtension               = infra._getFileExtension
+_writeFileBytes                 = infra._writeFileBytes
+_getBytesDigest                 = infra._getBytesDigest
+_removeExpiredFiles             = infra._removeExpiredFiles
+
+# Initialize upload state
+_PREVIEW_TTL                    = 600 # seconds a preview is kept after its last use
+_CLEANUP_INTERVAL               = 60 # minimum seconds between two cleanups of preview folder
+_PREVIEW_EXTENSIONS             = ('.jpg', '.jpeg', '.png', '.bmp', '.gif', '.tif', '.tiff', '.webp')
+_PREVIEW_PREFIX                 = 'upload_'
+_LAST_CLEANUP                   = {'time': 0.0}
+_UPLOAD_LOCK                    = threading.Lock()
+
+def _setPreviewTTL(ttl_seconds):
+  """
+  _setPreviewTTL() : Set time to live (in seconds) of uploaded image previews
+
+                      ACCEPT ttl_seconds as argument
+
+                      RETURN ttl_seconds
+  """
+  global _PREVIEW_TTL
+  _PREVIEW_TTL = max(int(ttl_seconds), 1)
+  return _PREVIEW_TTL
+
+def _cleanupPreviews(upload_path):
+  """
+  _cleanupPreviews() : Remove expired previews from upload folder. Cleanup runs at most once every cleanup interval,
+                       only content-addressed previews are removed.
+
+                      ACCEPT upload_path as argument
+
+                      RETURN list of removed file
+  """
+  now = time.time()
+  with _UPLOAD_LOCK:
+    if now - _LAST_CLEANUP['time'] < _CLEANUP_INTERVAL:
+      return []
+    _LAST_CLEANUP['time'] = now
+
+  removed = _removeExpiredFiles(upload_path, _PREVIEW_PREFIX, now - _PREVIEW_TTL)
+  return removed
+
+def _savePreview(image_bytes, file_name, upload_path):
+  """
+  _savePreview() : Save preview of uploaded image into upload folder with content-addressed file name.
+                   When the same image is already saved its file is reused (and its TTL is renewed) instead of written again.
+
+                      ACCEPT image_bytes, original file_name and upload_path as argument
+
+                      RETURN preview file path
+
+                      RETURN EXAMPLE :
+
+                                      * PREVIEW : 'static/queryUpload/upload_9f86d081884c7d659a2feaa0c55ad015.jpg'
+  """
+  extension = _getFileExtension(file_name or '').lower()
+  if extension not in _PREVIEW_EXTENSIONS:
+    extension = '.jpg'
+
+  preview = _getFilePathAndName(upload_path, _PREVIEW_PREFIX + _getBytesDigest(image_bytes)[:32] + extension)
+  try:
+    os.utime(preview) # preview already exists, renew its TTL
+  except FileNotFoundError:
+    _writeFileBytes(preview, image_bytes)
+
+  _cleanupPreviews(upload_path)
+  return preview
@@ -10,11 +10,18 @@ Here is only use one rule for every functions and attributes (One Functinon One
 """
 
 # python package
+import ast
 import cv2
+import hashlib
+import io
+import json
 import numpy as np
 import os
 from PIL import Image
+import threading
 import time
+import urllib.parse
+import urllib.request
 
 def _getFilesFromFolder(path) -> list:
     """
@@ -30,6 +37,62 @@ def _getFilesFromFolder(path) -> list:
     list_files = os.listdir(path)
     return list_files
 
+def _getFolderModifiedTime(path) -> int:
+    """
+    Function Description :
+    
+        _getFolderModifiedTime : provide last modified time of a folder in nanoseconds
+        folder modified time is changed whenever a file is added, removed or renamed in the folder
+        
+        EXAMPLE ARGS (path = '/usr/name/')
+        
+        EXAMPLE PROSSIBLE RESULT : 1634567890123456789
+    """
+    modified_time = os.stat(path).st_mtime_ns
+    return modified_time
+
+def _getFileModifiedTime(path) -> int:
+    """
+    Function Description :
+    
+        _getFileModifiedTime : provide last modified time of a file in nanoseconds
+        
+        EXAMPLE ARGS (path = '/usr/name/image.jpg')
+        
+        EXAMPLE PROSSIBLE RESULT : 1634567890123456789
+    """
+    modified_time = os.stat(path).st_mtime_ns
+    return modified_time
+
+def _getFilesFingerprint(list_file) -> str:
+    """
+    Function Description :
+    
+        _getFilesFingerprint : provide a fingerprint of a collection of files taken from their path,
+        size and last modified time, the fingerprint is changed whenever one of the files is changed
+        
+        EXAMPLE ARGS (list_file = ['static/model/VGG_model.json', 'static/model/VGG_weight.h5'])
+        
+        EXAMPLE PROSSIBLE RESULT : '3f2a9c1d7b4e8f60'
+    """
+    stats       = [(file, os.stat(file).st_size, os.stat(file).st_mtime_ns) for file in list_file]
+    fingerprint = hashlib.sha1(repr(stats).encode('utf-8')).hexdigest()[:16]
+    return fingerprint
+
+def _getBytesDigest(data) -> str:
+    """
+    Function Description :
+
+        _getBytesDigest : provide content hash (sha256) of bytes, such image bytes
+        accept data as argument and return hexadecimal digest
+
+        EXAMPLE ARGS : (data = b'\\xff\\xd8\\xff\\xe0...')
+
+        EXAMPLE PROSSIBLE RESULT : '9f86d081884c7d659a2feaa0c55ad015a3bf4f1b2b0b822cd15d6c15b0f00a08'
+    """
+    digest = hashlib.sha256(data).hexdigest()
+    return digest
+
 def _getFilePathAndName(path, file) -> str:
     """
     Function Description :
@@ -62,6 +125,21 @@ def _getDifferentTime(startTime) -> float:
     rounded_time    = _roundFloatNumber(different_time, 4)
     return rounded_time
 
+def _getSecondsFromNanoseconds(nanoseconds) -> float:
+    """
+    Function Description :
+    
+        _getSecondsFromNanoseconds : provide seconds of a duration measured in nanoseconds
+        (such elapsed time of time.perf_counter_ns) with 4 digit decimal carracters.
+
+        EXAMPLE ARGS : (nanoseconds = 172812345)
+        
+        EXAMPLE PROSSIBLE RESULT : (0.1728)
+    """
+    seconds         = nanoseconds / 1e9
+    rounded_time    = _roundFloatNumber(seconds, 4)
+    return rounded_time
+
 def _predictData(model, file) -> list:
     """
     Function Description :
@@ -76,6 +154,20 @@ def _predictData(model, file) -> list:
     prediction = model.predict(file)[0]
     return prediction
 
+def _predictBatchData(model, batch):
+    """
+    Function Description :
+    
+        _predictBatchData : provide prediction result of every image in a batch
+        accept model and batch of preprocessed images as arguments
+
+        EXAMPLE ARGS : (model = <keras.model>, batch = <type:ndarray shape (4, 224, 224, 3)>)
+        
+        EXAMPLE PROSSIBLE RESULT : [[0.85, 0.10, 0.05], [0.01, 0.98, 0.01], ...] etc
+    """
+    predictions = model.predict(batch)
+    return predictions
+
 def _roundFloatNumber(data, decimal_length) -> float:
     """
     Function Description :
@@ -140,6 +232,64 @@ def _roundedPercentageListValue(list_data, decimal_length) -> list:
         res     = _appendListElement(res, data)
     return res
 
+def _toFloatArray(list_data):
+    """
+    Function Description :
+
+        _toFloatArray : provide float64 numpy array of a collection (such list of 
+        prediction rows), an array is returned without copy when it is already float64
+
+        EXAMPLE ARGS : (list_data = [[43.53, 56.47], [90.0, 10.0]])
+
+        EXAMPLE PROSSIBLE RESULT : array([[43.53, 56.47], [90.0, 10.0]])
+    """
+    res = np.asarray(list_data, dtype=np.float64)
+    return res
+
+def _roundedPercentageArray(array_data, decimal_length):
+    """
+    Function Description :
+
+        _roundedPercentageArray : provide rounded percentile value of every element 
+        of an array at once, accept array_data as array of any shape (such prediction 
+        result of a batch) and decimal_length as the number of decimal digit number
+
+        EXAMPLE ARGS : (array_data = [[0.43527, 0.56473], [0.9, 0.1]], decimal_length = 2)
+
+        EXAMPLE PROSSIBLE RESULT : array([[43.53, 56.47], [90.0, 10.0]])
+    """
+    percentage  = np.multiply(array_data, 100, dtype=np.float64)
+    res         = np.round(percentage, decimal_length)
+    return res
+
+def _getTopIndices(array_data, top_k):
+    """
+    Function Description :
+
+        _getTopIndices : provide index of top_k largest values along the last axis 
+        of an array, sorted from the largest value (equal values keep their order)
+
+        EXAMPLE ARGS : (array_data = [[20.0, 70.0, 10.0], [5.0, 5.0, 90.0]], top_k = 2)
+
+        EXAMPLE PROSSIBLE RESULT : array([[1, 0], [2, 0]])
+    """
+    res = np.argsort(np.negative(array_data), axis=-1, kind='stable')[..., :top_k]
+    return res
+
+def _takeByIndices(array_data, indices):
+    """
+    Function Description :
+
+        _takeByIndices : provide values of an array at indices along the last axis
+        such values of top indices of each prediction row
+
+        EXAMPLE ARGS : (array_data = [[20.0, 70.0, 10.0]], indices = [[1, 0]])
+
+        EXAMPLE PROSSIBLE RESULT : array([[70.0, 20.0]])
+    """
+    res = np.take_along_axis(np.asarray(array_data), np.asarray(indices), axis=-1)
+    return res
+
 def _splitDataByRegex(string_data, regex) -> list:
     """
     Function Description :
@@ -214,6 +364,64 @@ def _openImageFile(image_file):
     read_image      = Image.open(image_file)
     return read_image
 
+def _readImageBytes(image_file) -> bytes:
+    """
+    Function Description :
+    
+        _readImageBytes : read all bytes of an image file object (such uploaded file) from its beginning
+
+        EXAMPLE ARGS : (image_file = <FileStorage: 'image.jpg' ('image/jpeg')>)
+
+        EXAMPLE PROSSIBLE RESULT : b'\\xff\\xd8\\xff\\xe0...'
+    """
+    if hasattr(image_file, 'seek'):
+        image_file.seek(0)
+    image_bytes = image_file.read()
+    return image_bytes
+
+def _bytesToImageFile(image_bytes):
+    """
+    Function Description :
+    
+        _bytesToImageFile : wrap image bytes into in-memory file object, so it can be opened by pillow function
+
+        EXAMPLE ARGS : (image_bytes = b'\\xff\\xd8\\xff\\xe0...')
+
+        EXAMPLE PROSSIBLE RESULT : <_io.BytesIO object>
+    """
+    image_file = io.BytesIO(image_bytes)
+    return image_file
+
+def _draftImage(image, image_size):
+    """
+    Function Description :
+
+        _draftImage : configure pillow image loader to decode image at reduced resolution (JPEG DCT scaling 1/2, 1/4 or 1/8)
+        which is still equal or larger than image_size, other image formats are decoded at full resolution.
+        It must be called before image is loaded. accept image and image_size as argument and return image
+
+        EXAMPLE ARGS : (image = <image.Metadata size=4000x4000>, image_size = (224, 224))
+
+        EXAMPLE PROSSIBLE RESULT : <image.Metadata size=500x500>
+    """
+    image.draft('RGB', tuple(image_size))
+    return image
+
+def _renderImageMode(image, mode='RGB'):
+    """
+    Function Description :
+
+        _renderImageMode : convert pillow image into mode (such RGB), image which is already in that mode is returned as it is
+        accept image and mode as argument and return image
+
+        EXAMPLE ARGS : (image = <image.Metadata mode=RGBA>, mode = 'RGB')
+
+        EXAMPLE PROSSIBLE RESULT : <image.Metadata mode=RGB>
+    """
+    if image.mode != mode:
+        image = image.convert(mode)
+    return image
+
 def _imageToNumpyArray(image):
     """
     Function Description :
@@ -246,6 +454,29 @@ def _renderRGBtoGrayImage(rgb_image):
     rendered_image  = cv2.cvtColor(rgb_image, cv2.COLOR_BGR2GRAY)
     return rendered_image
 
+def _swapColorChannelsInto(image, out):
+    """
+    Function Description :
+
+        _swapColorChannelsInto : swap channel order of an image (RGB into BGR or BGR into RGB) and write the result
+        into preallocated uint8 out array (same shape as image). It gives the same values as _renderRGBImage and it is
+        cheap to apply after image is resized, the result is contiguous so the following normalize runs on contiguous memory.
+        accept image and out as argument and return out
+    """
+    swapped_image   = cv2.cvtColor(image, cv2.COLOR_RGB2BGR, dst=out)
+    return swapped_image
+
+def _renderDecodedRGBtoGrayImage(rgb_image):
+    """
+    Function Description :
+
+        _renderDecodedRGBtoGrayImage : transform RGB image (in RGB channel order as decoded by pillow) into Grayscale format.
+        It gives the same values as _renderRGBtoGrayImage of the channel swapped image.
+        accept numpy array of image and return numpy array of image
+    """
+    rendered_image  = cv2.cvtColor(rgb_image, cv2.COLOR_RGB2GRAY)
+    return rendered_image
+
 def _getImageSizeFromModel(model, index=0, buttom=0, top=-1):
     """
     Function Description :
@@ -254,7 +485,7 @@ def _getImageSizeFromModel(model, index=0, buttom=0, top=-1):
         accept model and index as argument and return a model input shape with image size 
         based on model input shape
     """
-    model_layer = model.layers
+    model_layer = getattr(model, 'layers', None) or [model] # exported model (tflite, onnx) provides input_shape itself
     model_input_shape = _getElementByIndex(model_layer, index)
     input_shape = model_input_shape.input_shape
     if type(input_shape) is list:
@@ -262,6 +493,44 @@ def _getImageSizeFromModel(model, index=0, buttom=0, top=-1):
     image_size = _getElementByIndexRange(input_shape, buttom, top)
     return model_input_shape, image_size
 
+def _getModelSizeInBytes(model, bytes_per_param=4) -> int:
+    """
+    Function Description :
+
+        _getModelSizeInBytes : provide an estimation of model weights size in memory
+        accept model and bytes_per_param (default 4 for float32 weights) as argument
+        and return number of bytes (exported model such tflite or onnx provides its file size as nbytes)
+
+        EXAMPLE ARGS : (model = <keras.model>)
+
+        EXAMPLE PROSSIBLE RESULT : 80123904
+    """
+    if hasattr(model, 'nbytes'):
+        return model.nbytes
+    res = model.count_params() * bytes_per_param
+    return res
+
+def _resizeImage(image, image_size):
+    """
+    Function Description :
+
+        _resizeImage : resize image into image_size
+        accept image and image_size as argument and return resized image
+    """
+    resized_image = cv2.resize(image, image_size)
+    return resized_image
+
+def _resizeImageInto(image, image_size, out):
+    """
+    Function Description :
+
+        _resizeImageInto : resize image into image_size and write the result into preallocated out array
+        (out shape is image_size reversed as cv2 dsize, plus image channels), it gives the same result as _resizeImage
+        accept image, image_size and out as argument and return out
+    """
+    resized_image = cv2.resize(image, image_size, dst=out)
+    return resized_image
+
 def _resizeImageByModelInputShape(image, model):
     """
     Function Description :
@@ -286,6 +555,32 @@ def _normalizeImage(image):
     normalized_image   = image.astype('float32') / 255
     return normalized_image
 
+def _normalizeImageInto(image, out):
+    """
+    Function Description :
+
+        _normalizeImageInto : normalize image into float32 range value devided by 255 and write the result 
+        into preallocated float32 out array (same shape as image), it gives the same result as _normalizeImage
+        accept image and out as argument and return out
+    """
+    normalized_image   = np.divide(image, 255, out=out, dtype=np.float32)
+    return normalized_image
+
+def _stackImageTensors(list_tensor):
+    """
+    Function Description :
+    
+        _stackImageTensors : stack a collection of preprocessed image tensors (each with batch dimension) 
+        into one batch tensor
+        accept list_tensor as argument and return stacked tensor
+
+        EXAMPLE ARGS : (list_tensor = [<type:ndarray shape (1, 224, 224, 3)>, <type:ndarray shape (1, 224, 224, 3)>])
+
+        EXAMPLE PROSSIBLE RESULT : <type:ndarray shape (2, 224, 224, 3)>
+    """
+    res = np.concatenate(list_tensor, axis=0)
+    return res
+
 def _reshapeGrayImage(image, image_size, gray_channel=(1,)):  
     """
     Function Description :
@@ -305,3 +600,220 @@ def _expandRGBImageDimensions(image, axis=0):
     """ 
     res = np.expand_dims(image, axis)
     return res
+
+def _saveNumpyArray(file_path, array):
+    """
+    Function Description :
+
+        _saveNumpyArray : save numpy array into .npy file. Array is written into temporary file 
+        first and then renamed, so another process never read a half written file
+        accept file_path and array as argument and return file_path
+
+        EXAMPLE ARGS : (file_path = 'cache/gallery/image.npy', array = <type:ndarray>)
+
+        EXAMPLE PROSSIBLE RESULT : 'cache/gallery/image.npy'
+    """
+    temp_path = '%s.%d.tmp' % (file_path, os.getpid())
+    with open(temp_path, 'wb') as temp_file:
+        np.save(temp_file, array)
+    os.replace(temp_path, file_path)
+    return file_path
+
+def _loadNumpyArray(file_path, mmap_mode=None):
+    """
+    Function Description :
+
+        _loadNumpyArray : load numpy array from .npy file, use mmap_mode='r' to map the file 
+        into memory instead of reading it
+        accept file_path and mmap_mode as argument and return numpy array
+
+        EXAMPLE ARGS : (file_path = 'cache/gallery/image.npy', mmap_mode = 'r')
+
+        EXAMPLE PROSSIBLE RESULT : <type:memmap>
+    """
+    res = np.load(file_path, mmap_mode=mmap_mode)
+    return res
+
+def _getFileExtension(file_name) -> str:
+    """
+    Function Description :
+
+        _getFileExtension : provide extension of a file name (including the dot)
+
+        EXAMPLE ARGS : (file_name = 'image.jpg')
+
+        EXAMPLE PROSSIBLE RESULT : '.jpg'
+    """
+    _, extension = os.path.splitext(file_name)
+    return extension
+
+def _readModuleConstant(file_path, name):
+    """
+    Function Description :
+
+        _readModuleConstant : read a literal constant (dict, list, number or string) assigned at top level of a python file
+        without importing it, so the module is not executed (such app.py which starts its services when it is imported)
+        accept file_path and name of the constant as argument and return value of the constant
+
+        EXAMPLE ARGS : (file_path = 'app.py', name = 'CLASS_DICT')
+
+        EXAMPLE PROSSIBLE RESULT : {'GLIOMA': 0, 'MENINGIOMA': 1, 'PITUITARY': 2}
+    """
+    with open(file_path, encoding='utf-8') as module_file:
+        tree = ast.parse(module_file.read(), file_path)
+    for node in tree.body:
+        if isinstance(node, ast.Assign) and any(isinstance(target, ast.Name) and target.id == name for target in node.targets):
+            return ast.literal_eval(node.value)
+    raise KeyError('%s is not assigned in %s' % (name, file_path))
+
+def _writeFileBytes(file_path, data):
+    """
+    Function Description :
+
+        _writeFileBytes : write bytes into a file. Bytes are written into temporary file first 
+        and then renamed, so another process never read a half written file
+        accept file_path and data as argument and return file_path
+
+        EXAMPLE ARGS : (file_path = 'static/queryUpload/image.jpg', data = b'\\xff\\xd8\\xff\\xe0...')
+
+        EXAMPLE PROSSIBLE RESULT : 'static/queryUpload/image.jpg'
+    """
+    temp_path = '%s.%d.%d.tmp' % (file_path, os.getpid(), threading.get_ident())
+    with open(temp_path, 'wb') as temp_file:
+        temp_file.write(data)
+    os.replace(temp_path, file_path)
+    return file_path
+
+def _removeExpiredFiles(path, prefix, expired_time) -> list:
+    """
+    Function Description :
+
+        _removeExpiredFiles : remove files of a folder which name starts with prefix and 
+        last modified before expired_time (unix timestamp in seconds)
+        accept path, prefix and expired_time as argument and return list of removed file
+
+        EXAMPLE ARGS : (path = 'static/queryUpload/', prefix = 'upload_', expired_time = 1634567890.0)
+
+        EXAMPLE PROSSIBLE RESULT : ['static/queryUpload/upload_9f86d081884c7d659a2feaa0c55ad015.jpg']
+    """
+    removed = []
+    for file_name in os.listdir(path):
+        file_path = os.path.join(path, file_name)
+        if not file_name.startswith(prefix):
+            continue
+        try:
+            if os.stat(file_path).st_mtime < expired_time:
+                os.remove(file_path)
+                removed.append(file_path)
+        except FileNotFoundError: # removed by another worker
+            continue
+    return removed
+
+def _isHttpUrl(url) -> bool:
+    """
+    Function Description :
+
+        _isHttpUrl : check whether url is an absolute http or https url with a host (such file:// or ftp:// are refused)
+        accept url as argument and return True or False
+
+        EXAMPLE ARGS : (url = 'http://localhost:8000/callback')
+
+        EXAMPLE PROSSIBLE RESULT : True
+    """
+    if not isinstance(url, str):
+        return False
+    try:
+        parsed = urllib.parse.urlsplit(url)
+        return parsed.scheme in ('http', 'https') and bool(parsed.hostname)
+    except ValueError: # such invalid port or ipv6 host
+        return False
+
+def _postJsonData(url, payload, timeout=5) -> int:
+    """
+    Function Description :
+
+        _postJsonData : send payload as json body of a POST request into url
+        accept url, payload (json serializable data) and timeout (in seconds) as argument 
+        and return http status code of the response, a url which is not http or https raises ValueError
+
+        EXAMPLE ARGS : (url = 'http://localhost:8000/callback', payload = {'id': '4f1c...', 'status': 'done'})
+
+        EXAMPLE PROSSIBLE RESULT : 200
+    """
+    if not _isHttpUrl(url):
+        raise ValueError('only http and https urls are allowed, got %r' % (url,))
+    body    = json.dumps(payload, default=float).encode('utf-8')
+    request = urllib.request.Request(url, data=body, headers={'Content-Type': 'application/json'}, method='POST')
+    with urllib.request.urlopen(request, timeout=timeout) as response:
+        return response.status
+
+def _isProcessAlive(pid) -> bool:
+    """
+    Function Description :
+
+        _isProcessAlive : check whether a process is still running (signal 0 only checks the process)
+        accept process id as argument and return True or False
+
+        EXAMPLE ARGS : (pid = 4121)
+
+        EXAMPLE PROSSIBLE RESULT : True
+    """
+    try:
+        os.kill(int(pid), 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError: # process of another user
+        return True
+    return True
+
+def _getResidentMemory() -> int:
+    """
+    Function Description :
+
+        _getResidentMemory : provide resident memory (in bytes) of current process, read from /proc/self/statm 
+        on linux, else peak resident memory from resource module (0 when it is not available)
+
+        EXAMPLE ARGS : ()
+
+        EXAMPLE PROSSIBLE RESULT : 734003200
+    """
+    try:
+        with open('/proc/self/statm', 'r') as statm_file:
+            return int(statm_file.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        pass
+    try:
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+    except (ImportError, OSError):
+        return 0
+
+def _getProcessMemory(pid=None) -> dict:
+    """
+    Function Description :
+
+        _getProcessMemory : provide memory (in bytes) of a process read from /proc/<pid>/smaps_rollup on linux, accept process id 
+        (None means current process) as argument and return dictionary of rss (resident pages), pss (resident pages where each 
+        shared page is divided by the number of processes sharing it), uss (private pages, freed when the process exits) and 
+        shared (resident pages shared with other processes such copy-on-write pages of gunicorn master).
+        pss, uss and shared are None when smaps_rollup is not available
+
+        EXAMPLE ARGS : (pid = None)
+
+        EXAMPLE PROSSIBLE RESULT : {'rss': 734003200, 'pss': 301989888, 'uss': 209715200, 'shared': 524288000}
+    """
+    fields = {}
+    try:
+        with open('/proc/%s/smaps_rollup' % ('self' if pid is None else int(pid)), 'r') as smaps_file:
+            for line in smaps_file:
+                parts = line.split()
+                if len(parts) == 3 and parts[2] == 'kB':
+                    fields[parts[0].rstrip(':')] = int(parts[1]) * 1024
+    except (OSError, ValueError):
+        pass
+    if 'Rss' not in fields:
+        return {'rss': _getResidentMemory() if pid is None else 0, 'pss': None, 'uss': None, 'shared': None}
+    return {'rss'    : fields['Rss'],
+            'pss'    : fields.get('Pss'),
+            'uss'    : fields.get('Private_Clean', 0) + fields.get('Private_Dirty', 0),
+            'shared' : fields.get('Shared_Clean', 0) + fields.get('Shared_Dirty', 0)}
@@ -8,32 +8,117 @@ backend as main helper to build each service.
 
 """
 
-# python package
-import time
-
 # internal package
+from src.config import backends
+from src.config import batching
+from src.config import buffers
 from src.config import config
+from src.config import engine
+from src.config import gallery
+from src.config import imports
+from src.config import jobs
+from src.config import leaderboard
+from src.config import metrics
+from src.config import parallel
+from src.config import pool
+from src.config import prefork
+from src.config import preload
+from src.config import profiling
+from src.config import registry
+from src.config import results
+from src.config import timing
+from src.config import upload
 from src.infra import infra
 
 # Initialize Global alias
 _loadSelectModel           = config._loadSelectModel
 _loadCompareModel          = config._loadCompareModel
-_grayImageProcessing       = config._grayImageProcessing
-_rgbImageProcessing        = config._rgbImageProcessing
 _getDictModel              = config._getDictModel
+_batchImageProcessing      = config._batchImageProcessing
+_setMemoryBudget           = registry._setMemoryBudget
+_getRegistryInfo           = registry._getRegistryInfo
+_getGalleryIndex           = gallery._getGalleryIndex
+_setGalleryCachePath       = gallery._setGalleryCachePath
+_getGalleryInfo            = gallery._getGalleryInfo
+_setBatchingConfig         = batching._setBatchingConfig
+_getBatchingStats          = batching._getBatchingStats
+_mapOrdered                = parallel._mapOrdered
+_setMaxWorkers             = parallel._setMaxWorkers
+_savePreview               = upload._savePreview
+_setPreviewTTL             = upload._setPreviewTTL
+_readImageBytes            = infra._readImageBytes
+_setupJobQueue             = jobs._setupJobQueue
+_startJobWorkers           = jobs._startJobWorkers
+_submitJob                 = jobs._submitJob
+_getJob                    = jobs._getJob
+_getJobQueueInfo           = jobs._getJobQueueInfo
+_interactiveRequest        = jobs._interactiveRequest
+_getModelFingerprint       = config._getModelFingerprint
+_setReducedDecode          = config._setReducedDecode
+_bufferScope               = buffers._bufferScope
+_setBufferPool             = buffers._setBufferPool
+_getBufferPoolInfo         = buffers._getBufferPoolInfo
+_setInferenceEngine        = engine._setInferenceEngine
+_getEngineInfo             = engine._getEngineInfo
+_runDummyInference         = engine._runDummyInference
+_startPreload              = preload._startPreload
+_isReady                   = preload._isReady
+_getPreloadInfo            = preload._getPreloadInfo
+_getImportInfo             = imports._getImportInfo
+_setBackendThreads         = backends._setBackendThreads
+_getImageDigest            = results._getImageDigest
+_getResultKey              = results._getResultKey
+_getCachedResult           = results._getCachedResult
+_putCachedResult           = results._putCachedResult
+_markCachedTime            = results._markCachedTime
+_setResultCache            = results._setResultCache
+_getResultCacheInfo        = results._getResultCacheInfo
+_stageTimer                = timing._stageTimer
+_setStageTiming            = timing._setStageTiming
+_startTimingScope          = timing._startTimingScope
+_finishTimingScope         = timing._finishTimingScope
+_getStageTimings           = timing._getStageTimings
+_getServerTimingHeader     = timing._getServerTimingHeader
+_getTimingInfo             = timing._getTimingInfo
+_setMetrics                = metrics._setMetrics
+_isMetricsEnabled          = metrics._isMetricsEnabled
+_addMetricsCollector       = metrics._addCollector
+_observeHistogram          = metrics._observeHistogram
+_renderMetrics             = metrics._renderMetrics
+_getQueueDepth             = batching._getQueueDepth
+_getModelName              = batching._getModelName
+_getProcessMemory          = infra._getProcessMemory
+_prepareForkServing        = prefork._prepareForkServing
+_checkForkSafety           = prefork._checkForkSafety
+_getPreforkInfo            = prefork._getPreforkInfo
+_startPool                 = pool._startPool
+_getPoolInfo               = pool._getPoolInfo
+_setProfiling              = profiling._setProfiling
+_isProfilingEnabled        = profiling._isProfilingEnabled
+_getProfilePath            = profiling._getProfilePath
+_startProfile              = profiling._startProfile
+_finishProfile             = profiling._finishProfile
+_getProfileIndex           = profiling._getProfileIndex
+_traceStep                 = profiling._traceStep
+_setLeaderboard            = leaderboard._setLeaderboard
+_getLeaderboard            = leaderboard._getLeaderboard
+_evaluateLeaderboard       = leaderboard._evaluateLeaderboard
+_startEvaluation           = leaderboard._startEvaluation
 
-_differentTime             = infra._getDifferentTime
-_getCollectionFiles        = infra._getFilesFromFolder
+_secondsFromNanoseconds    = infra._getSecondsFromNanoseconds
 _getFilePathWithName       = infra._getFilePathAndName
-_makePrediction            = infra._predictData
+_makeBatchPrediction       = batching._predictBatchedRows
 _appendListElement         = infra._appendListElement
-_roundedListValue          = infra._roundedPercentageListValue
-_getSplitedDataByIndex     = infra._getSplitedStringByIndex
+_roundedArrayValue         = infra._roundedPercentageArray
+_toFloatArray              = infra._toFloatArray
+_getTopIndices             = infra._getTopIndices
+_takeByIndices             = infra._takeByIndices
 
 def GetListOfQueryImage(path):
   """
   GetListOfQueryImage() : Provide a tuple of collection such (class name, image path, and image name)
                           This function will scan all files that contain in path folder and extract some information such (class name, image path, and image name) 
+                          The result is kept by query image gallery index and the folder is only scanned again when it is changed.
                           
                           ACCEPT path location of image file as argument
 
@@ -50,19 +135,269 @@ def GetListOfQueryImage(path):
                                                 'static/queryImage/Meningioma_1.jpg', 'static/queryImage/Pituitary_11710.png',
                                                 'static/queryImage/Pituitary_12556.png', 'static/queryImage/Pituitary_13472.png',]
   """
-  listClass = []
-  listImage = []
-  listQuery = []
-  fileCollection = _getCollectionFiles(path)
-
-  for data in fileCollection:
-    classFile     = _getSplitedDataByIndex(data, "_", 0)
-    _appendListElement(listClass, classFile)
-    _appendListElement(listImage, data)
-    fullFilePath  = _getFilePathWithName(path, data)
-    _appendListElement(listQuery, fullFilePath)
+  galleryIndex = _getGalleryIndex(path) # folder is only scanned again when it is changed
+  listClass    = galleryIndex['classes']
+  listImage    = galleryIndex['images']
+  listQuery    = galleryIndex['queries']
   return listClass, listImage, listQuery
 
+def BuildQueryImageGallery(path, cache_path=None):
+  """
+  BuildQueryImageGallery() : Build query image gallery index of path folder. Preprocessed tensor of each sample image is kept by the 
+                          gallery, so predicting a sample image would skip image decoding and preprocessing. When cache_path is set 
+                          preprocessed tensors are also persisted as .npy files, so restarted workers start warm.
+
+                          ACCEPT path location of image file and cache_path (optional) as argument
+
+                          RETURN galleryInfo
+
+                          RETURN EXAMPLE :
+
+                                 * galleryInfo : {'galleries': {'static/queryImage/': 20}, 'tensors': 0, 'cache_path': 'cache/gallery/'}
+  """
+  _setGalleryCachePath(cache_path)
+  _getGalleryIndex(path)
+  galleryInfo = _getGalleryInfo()
+  return galleryInfo
+
+def ReadUploadImage(upload_file, upload_path):
+  """
+  ReadUploadImage() : Provide bytes of uploaded image and path of its preview. The image would be predicted straight from its bytes in memory,
+                          only the preview shown on result page is saved into upload_path with a content-addressed file name, so concurrent
+                          requests never overwrite each other image. Previews are removed after their TTL (see SetUploadPreviewTTL).
+
+                          ACCEPT upload_file (uploaded file from request) and upload_path as argument
+
+                          RETURN imageBytes, previewFile
+
+                          RETURN EXAMPLE :
+
+                                 * imageBytes  : b'\\xff\\xd8\\xff\\xe0...'
+
+                                 * previewFile : 'static/queryUpload/upload_9f86d081884c7d659a2feaa0c55ad015.jpg'
+  """
+  imageBytes  = _readImageBytes(upload_file)
+  _observeHistogram('ml_upload_size_bytes', len(imageBytes))
+  previewFile = _savePreview(imageBytes, upload_file.filename, upload_path)
+  return imageBytes, previewFile
+
+def ReadUploadImageList(upload_files):
+  """
+  ReadUploadImageList() : Provide bytes of several uploaded images, the images would be predicted straight from their bytes in memory
+                          and no preview is saved (used by json api).
+
+                          ACCEPT upload_files (list of uploaded file from request) as argument
+
+                          RETURN imageNames, imageBytes
+
+                          RETURN EXAMPLE :
+
+                                 * imageNames : ['scan_01.jpg', 'scan_02.jpg']
+
+                                 * imageBytes : [b'\\xff\\xd8\\xff\\xe0...', b'\\xff\\xd8\\xff\\xe0...']
+  """
+  imageNames  = [upload_file.filename for upload_file in upload_files]
+  imageBytes  = [_readImageBytes(upload_file) for upload_file in upload_files]
+  for uploadBytes in imageBytes:
+    _observeHistogram('ml_upload_size_bytes', len(uploadBytes))
+  return imageNames, imageBytes
+
+def FindQueryImageList(path, image_names):
+  """
+  FindQueryImageList() : Provide full path of several query image samples by their name. Only samples of query image gallery 
+                          can be found, so any other file of the server is never read.
+
+                          ACCEPT path location of query image directory and image_names as argument
+
+                          RETURN imageQuery, missingNames
+
+                          RETURN EXAMPLE :
+
+                                 * imageQuery   : ['static/queryImage/Glioma_1469.png', 'static/queryImage/Meningioma_09965.png']
+
+                                 * missingNames : ['Unknown_01.png']
+  """
+  _, listImage, listQuery = GetListOfQueryImage(path)
+  queries       = dict(zip(listImage, listQuery))
+  imageQuery    = [queries[name] for name in image_names if name in queries]
+  missingNames  = [name for name in image_names if name not in queries]
+  return imageQuery, missingNames
+
+def _getPredictionKeys(choosen_model, model_path, image_digests, mode):
+  """
+  _getPredictionKeys() : Provide result cache key of each image predicted by a model, the key holds fingerprint of model files so results of
+                          a changed model file are never used again.
+
+                          ACCEPT choosen_model, model_path, image_digests and mode ('rgb' or 'gray') as argument
+
+                          RETURN resultKeys (None for an image when result cache is disabled)
+
+                          RETURN EXAMPLE :
+
+                                 * resultKeys : [('9f86d081884c7d65...', ('static/model/', 'BALANCE_model'), '3f2a9c1d7b4e8f60', 'rgb'), ...]
+  """
+  if all(image_digest is None for image_digest in image_digests):
+    return [None] * len(image_digests)
+  fingerprint = _getModelFingerprint(choosen_model, model_path) # model files are checked once for all images
+  resultKeys  = [_getResultKey(image_digest, (model_path, choosen_model), fingerprint, mode) if image_digest is not None else None
+                 for image_digest in image_digests]
+  return resultKeys
+
+def _predictModelRows(model, batch):
+  """
+  _predictModelRows() : Provide rounded prediction result of every image of a batch for one model and how long the batch prediction takes time.
+                          It is run on the compare thread pool, so each model measures its own prediction time.
+                          Percentage and rounding of the whole batch are computed at once.
+
+                          ACCEPT model and preprocessed batch as argument
+
+                          RETURN predictionRows, differentTime
+
+                          RETURN EXAMPLE :
+
+                                 * predictionRows : <type:ndarray shape (N, classes)> -> [[0.003, 99.987, 0.01], [91.2, 8.7, 0.1]]
+
+                                 * differentTime  : 0.2281
+  """
+  with _stageTimer('inference') as timer:
+    predictions     = _makeBatchPrediction(model, batch)
+  differentTime     = _secondsFromNanoseconds(timer.elapsed)
+  _observeHistogram('ml_inference_duration_seconds', timer.elapsed / 1e9, {'model': _getModelName(model)})
+  with _stageTimer('postprocess'):
+    predictionRows  = _roundedArrayValue(predictions, 3)
+  return predictionRows, differentTime
+
+def _predictImageBatch(list_choosen_model, model_path, images, mode):
+  """
+  _predictImageBatch() : Provide prediction result of several images for several models, every service prediction is made by this function.
+                          Results of images which were already predicted by the same model files are taken from result cache, the other images
+                          are decoded once, preprocessed once for each distinct model input shape and each model predicts the images it has not
+                          cached with one batched forward pass. Selected models are predicted concurrently on a bounded thread pool, models which do not exist in
+                          model_path are skipped. Prediction time of a batch is shared by its images.
+
+                          ACCEPT list_choosen_model, model_path, input images and mode ('rgb' or 'gray') as argument
+
+                          RETURN predictionResult, imageTime, cachedImages
+
+                          RETURN EXAMPLE :
+
+                                 * predictionResult : are (N, classes) arrays of rounded prediction result, one for each selected model
+                                                      -> [<type:ndarray shape (2, 3)>, <type:ndarray shape (2, 3)>]
+                                                      -> [[[0.003, 99.987, 0.01], [91.2, 8.7, 0.1]], [[0.003, 99.987, 0.01], [88.1, 11.8, 0.1]]]
+
+                                 * imageTime        : is (models, N) array of prediction time of each image
+                                                      -> [[0.1141, 0.1141], [0.1249, 0.1249]]
+
+                                 * cachedImages     : are lists of True for each image taken from result cache, one for each selected model
+                                                      -> [[True, False], [False, False]]
+  """
+  modelDict, _, _   = _getDictModel(model_path)
+  listOfModel       = [choosen_model for choosen_model in list_choosen_model if choosen_model in modelDict] # unknown models are skipped
+  imageDigests      = [_getImageDigest(image) for image in images]
+  resultKeys        = [_getPredictionKeys(choosen_model, model_path, imageDigests, mode) for choosen_model in listOfModel]
+  cachedResults     = [[_getCachedResult(resultKey) for resultKey in modelKeys] for modelKeys in resultKeys]
+  predictionRows    = [[cached[0] if cached is not None else None for cached in modelCached] for modelCached in cachedResults]
+  imageTime         = _toFloatArray([[cached[1] if cached is not None else 0.0 for cached in modelCached] for modelCached in cachedResults]).reshape(len(listOfModel), len(images))
+  cachedImages      = [[cached is not None for cached in modelCached] for modelCached in cachedResults]
+  missingByModel    = [[index for index, cached in enumerate(modelCached) if cached is None] for modelCached in cachedResults]
+  missingImages     = sorted({index for modelMissing in missingByModel for index in modelMissing})
+  missingModels     = [index for index, modelMissing in enumerate(missingByModel) if modelMissing]
+
+  if missingImages:
+    batchPosition = {imageIndex: position for position, imageIndex in enumerate(missingImages)}
+    with _bufferScope(): # batch buffers are returned into the pool after prediction
+      with _stageTimer('model'):
+        listOfLoadedModel = _loadCompareModel([listOfModel[index] for index in missingModels], model_path)
+      listOfBatch         = _batchImageProcessing([images[index] for index in missingImages], listOfLoadedModel, mode) # one batch tensor for each model
+      listOfBatch         = [batch if len(missingByModel[modelIndex]) == len(missingImages) else batch[[batchPosition[index] for index in missingByModel[modelIndex]]]
+                             for modelIndex, batch in zip(missingModels, listOfBatch)] # each model only predicts images it has not cached
+      batchPrediction     = lambda modelAndBatch: _predictModelRows(*modelAndBatch)
+      with _traceStep(): # predict step is traced by TensorFlow profiler when the request is profiled
+        listOfPrediction  = _mapOrdered(batchPrediction, zip(listOfLoadedModel, listOfBatch)) # selected models are predicted concurrently, order is kept
+
+    for modelIndex, (modelRows, differentTime) in zip(missingModels, listOfPrediction):
+      modelMissing = missingByModel[modelIndex]
+      imageTime[modelIndex, modelMissing] = differentTime / len(modelMissing)
+      if len(modelMissing) == len(images):
+        predictionRows[modelIndex] = modelRows # nothing is cached, the batch array is the result of the model
+      else:
+        for imageIndex, row in zip(modelMissing, modelRows):
+          predictionRows[modelIndex][imageIndex] = row
+      for imageIndex, row in zip(modelMissing, modelRows):
+        if resultKeys[modelIndex][imageIndex] is not None:
+          _putCachedResult(resultKeys[modelIndex][imageIndex], row.tolist(), float(imageTime[modelIndex, imageIndex]))
+
+  predictionResult  = [_toFloatArray(modelRows) for modelRows in predictionRows]
+  return predictionResult, imageTime, cachedImages
+
+def _predictJobBatch(list_choosen_model, model_path, images, mode):
+  """
+  _predictJobBatch() : Provide prediction result of a job batch and how long prediction of each model takes time (see _predictImageBatch).
+                          Unlike PredictInputRGBImageBatch it does not wait for interactive requests, job worker waits between batches.
+
+                          ACCEPT list_choosen_model, model_path, input images and mode ('rgb' or 'gray') as argument
+
+                          RETURN predictionResult, predictionTime
+
+                          RETURN EXAMPLE :
+
+                                 * predictionResult : [<type:ndarray shape (8, 3)>, <type:ndarray shape (8, 3)>]
+
+                                 * predictionTime   : [0.2281, 0.2497]
+  """
+  predictionResult, imageTime, _ = _predictImageBatch(list_choosen_model, model_path, images, mode)
+  predictionTime                 = imageTime.sum(axis=1).round(4).tolist()
+  return predictionResult, predictionTime
+
+def PredictInputRGBImages(choosen_model, model_path, images):
+  """
+  PredictInputRGBImages() : Provide prediction result of several RGB images for one model and how long prediction of each image takes time.
+                          It is the batch counterpart of PredictInputRGBImage, all images are predicted with one batched forward pass.
+                          Results of images which were already predicted by the same model files are taken from result cache (see SetResultCache).
+
+                          ACCEPT choosen_model, model_path, list of input images (image path or image bytes) as argument
+
+                          RETURN predictionResult as numpy array, predictionTime as list data (time taken from result cache is marked as cached)
+
+                          RETURN EXAMPLE :
+
+                                 * predictionResult : is (N, classes) array of rounded prediction result
+                                                      -> [[0.003, 99.987, 0.01], [91.2, 8.7, 0.1]]
+
+                                 * predictionTime   : is prediction takes time of each image
+                                                      -> [0.0864, 0.0864]
+  """
+  with _interactiveRequest(): # running job batches wait for interactive requests
+    predictionResult, imageTime, cachedImages = _predictImageBatch([choosen_model], model_path, images, 'rgb')
+  if not predictionResult:
+    raise KeyError(choosen_model)
+  predictionTime = _markCachedTime(imageTime[0].tolist(), cachedImages[0])
+  return predictionResult[0], predictionTime
+
+def PredictInputGrayImages(choosen_model, model_path, images):
+  """
+  PredictInputGrayImages() : Provide prediction result of several Grayscale images for one model and how long prediction of each image takes time.
+                          It is the batch counterpart of PredictInputGrayImage, all images are predicted with one batched forward pass.
+                          Results of images which were already predicted by the same model files are taken from result cache (see SetResultCache).
+
+                          ACCEPT choosen_model, model_path, list of input images (image path or image bytes) as argument
+
+                          RETURN predictionResult as numpy array, predictionTime as list data (time taken from result cache is marked as cached)
+
+                          RETURN EXAMPLE :
+
+                                 * predictionResult : is (N, classes) array of rounded prediction result
+                                                      -> [[0.003, 99.987, 0.01], [91.2, 8.7, 0.1]]
+
+                                 * predictionTime   : is prediction takes time of each image -> [0.0864, 0.0864]
+  """
+  with _interactiveRequest(): # running job batches wait for interactive requests
+    predictionResult, imageTime, cachedImages = _predictImageBatch([choosen_model], model_path, images, 'gray')
+  if not predictionResult:
+    raise KeyError(choosen_model)
+  predictionTime = _markCachedTime(imageTime[0].tolist(), cachedImages[0])
+  return predictionResult[0], predictionTime
+
 def PredictInputRGBImage(choosen_model, model_path, image):
   """
   PredictInputRGBImage() : Provide a tuple data which contain list of prediction result and how long prediction takes time
@@ -70,8 +405,9 @@ def PredictInputRGBImage(choosen_model, model_path, image):
                           This function would automatically scan choosen_model that contain in model_path directory and process 
                           RGB image before making a prediction.
 
-                          This function is used to predict an RGB image. It can only process RGB image type since this function 
-                          used _rgbImageProcessing() function to applied RGB image processing before making a prediction
+                          This function is used to predict an RGB image. It is a single image wrapper of PredictInputRGBImages, 
+                          so the image is processed and predicted by the same batch path. 
+                          Result of the same image predicted by the same model files is taken from result cache (see SetResultCache).
 
                           ACCEPT choosen_model, model_path, input images as argument
                           
@@ -85,13 +421,8 @@ def PredictInputRGBImage(choosen_model, model_path, image):
                                  * predictionTime   : is prediction takes time 
                                  -> 0.1728
   """
-  model             = _loadSelectModel(choosen_model, model_path)
-  image_data        = _rgbImageProcessing(image, model)
-  start             = time.time()
-  prediction        = _makePrediction(model, image_data)
-  predictionTime    = _differentTime(start)
-  predictionResult  = _roundedListValue(prediction, 3)
-  return predictionResult, predictionTime
+  predictionRows, predictionTime = PredictInputRGBImages(choosen_model, model_path, [image])
+  return predictionRows[0].tolist(), predictionTime[0]
 
 def PredictInputGrayImage(choosen_model, model_path, image):
   """
@@ -100,8 +431,9 @@ def PredictInputGrayImage(choosen_model, model_path, image):
                           This function would automatically scan choosen_model that contain in model_path directory and process 
                           Grayscale image before making a prediction.
                           
-                          This function is used to predict an Grayscale image. It can only process Grayscale image type since this function 
-                          used _grayImageProcessing() function to applied Grayscale image processing before making a prediction
+                          This function is used to predict an Grayscale image. It is a single image wrapper of PredictInputGrayImages, 
+                          so the image is processed and predicted by the same batch path. 
+                          Result of the same image predicted by the same model files is taken from result cache (see SetResultCache).
                           
                           ACCEPT choosen_model, model_path, input images as argument
                           
@@ -115,14 +447,8 @@ def PredictInputGrayImage(choosen_model, model_path, image):
                                  * predictionTime   : is prediction takes time 
                                  -> 0.1728
   """
-  model             = _loadSelectModel(choosen_model, model_path)
-  image_data        = _grayImageProcessing(image, model)
-  start             = time.time()
-  prediction        = _makePrediction(model, image_data)
-  predictionTime    = _differentTime(start)
-  predictionResult  = _roundedListValue(prediction, 3)
-
-  return predictionResult, predictionTime
+  predictionRows, predictionTime = PredictInputGrayImages(choosen_model, model_path, [image])
+  return predictionRows[0].tolist(), predictionTime[0]
 
 def PredictInputRGBImageList(list_choosen_model, model_path, image):
   """
@@ -131,8 +457,10 @@ def PredictInputRGBImageList(list_choosen_model, model_path, image):
                           This function would automatically scan list choosen_model that contain in model_path directory and process 
                           RGB image before making a prediction.
                           
-                          This function is would predict an RGB image with several selected model. It can only process RGB image type 
-                          since this function used _rgbImageProcessing() to applied bounch of RGB image processing before making any prediction.
+                          This function is would predict an RGB image with several selected model. It is a single image wrapper of 
+                          PredictInputRGBImageBatch, the image is decoded once and resized once for each distinct model input shape.
+                          Selected models are predicted concurrently on a bounded thread pool (see SetCompareConcurrency).
+                          Only models which did not predict the same image yet are predicted, other results are taken from result cache (see SetResultCache).
 
                           ACCEPT list_choosen_model, model_path, input images as argument
                           
@@ -146,19 +474,10 @@ def PredictInputRGBImageList(list_choosen_model, model_path, image):
                                  * predictionTime   : is prediction takes time 
                                                       -> [0.1728, 0.1987]
   """
-  predictionResult    = []
-  predictionTime      = []
-  listOfLoadedModel   = _loadCompareModel(list_choosen_model, model_path)
-
-  for model in listOfLoadedModel:
-    image_data        = _rgbImageProcessing(image, model)
-    start             = time.time()
-    prediction        = _makePrediction(model, image_data)
-    differentTime     = _differentTime(start)
-    _appendListElement(predictionTime, differentTime)
-    predictionRounded = _roundedListValue(prediction, 3)
-    _appendListElement(predictionResult, predictionRounded)
-
+  with _interactiveRequest(): # running job batches wait for interactive requests
+    predictionRows, imageTime, cachedImages = _predictImageBatch(list_choosen_model, model_path, [image], 'rgb')
+  predictionResult  = [modelRows[0].tolist() for modelRows in predictionRows]
+  predictionTime    = _markCachedTime(imageTime[:, 0].tolist(), [modelCached[0] for modelCached in cachedImages])
   return predictionResult, predictionTime
 
 def PredictInputGrayImageList(list_choosen_model, model_path, image):
@@ -168,8 +487,10 @@ def PredictInputGrayImageList(list_choosen_model, model_path, image):
                           This function would automatically scan list choosen_model that contain in model_path directory and process 
                           Grayscale image before making a prediction.
                           
-                          This function is would predict an Grayscale image with several selected model. It can only process Grayscale image type 
-                          since this function used _grayImageProcessing() to applied bounch of Grayscale image processing before making any prediction.
+                          This function is would predict an Grayscale image with several selected model. It is a single image wrapper of 
+                          PredictInputGrayImageBatch, the image is decoded once and resized once for each distinct model input shape.
+                          Selected models are predicted concurrently on a bounded thread pool (see SetCompareConcurrency).
+                          Only models which did not predict the same image yet are predicted, other results are taken from result cache (see SetResultCache).
 
                           ACCEPT list_choosen_model, model_path, input images as argument
                           
@@ -182,17 +503,678 @@ def PredictInputGrayImageList(list_choosen_model, model_path, image):
                                  
                                  * predictionTime   : is prediction takes time -> [0.1728, 0.1987]
   """
-  predictionResult  = []
-  predictionTime    = []
-  listOfLoadedModel = _loadCompareModel(list_choosen_model, model_path)
+  with _interactiveRequest(): # running job batches wait for interactive requests
+    predictionRows, imageTime, cachedImages = _predictImageBatch(list_choosen_model, model_path, [image], 'gray')
+  predictionResult  = [modelRows[0].tolist() for modelRows in predictionRows]
+  predictionTime    = _markCachedTime(imageTime[:, 0].tolist(), [modelCached[0] for modelCached in cachedImages])
+  return predictionResult, predictionTime
+
+def PredictInputRGBImageBatch(list_choosen_model, model_path, images):
+  """
+  PredictInputRGBImageBatch() : Provide a tuple of collection data which contain prediction result of several RGB images for several models 
+                          and how long each batch prediction takes time.
+
+                          Each image is decoded once and each selected model predicts all images with one batched forward pass.
+                          Images which were already predicted by the same model files are taken from result cache (see SetResultCache).
+
+                          ACCEPT list_choosen_model, model_path, list of input images (image path or image bytes) as argument
+                          
+                          RETURN predictionResult, predictionTime
+
+                          RETURN EXAMPLE :
+                                 
+                                 * predictionResult : are (N, classes) arrays of rounded prediction result, one for each selected model 
+                                                      -> [[[0.003, 99.987, 0.01], [91.2, 8.7, 0.1]], [[0.003, 99.987, 0.01], [88.1, 11.8, 0.1]]]
+                                 
+                                 * predictionTime   : is batch prediction takes time of each selected model 
+                                                      -> [0.2281, 0.2497]
+  """
+  with _interactiveRequest(): # running job batches wait for interactive requests
+    predictionResult, imageTime, _ = _predictImageBatch(list_choosen_model, model_path, images, 'rgb')
+  predictionTime = imageTime.sum(axis=1).round(4).tolist()
+  return predictionResult, predictionTime
+
+def PredictInputGrayImageBatch(list_choosen_model, model_path, images):
+  """
+  PredictInputGrayImageBatch() : Provide a tuple of collection data which contain prediction result of several Grayscale images for several models 
+                          and how long each batch prediction takes time.
 
-  for model in listOfLoadedModel:
-    image_data        = _grayImageProcessing(image, model)
-    start             = time.time()
-    prediction        = _makePrediction(model, image_data)
-    differentTime     = _differentTime(start)
-    _appendListElement(predictionTime, differentTime)
-    predictionRounded = _roundedListValue(prediction, 3)
-    _appendListElement(predictionResult, predictionRounded)
+                          Each image is decoded once and each selected model predicts all images with one batched forward pass.
+                          Images which were already predicted by the same model files are taken from result cache (see SetResultCache).
 
+                          ACCEPT list_choosen_model, model_path, list of input images (image path or image bytes) as argument
+                          
+                          RETURN predictionResult, predictionTime
+
+                          RETURN EXAMPLE :
+                                 
+                                 * predictionResult : are (N, classes) arrays of rounded prediction result, one for each selected model 
+                                                      -> [[[0.003, 99.987, 0.01], [91.2, 8.7, 0.1]], [[0.003, 99.987, 0.01], [88.1, 11.8, 0.1]]]
+                                 
+                                 * predictionTime   : is batch prediction takes time of each selected model -> [0.2281, 0.2497]
+  """
+  with _interactiveRequest(): # running job batches wait for interactive requests
+    predictionResult, imageTime, _ = _predictImageBatch(list_choosen_model, model_path, images, 'gray')
+  predictionTime = imageTime.sum(axis=1).round(4).tolist()
   return predictionResult, predictionTime
+
+def RankPredictionLabels(prediction, labels, top_k=3):
+  """
+  RankPredictionLabels() : Provide top_k labels of a prediction result sorted by their probability
+
+                          ACCEPT prediction (rounded prediction result), labels (class names ordered by class index) and top_k as argument
+
+                          RETURN rankedLabels
+
+                          RETURN EXAMPLE :
+
+                                 * rankedLabels : [{'label': 'MENINGIOMA', 'probability': 99.987}, {'label': 'PITUITARY', 'probability': 0.01}]
+  """
+  rankedLabels = RankBatchPredictionLabels([prediction], labels, top_k)[0]
+  return rankedLabels
+
+def RankBatchPredictionLabels(predictions, labels, top_k=3):
+  """
+  RankBatchPredictionLabels() : Provide top_k labels of each prediction result of a batch sorted by their probability. 
+                          Top_k indices and probabilities of the whole (N, classes) batch are computed at once.
+
+                          ACCEPT predictions ((N, classes) rounded prediction result), labels (class names ordered by class index) and top_k as argument
+
+                          RETURN rankedLabels
+
+                          RETURN EXAMPLE :
+
+                                 * rankedLabels : [[{'label': 'MENINGIOMA', 'probability': 99.987}, {'label': 'PITUITARY', 'probability': 0.01}],
+                                                   [{'label': 'GLIOMA', 'probability': 91.2}, {'label': 'MENINGIOMA', 'probability': 8.7}]]
+  """
+  predictionArray = _toFloatArray(predictions)
+  topIndices      = _getTopIndices(predictionArray, top_k)
+  topProbability  = _takeByIndices(predictionArray, topIndices)
+  rankedLabels    = [[{'label': labels[index], 'probability': probability} for index, probability in zip(rowIndices, rowProbability)]
+                     for rowIndices, rowProbability in zip(topIndices.tolist(), topProbability.tolist())]
+  return rankedLabels
+
+def SetModelMemoryBudget(megabytes):
+  """
+  SetModelMemoryBudget() : Set memory budget of model registry. Loaded models are kept in memory and reused by every request,
+                          least recently used model would be evicted when total size of loaded models is bigger than this budget.
+
+                          ACCEPT megabytes as argument
+
+                          RETURN memory budget in bytes
+
+                          RETURN EXAMPLE :
+
+                                 * memoryBudget : -> 1073741824
+  """
+  memoryBudget = _setMemoryBudget(megabytes * 1024 * 1024)
+  return memoryBudget
+
+def GetModelRegistryInfo():
+  """
+  GetModelRegistryInfo() : Provide information of loaded models kept by model registry
+
+                          RETURN registryInfo
+
+                          RETURN EXAMPLE :
+
+                                 * registryInfo : {'budget': 1073741824, 'size': 80123904,
+                                                   'models': [{'path': 'static/model/', 'name': 'BALANCE_model', 'image_size': (224, 224),
+                                                               'size': 80123904, 'load_time': 2.4521, 'hits': 12}]}
+  """
+  registryInfo = _getRegistryInfo()
+  return registryInfo
+
+def SetMicroBatching(enabled=True, max_wait_ms=5, max_batch_size=16):
+  """
+  SetMicroBatching() : Configure cross-request micro-batching. Images of concurrent requests for the same model are collected for up to 
+                      max_wait_ms milliseconds (or until max_batch_size images) and predicted with one batched forward pass.
+
+                          ACCEPT enabled, max_wait_ms and max_batch_size as argument
+
+                          RETURN batchingConfig
+
+                          RETURN EXAMPLE :
+
+                                 * batchingConfig : {'enabled': True, 'max_wait_ms': 5.0, 'max_batch_size': 16}
+  """
+  batchingConfig = _setBatchingConfig(enabled, max_wait_ms, max_batch_size)
+  return batchingConfig
+
+def GetServiceStats():
+  """
+  GetServiceStats() : Provide statistic of service internals such (model registry, query image gallery, micro-batching, job queue, result cache,
+                      preprocessing buffer pool, inference engine, model preload, deferred import time of TensorFlow / Keras, request stage timing
+                      , pre-fork serving with memory of the worker and inference pool)
+
+                          RETURN serviceStats
+
+                          RETURN EXAMPLE :
+
+                                 * serviceStats : {'registry': {...}, 'gallery': {...}, 'batching': {...}, 'jobs': {...}, 'results': {...},
+                                                   'buffers': {...}, 'engine': {...}, 'preload': {...},
+                                                   'imports': {...}, 'timing': {...}, 'prefork': {...}, 'pool': {...}}
+  """
+  serviceStats = {
+    'registry' : _getRegistryInfo(),
+    'gallery'  : _getGalleryInfo(),
+    'batching' : _getBatchingStats(),
+    'jobs'     : _getJobQueueInfo(),
+    'results'  : _getResultCacheInfo(),
+    'buffers'  : _getBufferPoolInfo(),
+    'engine'   : _getEngineInfo(),
+    'preload'  : _getPreloadInfo(),
+    'imports'  : _getImportInfo(),
+    'timing'   : _getTimingInfo(),
+    'prefork'  : _getPreforkInfo(),
+    'pool'     : _getPoolInfo(),
+  }
+  return serviceStats
+
+def SetCompareConcurrency(max_workers):
+  """
+  SetCompareConcurrency() : Set maximum number of selected models predicted concurrently by compare services
+                          (PredictInputRGBImageList and PredictInputGrayImageList). Use 1 to predict models one after another.
+
+                          ACCEPT max_workers as argument
+
+                          RETURN maxWorkers
+  """
+  maxWorkers = _setMaxWorkers(max_workers)
+  return maxWorkers
+
+def SetUploadPreviewTTL(ttl_seconds):
+  """
+  SetUploadPreviewTTL() : Set time to live (in seconds) of uploaded image previews saved by ReadUploadImage
+
+                          ACCEPT ttl_seconds as argument
+
+                          RETURN ttlSeconds
+  """
+  ttlSeconds = _setPreviewTTL(ttl_seconds)
+  return ttlSeconds
+
+def SetPredictionJobs(database_path, workers=1, batch_size=8, result_ttl=3600, mode='rgb'):
+  """
+  SetPredictionJobs() : Setup asynchronous prediction job queue (SQLite database), jobs can be submitted and polled right away.
+                          Workers predict images of a job batch by batch (see PredictInputRGBImageBatch), jobs of the interactive lane are taken
+                          before jobs of the bulk lane, and bulk batches wait while interactive requests are running. No worker is started (see StartPredictionJobs).
+
+                          ACCEPT database_path, workers, batch_size, result_ttl (in seconds) and mode ('rgb' or 'gray') as argument
+
+                          RETURN jobQueueConfig
+
+                          RETURN EXAMPLE :
+
+                                 * jobQueueConfig : {'database': 'cache/jobs.sqlite3', 'batch_size': 8, 'result_ttl': 3600, 'workers': 1}
+  """
+  processor      = lambda list_choosen_model, model_path, images: _predictJobBatch(list_choosen_model, model_path, images, mode)
+  jobQueueConfig = _setupJobQueue(database_path, batch_size, result_ttl, processor, workers)
+  return jobQueueConfig
+
+def StartPredictionJobs():
+  """
+  StartPredictionJobs() : Start background workers of the job queue configured by SetPredictionJobs, once in each process
+                          (later calls of the same process do nothing)
+
+                          RETURN jobQueueInfo
+
+                          RETURN EXAMPLE :
+
+                                 * jobQueueInfo : {'database': 'cache/jobs.sqlite3', 'workers': 1, 'interactive_active': 0, 'jobs': {}}
+  """
+  _startJobWorkers()
+  jobQueueInfo = _getJobQueueInfo()
+  return jobQueueInfo
+
+def SubmitPredictionJob(list_choosen_model, model_path, images, lane='bulk', callback_url=None):
+  """
+  SubmitPredictionJob() : Queue prediction of several images for several models, the job is predicted in background and its progress and
+                          results can be polled by GetPredictionJob. When callback_url is set it receives the finished job as json.
+
+                          ACCEPT list_choosen_model, model_path, images (list of (image name, image path or image bytes)), 
+                          lane ('interactive' or 'bulk') and callback_url as argument
+
+                          RETURN job
+
+                          RETURN EXAMPLE :
+
+                                 * job : {'id': '4f1c2b9e0a8d4e6f9b7c3d2a1e0f5b6c', 'lane': 'bulk', 'status': 'queued', 'models': ['BALANCE_model'],
+                                          'progress': {'done': 0, 'total': 20, 'percent': 0.0}, ...}
+  """
+  job = _submitJob(list_choosen_model, model_path, images, lane, callback_url)
+  return job
+
+def GetPredictionJob(job_id):
+  """
+  GetPredictionJob() : Provide status, progress and finished results of a prediction job
+
+                          ACCEPT job_id as argument
+
+                          RETURN job or None when job does not exist or is expired
+
+                          RETURN EXAMPLE :
+
+                                 * job : {'id': '4f1c2b9e0a8d4e6f9b7c3d2a1e0f5b6c', 'status': 'done', 'progress': {'done': 20, 'total': 20, 'percent': 100.0},
+                                          'results': [{'image': 'Glioma_1469.png', 'predictions': {'BALANCE_model': [0.003, 99.987, 0.01]}}], ...}
+  """
+  job = _getJob(job_id)
+  return job
+
+def SetResultCache(enabled=True, max_entries=4096, cache_path=None):
+  """
+  SetResultCache() : Configure prediction result cache used by PredictInputRGBImage, PredictInputGrayImage and their list variants.
+                          The same image predicted by the same model files is only predicted once, results are kept in memory (least recently used
+                          result is evicted above max_entries) and persisted into cache_path when it is set.
+
+                          ACCEPT enabled, max_entries and cache_path as argument
+
+                          RETURN resultCacheConfig
+
+                          RETURN EXAMPLE :
+
+                                 * resultCacheConfig : {'enabled': True, 'max_entries': 4096, 'cache_path': 'cache/results/'}
+  """
+  resultCacheConfig = _setResultCache(enabled, max_entries, cache_path)
+  return resultCacheConfig
+
+def SetReducedDecode(enabled=True):
+  """
+  SetReducedDecode() : Enable or disable reduced resolution decoding of large JPEG images. When it is enabled a large scan is decoded at 1/2, 1/4 or 1/8 
+                          of its resolution (still at least twice model input size) instead of decoding every pixel, which lowers decode time and peak memory.
+                          Disable it to decode every image at full resolution.
+
+                          ACCEPT enabled as argument
+
+                          RETURN enabled
+  """
+  enabled = _setReducedDecode(enabled)
+  return enabled
+
+def SetPreprocessingBufferPool(enabled=True, max_pooled=8, max_pool_megabytes=256):
+  """
+  SetPreprocessingBufferPool() : Configure buffer pool of fused image preprocessing. Image tensors of a request are resized and normalized straight into
+                          pooled float32 buffers keyed by (batch size, H, W, C), which are reused by the next request instead of allocating new arrays.
+
+                          ACCEPT enabled, max_pooled (free buffers kept for each shape) and max_pool_megabytes (total size of free buffers) as argument
+
+                          RETURN bufferPoolConfig
+
+                          RETURN EXAMPLE :
+
+                                 * bufferPoolConfig : {'enabled': True, 'max_pooled': 8, 'max_pool_megabytes': 256.0}
+  """
+  bufferPoolConfig = _setBufferPool(enabled, max_pooled, max_pool_megabytes)
+  return bufferPoolConfig
+
+def SetInferenceEngine(mode='compiled', buckets=(1, 2, 4, 8, 16, 32, 64), warmup_batch=16):
+  """
+  SetInferenceEngine() : Select inference engine used by every prediction service. 'compiled' predicts by graph functions traced once for each
+                          batch size bucket (and warmed up when a model is loaded), 'predict' keeps keras model.predict() to compare both paths.
+
+                          ACCEPT mode ('compiled' or 'predict'), buckets (batch sizes of traced functions) and warmup_batch (largest bucket traced when a model is loaded) as argument
+
+                          RETURN engineConfig
+
+                          RETURN EXAMPLE :
+
+                                 * engineConfig : {'mode': 'compiled', 'buckets': [1, 2, 4, 8, 16, 32, 64], 'warmup_batch': 16}
+  """
+  engineConfig = _setInferenceEngine(mode, buckets, warmup_batch)
+  return engineConfig
+
+def PreloadModels(model_path, max_workers=4, wait=False):
+  """
+  PreloadModels() : Eagerly load every model of model_path in parallel and run a dummy inference on each of them, so the first request of a model
+                          does not pay for model loading and graph tracing. Preload runs in background unless wait is True, the worker reports
+                          ready (see GetReadiness) only after every model is loaded and warmed up. Preload is started once in each process.
+
+                          ACCEPT model_path, max_workers (models loaded at once) and wait as argument
+
+                          RETURN preloadThread (None when wait is True or preload is already started in this process)
+  """
+  _, listModel, _ = _getDictModel(model_path)
+  preloadThread   = _startPreload(listModel, lambda choosen_model: _loadSelectModel(choosen_model, model_path), _runDummyInference, max_workers, wait)
+  return preloadThread
+
+def GetReadiness():
+  """
+  GetReadiness() : Provide readiness of the worker. Worker is ready when model preload is finished (or model preload is not used).
+
+                          RETURN ready, preloadInfo
+
+                          RETURN EXAMPLE :
+
+                                 * ready       : True
+
+                                 * preloadInfo : {'status': 'ready', 'ready': True, 'elapsed': 2.8123,
+                                                  'models': {'BALANCE_model': {'status': 'ready', 'load_time': 2.4521, 'warmup_time': 0.0312, 'error': None}}}
+  """
+  ready       = _isReady()
+  preloadInfo = _getPreloadInfo()
+  return ready, preloadInfo
+
+def StartInferencePool(processes=2):
+  """
+  StartInferencePool() : Start inference pool, long-lived processes which load every model and run every prediction of the service
+                          (request threads only decode and preprocess images), preprocessed batches are handed over by shared memory.
+                          It must be started before any other background thread of the process (see start_worker_services of app.py).
+                          Signatures and results of every prediction service are unchanged.
+
+                          ACCEPT processes (0 means inference runs in request threads) as argument
+
+                          RETURN poolProcesses (number of running pool processes)
+  """
+  poolProcesses = _startPool(processes)
+  return poolProcesses
+
+def PrepareForkServing(model_path, share_tflite_weights=True):
+  """
+  PrepareForkServing() : Prepare gunicorn master of pre-fork serving (gunicorn.conf.py) before its workers are forked. TensorFlow and Keras are
+                          imported and TFLite models of model_path are read into memory, so forked workers share them copy-on-write.
+                          Keras and ONNX models are loaded by each worker, TensorFlow runtime is never initialized in the master.
+
+                          ACCEPT model_path and share_tflite_weights as argument
+
+                          RETURN preforkInfo
+
+                          RETURN EXAMPLE :
+
+                                 * preforkInfo : {'enabled': True, 'master_pid': 4120, 'pid': 4120, 'prepare_time': 3.102,
+                                                  'shared_models': {'VGG_int8_model': 20621440}, 'worker_models': ['VGG_model'], 'memory': {...}}
+  """
+  dictModel, _, _ = _getDictModel(model_path)
+  preforkInfo     = _prepareForkServing(dictModel, share_tflite_weights)
+  return preforkInfo
+
+def CheckForkSafety():
+  """
+  CheckForkSafety() : Check that gunicorn master can fork a worker (TensorFlow runtime is not initialized), called by gunicorn
+                          before each fork. Objects of the master are frozen so the garbage collector of workers
+                          does not write into shared pages.
+
+                          RETURN frozenObjects
+
+                          RAISE RuntimeError when the master is not fork safe
+  """
+  frozenObjects = _checkForkSafety()
+  return frozenObjects
+
+def GetWorkerMemory():
+  """
+  GetWorkerMemory() : Provide memory of the current process (rss, pss, uss and shared bytes), see _getProcessMemory of infra layer
+
+                          RETURN workerMemory
+
+                          RETURN EXAMPLE :
+
+                                 * workerMemory : {'rss': 734003200, 'pss': 301989888, 'uss': 209715200, 'shared': 524288000}
+  """
+  workerMemory = _getProcessMemory()
+  return workerMemory
+
+def SetBackendThreads(num_threads=None):
+  """
+  SetBackendThreads() : Set cpu threads used by one TFLite interpreter / ONNX Runtime session, for TFLite and ONNX models loaded after this call.
+                          Keras models are not affected.
+
+                          ACCEPT num_threads (None means backend default) as argument
+
+                          RETURN numThreads
+  """
+  numThreads = _setBackendThreads(num_threads)
+  return numThreads
+
+def SetStageTiming(enabled=True):
+  """
+  SetStageTiming() : Enable or disable per request stage timing (decode, preprocess, model, inference, postprocess and render).
+                          When it is disabled no timing scope is opened and stage timing costs almost nothing.
+
+                          ACCEPT enabled as argument
+
+                          RETURN enabled
+  """
+  enabled = _setStageTiming(enabled)
+  return enabled
+
+def StartStageTiming():
+  """
+  StartStageTiming() : Open stage timing scope of the current request, stages measured by service functions of the request are added into it
+
+                          RETURN timingToken (None when stage timing is disabled)
+  """
+  timingToken = _startTimingScope()
+  return timingToken
+
+def StageTimer(stage):
+  """
+  StageTimer() : Provide a stage timer of the current request, use it as context manager (such around rendering of the result page)
+
+                          ACCEPT stage name as argument
+
+                          RETURN stageTimer
+  """
+  stageTimer = _stageTimer(stage)
+  return stageTimer
+
+def GetStageTimings():
+  """
+  GetStageTimings() : Provide stage timings (milliseconds) measured so far by the current request
+
+                          RETURN stageTimings or None when stage timing is disabled
+
+                          RETURN EXAMPLE :
+
+                                 * stageTimings : {'stages': {'decode': {'ms': 3.1021, 'calls': 1}, 'preprocess': {'ms': 0.4112, 'calls': 1},
+                                                              'model': {'ms': 0.0123, 'calls': 1}, 'inference': {'ms': 4.8802, 'calls': 1},
+                                                              'postprocess': {'ms': 0.0081, 'calls': 1}}, 'elapsed_ms': 9.2817}
+  """
+  stageTimings = _getStageTimings()
+  return stageTimings
+
+def FinishStageTiming(timingToken):
+  """
+  FinishStageTiming() : Close stage timing scope of the current request
+
+                          ACCEPT timingToken of StartStageTiming as argument
+
+                          RETURN serverTiming (Server-Timing header value) or None when stage timing is disabled
+
+                          RETURN EXAMPLE :
+
+                                 * serverTiming : 'decode;dur=3.102, preprocess;dur=0.411, inference;dur=4.88, render;dur=1.207, total;dur=10.489'
+  """
+  stageTimings = _finishTimingScope(timingToken)
+  serverTiming = _getServerTimingHeader(stageTimings) if stageTimings is not None else None
+  return serverTiming
+
+def _collectServiceMetrics():
+  """
+  _collectServiceMetrics() : Provide counters and gauges of service internals for service metrics (cache lookups of result cache and
+                          buffer pool, micro-batching queue depth, job queue, worker memory (rss, pss, uss and shared) and loaded model size)
+
+                          RETURN serviceMetrics as list of (metric name, labels, value)
+
+                          RETURN EXAMPLE :
+
+                                 * serviceMetrics : [('ml_cache_lookups_total', {'cache': 'results', 'result': 'hit'}, 12),
+                                                     ('ml_worker_resident_memory_bytes', {}, 734003200),
+                                                     ('ml_worker_memory_bytes', {'kind': 'pss'}, 301989888)]
+  """
+  resultInfo     = _getResultCacheInfo()
+  bufferInfo     = _getBufferPoolInfo()
+  workerMemory   = _getProcessMemory()
+  serviceMetrics = [
+    ('ml_cache_lookups_total', {'cache': 'results', 'result': 'hit'}, resultInfo['hits'] + resultInfo['disk_hits']),
+    ('ml_cache_lookups_total', {'cache': 'results', 'result': 'miss'}, resultInfo['misses']),
+    ('ml_cache_lookups_total', {'cache': 'buffers', 'result': 'hit'}, bufferInfo['reused']),
+    ('ml_cache_lookups_total', {'cache': 'buffers', 'result': 'miss'}, bufferInfo['allocated']),
+    ('ml_worker_resident_memory_bytes', {}, workerMemory['rss']),
+    ('ml_loaded_model_bytes', {}, _getRegistryInfo()['size']),
+  ]
+  for kind in ('pss', 'uss', 'shared'):
+    if workerMemory[kind] is not None:
+      _appendListElement(serviceMetrics, ('ml_worker_memory_bytes', {'kind': kind}, workerMemory[kind]))
+  for modelName, queueDepth in _getQueueDepth().items():
+    _appendListElement(serviceMetrics, ('ml_batch_queue_depth', {'model': modelName}, queueDepth))
+  for status, lanes in _getJobQueueInfo()['jobs'].items():
+    for lane, total in lanes.items():
+      _appendListElement(serviceMetrics, ('ml_job_queue_jobs', {'status': status, 'lane': lane}, total))
+  return serviceMetrics
+
+def SetMetrics(enabled=True, metrics_path=None, flush_interval=5):
+  """
+  SetMetrics() : Configure service metrics served by /metrics (Prometheus text format). With several worker processes (gunicorn)
+                          use metrics_path, each worker writes its metrics snapshot there every flush_interval seconds and
+                          /metrics reports metrics of every worker.
+
+                          ACCEPT enabled, metrics_path (None means only the serving worker) and flush_interval (seconds) as argument
+
+                          RETURN metricsConfig
+
+                          RETURN EXAMPLE :
+
+                                 * metricsConfig : {'enabled': True, 'metrics_path': 'cache/metrics/', 'flush_interval': 5}
+  """
+  metricsConfig = _setMetrics(enabled, metrics_path, flush_interval)
+  _addMetricsCollector(_collectServiceMetrics)
+  return metricsConfig
+
+def ObserveRequest(route, method, status, seconds):
+  """
+  ObserveRequest() : Add latency of a finished request into service metrics
+
+                          ACCEPT route (url rule such /pred_select), method, status code and seconds as argument
+  """
+  _observeHistogram('ml_http_request_duration_seconds', seconds, {'route': route, 'method': method, 'status': status})
+
+def GetMetrics():
+  """
+  GetMetrics() : Provide service metrics of every worker in Prometheus text format
+
+                          RETURN metricsText or None when service metrics are disabled
+
+                          RETURN EXAMPLE :
+
+                                 * metricsText : '# HELP ml_http_request_duration_seconds Request latency by route, method and status.\n ...'
+  """
+  if not _isMetricsEnabled():
+    return None
+  metricsText = _renderMetrics()
+  return metricsText
+
+def SetProfiling(enabled=False, profile_path='cache/profiles/', sample_rate=0.0, profiler='cprofile', tf_trace=True, max_profiles=50):
+  """
+  SetProfiling() : Configure opt-in request profiling. A request is profiled when it has the profile header or it is picked by sample_rate,
+                          its profile (cProfile or pyinstrument) and a TensorFlow trace of its predict step are saved into profile_path.
+
+                          ACCEPT enabled, profile_path, sample_rate, profiler ('cprofile' or 'pyinstrument'), tf_trace and max_profiles as argument
+
+                          RETURN profilingConfig
+
+                          RETURN EXAMPLE :
+
+                                 * profilingConfig : {'enabled': True, 'profile_path': 'cache/profiles/', 'sample_rate': 0.0, 'profiler': 'cprofile',
+                                                      'tf_trace': True, 'max_profiles': 50}
+  """
+  profilingConfig = _setProfiling(enabled, profile_path, sample_rate, profiler, tf_trace, max_profiles)
+  return profilingConfig
+
+def StartRequestProfile(header_value=None):
+  """
+  StartRequestProfile() : Start profiling of the current request when profiling is enabled and the request has the profile header
+                          or it is picked by the sample rate
+
+                          ACCEPT header_value (value of profile header or None) as argument
+
+                          RETURN profileSession or None when the request is not profiled
+  """
+  if not _isProfilingEnabled():
+    return None
+  profileSession = _startProfile(header_value)
+  return profileSession
+
+def FinishRequestProfile(profile_session, route, method, status):
+  """
+  FinishRequestProfile() : Stop profiling of the current request and save its artifacts
+
+                          ACCEPT profile_session of StartRequestProfile, route, method and status code as argument
+
+                          RETURN profileMetadata
+
+                          RETURN EXAMPLE :
+
+                                 * profileMetadata : {'id': '20261018-130512_4121_9f86d081', 'route': '/pred_select', 'duration_ms': 84.2,
+                                                      'files': ['20261018-130512_4121_9f86d081.prof', '20261018-130512_4121_9f86d081.txt'], ...}
+  """
+  profileMetadata = _finishProfile(profile_session, route, method, status)
+  return profileMetadata
+
+def GetRecentProfiles():
+  """
+  GetRecentProfiles() : Provide directory and metadata of saved request profiles (newest first)
+
+                          RETURN profilePath, profiles
+
+                          RETURN EXAMPLE :
+
+                                 * profilePath : 'cache/profiles/'
+
+                                 * profiles    : [{'id': '20261018-130512_4121_9f86d081', 'route': '/pred_select', 'duration_ms': 84.2, ...}]
+  """
+  profilePath = _getProfilePath()
+  profiles    = _getProfileIndex() if _isProfilingEnabled() else []
+  return profilePath, profiles
+
+def SetLeaderboard(cache_path='cache/leaderboard/', batch_sizes=(1, 8, 32), iterations=20):
+  """
+  SetLeaderboard() : Configure model leaderboard, reports are saved into cache_path and throughput is measured for each batch size
+                          over iterations prediction calls.
+
+                          ACCEPT cache_path, batch_sizes and iterations as argument
+
+                          RETURN leaderboardConfig
+
+                          RETURN EXAMPLE :
+
+                                 * leaderboardConfig : {'cache_path': 'cache/leaderboard/', 'batch_sizes': [1, 8, 32], 'iterations': 20}
+  """
+  leaderboardConfig = _setLeaderboard(cache_path, batch_sizes, iterations)
+  return leaderboardConfig
+
+def GetModelLeaderboard(model_path, query_path, class_dict, mode='rgb'):
+  """
+  GetModelLeaderboard() : Provide leaderboard of every model in model_path evaluated over labelled query images of query_path
+                          (class of each image is taken from its <ClassName_> file name). Each model report holds accuracy, recall of each
+                          class, confusion matrix and p50 / p95 latency and images per second of each benchmark batch size.
+                          Only saved reports are provided, models which are new or changed since their report are pending (see EvaluateModelLeaderboard).
+
+                          ACCEPT model_path, query_path, class_dict and mode ('rgb' or 'gray') as argument
+
+                          RETURN modelLeaderboard
+
+                          RETURN EXAMPLE :
+
+                                 * modelLeaderboard : {'labels': ['GLIOMA', 'MENINGIOMA', 'PITUITARY'], 'samples': 20, 'batch_sizes': [1, 8, 32],
+                                                       'pending': [], 'evaluating': False, 'models': [{'model': 'VGG_model', 'accuracy': 85.0,
+                                                       'recall': {'GLIOMA': 100.0, ...}, 'confusion': [[6, 0, 0], ...],
+                                                       'throughput': [{'batch_size': 1, 'p50_ms': 4.21, 'p95_ms': 5.03, 'images_per_second': 231.4}, ...]}]}
+  """
+  modelLeaderboard = _getLeaderboard(model_path, query_path, class_dict, mode)
+  return modelLeaderboard
+
+def EvaluateModelLeaderboard(model_path, query_path, class_dict, mode='rgb', refresh=False, wait=False):
+  """
+  EvaluateModelLeaderboard() : Evaluate models of model_path without a saved report of their current files (refresh evaluates all) and save
+                          their reports for GetModelLeaderboard. Evaluation runs in background unless wait is True, one evaluation at a time.
+
+                          ACCEPT model_path, query_path, class_dict, mode ('rgb' or 'gray'), refresh and wait as argument
+
+                          RETURN evaluatedModels (list of evaluated model name when wait is True) or evaluationThread
+                          (None when an evaluation of this process is already running)
+  """
+  if wait:
+    evaluatedModels = _evaluateLeaderboard(model_path, query_path, class_dict, mode, refresh)
+    return evaluatedModels
+  evaluationThread = _startEvaluation(model_path, query_path, class_dict, mode, refresh)
+  return evaluationThread
@@ -0,0 +1,107 @@
+"""
+    Tests of the cross-request micro-batching scheduler (src/config/batching.py): concurrent requests share one
+    forward pass, batches are split at max batch size, shapes are predicted apart and errors reach every caller
+"""
+
+# python package
+import numpy as np
+import pytest
+
+# internal package
+from src.config import batching
+
+class FakeModel:
+    """
+        model whose prediction of each row is [sum of the row, rows of the forward pass], forward passes are recorded
+    """
+    def __init__(self, name='A_model', error=None):
+        self.name   = name
+        self.error  = error
+        self.passes = []
+
+def fake_predict(model, batch):
+    """
+        predict every row of a batch by the fake model
+    """
+    model.passes.append(batch.shape[0])
+    if model.error is not None:
+        raise model.error
+    return np.stack([batch.reshape(batch.shape[0], -1).sum(axis=1), np.full(batch.shape[0], batch.shape[0])], axis=1)
+
+@pytest.fixture
+def scheduler(monkeypatch):
+    """
+        configure micro-batching with a long max wait, so every request of a test is collected by one scheduler loop
+    """
+    for name in ('_ENABLED', '_MAX_WAIT', '_MAX_BATCH_SIZE'):
+        monkeypatch.setattr(batching, name, getattr(batching, name))
+    monkeypatch.setattr(batching, '_BATCHERS', {})
+    monkeypatch.setattr(batching, '_STATS', {})
+    monkeypatch.setattr(batching, '_predictData', lambda model, tensor: fake_predict(model, tensor)[0])
+    monkeypatch.setattr(batching, '_predictBatchData', fake_predict)
+    monkeypatch.setattr(batching, '_observeHistogram', lambda name, value, labels=None: None)
+    batching._setBatchingConfig(True, 200, 4)
+    return batching
+
+def rows(*values):
+    """
+        provide a tensor with one (1, 2) row for each value
+    """
+    return np.array([[[value, 0.0]] for value in values], dtype=np.float32)
+
+def test_concurrent_requests_share_one_forward_pass(scheduler):
+    model   = FakeModel()
+    futures = [scheduler._submitBatch(model, rows(value)) for value in (1.0, 2.0, 3.0)]
+
+    assert [future.result(5)[0].tolist() for future in futures] == [[1.0, 3.0], [2.0, 3.0], [3.0, 3.0]]
+    assert model.passes == [3]
+
+def test_batch_is_split_at_max_batch_size(scheduler):
+    model   = FakeModel()
+    futures = [scheduler._submitBatch(model, rows(value)) for value in range(6)]
+
+    assert [future.result(5)[0][0] for future in futures] == [0, 1, 2, 3, 4, 5]
+    assert model.passes == [4, 2]
+
+def test_each_request_receives_its_own_rows(scheduler):
+    model   = FakeModel()
+    first   = scheduler._submitBatch(model, rows(1.0, 2.0))
+    second  = scheduler._submitBatch(model, rows(5.0))
+
+    assert first.result(5)[:, 0].tolist() == [1.0, 2.0]
+    assert second.result(5)[:, 0].tolist() == [5.0]
+
+def test_requests_of_different_shape_are_predicted_apart(scheduler):
+    model   = FakeModel()
+    small   = scheduler._submitBatch(model, rows(1.0))
+    large   = scheduler._submitBatch(model, np.ones((1, 1, 3), dtype=np.float32))
+
+    assert small.result(5)[0].tolist() == [1.0, 1.0]
+    assert large.result(5)[0].tolist() == [3.0, 1.0]
+    assert model.passes == [1, 1]
+
+def test_error_of_a_forward_pass_reaches_every_caller(scheduler):
+    model   = FakeModel(error=RuntimeError('broken model'))
+    futures = [scheduler._submitBatch(model, rows(value)) for value in (1.0, 2.0)]
+
+    for future in futures:
+        with pytest.raises(RuntimeError, match='broken model'):
+            future.result(5)
+
+def test_statistic_counts_rows_of_each_batch(scheduler):
+    model = FakeModel('B_model')
+    scheduler._predictBatchedRows(model, rows(1.0, 2.0, 3.0))
+    scheduler._predictBatched(model, rows(4.0))
+
+    stats = scheduler._getBatchingStats()['models']['B_model']
+    assert (stats['requests'], stats['batches'], stats['rows']) == (2, 2, 4)
+    assert stats['mean_batch_size'] == 2.0
+    assert stats['batch_sizes'] == {3: 1, 1: 1}
+
+def test_disabled_scheduler_predicts_each_request_by_itself(scheduler):
+    scheduler._setBatchingConfig(False, 200, 4)
+    model = FakeModel()
+
+    assert scheduler._predictBatchedRows(model, rows(1.0, 2.0))[:, 0].tolist() == [1.0, 2.0]
+    assert scheduler._predictBatched(model, rows(3.0)).tolist() == [3.0, 1.0]
+    assert scheduler._BATCHERS == {}
@@ -0,0 +1,144 @@
+"""
+    Tests of the SQLite prediction job queue (src/config/jobs.py): claim order of lanes, stale re-claim,
+    batch by batch processing, result TTL purge and workers started once in each process
+"""
+
+# python package
+import os
+import sqlite3
+import threading
+import time
+
+import numpy as np
+import pytest
+
+# internal package
+from src.config import jobs
+
+@pytest.fixture
+def job_queue(tmp_path, monkeypatch):
+    """
+        configure a job queue in a temporary database, module state is restored after the test
+    """
+    for name in ('_DATABASE_PATH', '_BATCH_SIZE', '_RESULT_TTL', '_PROCESSOR', '_WORKER_COUNT'):
+        monkeypatch.setattr(jobs, name, getattr(jobs, name))
+    monkeypatch.setattr(jobs, '_WORKERS', {'pid': None, 'threads': []})
+    jobs._setupJobQueue(str(tmp_path / 'jobs.sqlite3'), batch_size=2, result_ttl=60)
+    return jobs
+
+def execute(statement, *parameters):
+    """
+        run a statement on the job database
+    """
+    connection = jobs._connect()
+    try:
+        connection.execute(statement, parameters)
+    finally:
+        connection.close()
+
+def fake_processor(calls):
+    """
+        provide a processor which predicts [position of the image in its batch, batch size] for every model
+    """
+    def processor(models, model_path, images):
+        calls.append(list(images))
+        rows = np.array([[index, len(images)] for index in range(len(images))], dtype=np.float32)
+        return [rows for _ in models], [0.01 for _ in models]
+    return processor
+
+def test_setup_creates_schema_without_starting_workers(job_queue):
+    assert os.path.exists(job_queue._DATABASE_PATH)
+    assert job_queue._getJobQueueInfo()['workers'] == 0
+    assert job_queue._getJob('unknown') is None
+
+def test_submit_rejects_unknown_lane_and_callback_url(job_queue):
+    with pytest.raises(ValueError):
+        job_queue._submitJob(['A_model'], 'static/model/', [('a.jpg', 'a.jpg')], lane='urgent')
+    for callback_url in ('file:///etc/passwd', 'ftp://host/path', 'http://', 'localhost:8000/callback', 5):
+        with pytest.raises(ValueError):
+            job_queue._submitJob(['A_model'], 'static/model/', [('a.jpg', 'a.jpg')], callback_url=callback_url)
+
+    job = job_queue._submitJob(['A_model'], 'static/model/', [('a.jpg', 'a.jpg')], callback_url='https://example.com/callback')
+    assert job['status'] == 'queued'
+    assert job['callback_url'] == 'https://example.com/callback'
+
+def test_claim_takes_interactive_lane_first_then_oldest_job(job_queue):
+    first   = job_queue._submitJob(['A_model'], 'static/model/', [('a.jpg', 'a.jpg')], lane='bulk')
+    second  = job_queue._submitJob(['A_model'], 'static/model/', [('b.jpg', 'b.jpg')], lane='bulk')
+    urgent  = job_queue._submitJob(['A_model'], 'static/model/', [('c.jpg', 'c.jpg')], lane='interactive')
+
+    claimed = [job_queue._claimJob()['id'] for _ in range(3)]
+    assert claimed == [urgent['id'], first['id'], second['id']]
+    assert job_queue._claimJob() is None
+    assert job_queue._getJob(first['id'])['status'] == 'running'
+
+def test_claim_takes_stale_running_job_again(job_queue):
+    job = job_queue._submitJob(['A_model'], 'static/model/', [('a.jpg', 'a.jpg')])
+    assert job_queue._claimJob()['id'] == job['id']
+    assert job_queue._claimJob() is None # running job of a live worker is not taken
+
+    execute("UPDATE jobs SET updated = ? WHERE id = ?", time.time() - job_queue._STALE_TIMEOUT - 1, job['id'])
+    assert job_queue._claimJob()['id'] == job['id']
+
+def test_process_job_saves_results_batch_by_batch(job_queue):
+    images  = [('a.jpg', 'static/queryImage/a.jpg'), ('b.jpg', b'uploaded bytes'), ('c.jpg', 'static/queryImage/c.jpg')]
+    job     = job_queue._submitJob(['A_model', 'B_model'], 'static/model/', images, lane='interactive')
+    calls   = []
+
+    job_queue._processJob(job_queue._claimJob(), fake_processor(calls))
+    assert calls == [['static/queryImage/a.jpg', b'uploaded bytes'], ['static/queryImage/c.jpg']]
+
+    finished = job_queue._finishJob(job['id'], 'done')
+    assert finished['status'] == 'done'
+    assert finished['progress'] == {'done': 3, 'total': 3, 'percent': 100.0}
+    assert finished['expires'] == pytest.approx(finished['updated'] + 60)
+    assert [result['image'] for result in finished['results']] == ['a.jpg', 'b.jpg', 'c.jpg']
+    assert finished['results'][1]['predictions'] == {'A_model': [1.0, 2.0], 'B_model': [1.0, 2.0]}
+    assert finished['results'][2]['predictions'] == {'A_model': [0.0, 1.0], 'B_model': [0.0, 1.0]}
+
+def test_process_job_continues_after_last_saved_batch(job_queue):
+    images  = [('%d.jpg' % index, '%d.jpg' % index) for index in range(3)]
+    job     = job_queue._submitJob(['A_model'], 'static/model/', images)
+    execute("UPDATE job_images SET result = '{}' WHERE job_id = ? AND position < 2", job['id'])
+    calls   = []
+
+    job_queue._processJob(job_queue._claimJob(), fake_processor(calls))
+    assert calls == [['2.jpg']]
+
+def test_purge_removes_only_expired_jobs(job_queue):
+    expired = job_queue._submitJob(['A_model'], 'static/model/', [('a.jpg', 'a.jpg')])
+    kept    = job_queue._submitJob(['A_model'], 'static/model/', [('b.jpg', 'b.jpg')])
+    queued  = job_queue._submitJob(['A_model'], 'static/model/', [('c.jpg', 'c.jpg')])
+    job_queue._finishJob(expired['id'], 'done')
+    job_queue._finishJob(kept['id'], 'failed', 'RuntimeError: broken model')
+    execute("UPDATE jobs SET expires = ? WHERE id = ?", time.time() - 1, expired['id'])
+
+    assert job_queue._purgeExpiredJobs() == 1
+    assert job_queue._getJob(expired['id']) is None
+    assert job_queue._getJob(kept['id'])['error'] == 'RuntimeError: broken model'
+    assert job_queue._getJob(queued['id'])['status'] == 'queued'
+
+    connection = sqlite3.connect(job_queue._DATABASE_PATH)
+    try:
+        assert connection.execute("SELECT COUNT(*) FROM job_images WHERE job_id = ?", (expired['id'],)).fetchone()[0] == 0
+    finally:
+        connection.close()
+
+def test_workers_are_started_once_in_each_process(job_queue, monkeypatch):
+    stopped = threading.Event()
+    monkeypatch.setattr(jobs, '_runJobWorker', stopped.wait)
+    assert job_queue._startJobWorkers() == 0 # no processor is configured
+
+    job_queue._setupJobQueue(job_queue._DATABASE_PATH, processor=fake_processor([]), workers=2)
+    try:
+        assert job_queue._startJobWorkers() == 2
+        threads = list(job_queue._WORKERS['threads'])
+        assert job_queue._startJobWorkers() == 2
+        assert job_queue._WORKERS['threads'] == threads
+
+        job_queue._WORKERS['pid'] = -1 # inherited from the parent of a forked process
+        assert job_queue._startJobWorkers() == 2
+        assert job_queue._WORKERS['threads'] != threads
+        assert job_queue._getJobQueueInfo()['workers'] == 2
+    finally:
+        stopped.set()
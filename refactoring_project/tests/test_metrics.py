@@ -0,0 +1,89 @@
+"""
+    Tests of service metrics of several workers (src/config/metrics.py): merge of worker snapshots and removal of
+    snapshots of finished workers and stale snapshots
+"""
+
+# python package
+import json
+import os
+import subprocess
+import sys
+import time
+
+import pytest
+
+# internal package
+from src.config import metrics
+
+def snapshot(pid, samples, written=None):
+    """
+        provide a worker snapshot as written by _flushMetrics
+    """
+    return {'pid': pid, 'written': time.time() if written is None else written, 'samples': samples}
+
+@pytest.fixture
+def worker_metrics(tmp_path, monkeypatch):
+    """
+        configure metrics of a worker with snapshots in a temporary directory, no flusher thread is started
+    """
+    for name in ('_ENABLED', '_METRICS_PATH', '_FLUSH_INTERVAL'):
+        monkeypatch.setattr(metrics, name, getattr(metrics, name))
+    monkeypatch.setattr(metrics, '_SAMPLES', {})
+    monkeypatch.setattr(metrics, '_COLLECTORS', [])
+    monkeypatch.setattr(metrics, '_FLUSHER', {'pid': os.getpid(), 'thread': None})
+    metrics._setMetrics(True, str(tmp_path / 'metrics'), 5)
+    return metrics
+
+def test_merge_sums_counters_and_histograms_and_labels_gauges_by_pid(worker_metrics):
+    histogram = lambda count: {'buckets': [count, 0, 1], 'sum': 0.5 * count, 'count': count + 1}
+    serving   = snapshot(10, {
+        'ml_cache_lookups_total'          : [[{'cache': 'results', 'result': 'hit'}, 3]],
+        'ml_inference_batch_size'         : [[{'model': 'A_model'}, histogram(2)]],
+        'ml_worker_resident_memory_bytes' : [[{}, 100]],
+        'ml_job_queue_jobs'               : [[{'status': 'queued', 'lane': 'bulk'}, 4]],
+        'unknown_metric'                  : [[{}, 1]],
+    })
+    other     = snapshot(11, {
+        'ml_cache_lookups_total'          : [[{'cache': 'results', 'result': 'hit'}, 2], [{'cache': 'results', 'result': 'miss'}, 5]],
+        'ml_inference_batch_size'         : [[{'model': 'A_model'}, histogram(1)]],
+        'ml_worker_resident_memory_bytes' : [[{}, 200]],
+        'ml_job_queue_jobs'               : [[{'status': 'queued', 'lane': 'bulk'}, 4]],
+    })
+
+    merged = worker_metrics._mergeSnapshots([serving, other])
+    assert 'unknown_metric' not in merged
+    assert merged['ml_cache_lookups_total'] == {(('cache', 'results'), ('result', 'hit')): 5, (('cache', 'results'), ('result', 'miss')): 5}
+    assert merged['ml_inference_batch_size'][(('model', 'A_model'),)] == {'buckets': [3, 0, 2], 'sum': 1.5, 'count': 5}
+    assert merged['ml_worker_resident_memory_bytes'] == {(('pid', '10'),): 100, (('pid', '11'),): 200}
+    assert merged['ml_job_queue_jobs'] == {(('lane', 'bulk'), ('status', 'queued')): 4} # shared gauge of the serving worker only
+
+    ratio = worker_metrics._addHitRatio(merged)['ml_cache_hit_ratio']
+    assert ratio == {(('cache', 'results'),): 0.5}
+
+def test_snapshot_holds_observed_metrics_and_collectors(worker_metrics):
+    worker_metrics._incrementCounter('ml_cache_lookups_total', {'cache': 'registry', 'result': 'miss'})
+    worker_metrics._observeHistogram('ml_inference_batch_size', 3, {'model': 'A_model'})
+    worker_metrics._addCollector(lambda: [('ml_batch_queue_depth', {'model': 'A_model'}, 2)])
+
+    samples = worker_metrics._getSnapshot()['samples']
+    assert samples['ml_cache_lookups_total'] == [[{'cache': 'registry', 'result': 'miss'}, 1]]
+    assert samples['ml_inference_batch_size'][0][1] == {'buckets': [0, 0, 1, 0, 0, 0, 0, 0], 'sum': 3, 'count': 1}
+    assert samples['ml_batch_queue_depth'] == [[{'model': 'A_model'}, 2]]
+
+def test_snapshots_of_finished_workers_and_stale_snapshots_are_removed(worker_metrics):
+    finished = subprocess.Popen([sys.executable, '-c', 'pass'])
+    finished.wait()
+    alive    = os.getppid()
+    files    = {
+        'finished' : (finished.pid, time.time()),
+        'stale'    : (alive, time.time() - worker_metrics._FLUSH_INTERVAL * (worker_metrics._STALE_FLUSHES + 1)),
+        'running'  : (alive, time.time()),
+    }
+    for name, (pid, written) in files.items():
+        snapshot_file = os.path.join(worker_metrics._METRICS_PATH, 'metrics_%s.json' % name)
+        with open(snapshot_file, 'w') as opened_file:
+            json.dump(snapshot(pid, {}, written), opened_file)
+
+    snapshots = worker_metrics._readSnapshots()
+    assert [item['pid'] for item in snapshots] == [os.getpid(), alive]
+    assert sorted(os.listdir(worker_metrics._METRICS_PATH)) == ['metrics_%d.json' % os.getpid(), 'metrics_running.json']
@@ -0,0 +1,98 @@
+"""
+    Tests of shared memory segments of the inference pool (src/config/pool.py): segments are reused by the next
+    prediction, the smallest fitting segment is taken and a segment of an unanswered task is never reused
+"""
+
+# python package
+import threading
+
+import numpy as np
+import pytest
+
+# internal package
+from src.config import pool
+
+@pytest.fixture
+def segments(monkeypatch):
+    """
+        provide empty segment state, every segment created by the test is removed afterwards
+    """
+    state = {'free': [], 'all': {}}
+    monkeypatch.setattr(pool, '_SEGMENTS', state)
+    yield state
+    for segment in state['all'].values():
+        segment.close()
+        segment.unlink()
+
+def test_segment_size_is_rounded_up_to_a_power_of_two(segments):
+    assert pool._acquireSegment(10).size >= pool._MIN_SEGMENT
+    assert pool._acquireSegment(pool._MIN_SEGMENT + 1).size >= 2 * pool._MIN_SEGMENT
+
+def test_released_segment_is_reused(segments):
+    segment = pool._acquireSegment(1000)
+    pool._releaseSegment(segment)
+
+    assert pool._acquireSegment(2000) is segment
+    assert len(segments['all']) == 1
+
+def test_smallest_fitting_segment_is_taken(segments):
+    large = pool._acquireSegment(4 * pool._MIN_SEGMENT)
+    small = pool._acquireSegment(pool._MIN_SEGMENT)
+    pool._releaseSegment(large)
+    pool._releaseSegment(small)
+
+    assert pool._acquireSegment(100) is small
+    assert pool._acquireSegment(2 * pool._MIN_SEGMENT) is large
+    assert pool._acquireSegment(100) is not small # every free segment is taken, a new one is created
+    assert len(segments['all']) == 3
+
+def fake_task(monkeypatch, answer):
+    """
+        send tasks to one fake pool process, answer provides (result, error) of a task or None when the process does not answer
+    """
+    def send_task(worker, kind, model_key, model_and_weight, fingerprint, name, shape, dtype):
+        pending = {'event': threading.Event(), 'worker': worker, 'result': None, 'error': None}
+        shared  = pool._SEGMENTS['all'][name]
+        batch   = np.ndarray(shape, dtype=np.dtype(dtype), buffer=shared.buf)
+        if answer is not None:
+            pending['result'], pending['error'] = answer(batch.copy())
+            pending['event'].set()
+        return pending
+
+    def wait_task(pending):
+        if not pending['event'].is_set():
+            raise RuntimeError('inference pool process did not answer')
+        if pending['error'] is not None:
+            raise RuntimeError(pending['error'])
+        return pending['result']
+
+    monkeypatch.setattr(pool, '_getAliveWorkers', lambda: [{'pending': 0}])
+    monkeypatch.setattr(pool, '_sendTask', send_task)
+    monkeypatch.setattr(pool, '_waitTask', wait_task)
+
+class FakePoolModel:
+    key               = ('static/model/', 'A_model')
+    model_and_weight  = ('static/model/A_model.h5', None)
+    fingerprint       = 'f1'
+
+def test_batch_is_handed_over_by_shared_memory(segments, monkeypatch):
+    fake_task(monkeypatch, lambda batch: ((batch.sum(axis=1), None), None))
+    batch = np.arange(6, dtype=np.float64).reshape(2, 3)
+
+    assert pool._predictOnPool(FakePoolModel(), batch).tolist() == [3.0, 12.0]
+    assert pool._predictOnPool(FakePoolModel(), batch).tolist() == [3.0, 12.0]
+    assert len(segments['all']) == 1 and len(segments['free']) == 1
+
+def test_segment_of_a_failed_task_is_reused(segments, monkeypatch):
+    fake_task(monkeypatch, lambda batch: (None, 'ValueError: wrong input shape'))
+
+    with pytest.raises(RuntimeError, match='wrong input shape'):
+        pool._predictOnPool(FakePoolModel(), np.ones((1, 3), dtype=np.float32))
+    assert len(segments['free']) == 1
+
+def test_segment_of_an_unanswered_task_is_not_reused(segments, monkeypatch):
+    fake_task(monkeypatch, None)
+
+    with pytest.raises(RuntimeError, match='did not answer'):
+        pool._predictOnPool(FakePoolModel(), np.ones((1, 3), dtype=np.float32))
+    assert len(segments['all']) == 1 and segments['free'] == []
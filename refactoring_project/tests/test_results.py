@@ -0,0 +1,100 @@
+"""
+    Tests of the prediction result cache (src/config/results.py): content keys, memory and disk lookups,
+    least recently used eviction and invalidation of results of changed model files
+"""
+
+# python package
+import os
+from collections import OrderedDict
+
+import pytest
+
+# internal package
+from src.config import results
+
+MODEL_KEY = ('static/model/', 'A_model')
+
+@pytest.fixture
+def result_cache(tmp_path, monkeypatch):
+    """
+        configure a result cache persisted into a temporary directory, module state is restored after the test
+    """
+    for name in ('_ENABLED', '_MAX_ENTRIES', '_CACHE_PATH'):
+        monkeypatch.setattr(results, name, getattr(results, name))
+    monkeypatch.setattr(results, '_RESULTS', OrderedDict())
+    monkeypatch.setattr(results, '_FINGERPRINTS', {})
+    monkeypatch.setattr(results, '_DIGESTS', {})
+    monkeypatch.setattr(results, '_STATS', dict.fromkeys(results._STATS, 0))
+    results._setResultCache(True, 2, str(tmp_path / 'results'))
+    return results
+
+def test_image_digest_is_content_hash_of_bytes_and_files(result_cache, tmp_path):
+    image_file = tmp_path / 'Glioma_1.jpg'
+    image_file.write_bytes(b'first content')
+    copy_file  = tmp_path / 'copy.jpg'
+    copy_file.write_bytes(b'first content')
+
+    digest = result_cache._getImageDigest(str(image_file))
+    assert digest == result_cache._getImageDigest(b'first content')
+    assert digest == result_cache._getImageDigest(str(copy_file))
+
+    image_file.write_bytes(b'other content')
+    os.utime(image_file, (1, 1)) # a changed file has another modified time
+    assert result_cache._getImageDigest(str(image_file)) == result_cache._getImageDigest(b'other content') != digest
+
+def test_result_key_needs_digest_and_fingerprint(result_cache):
+    assert result_cache._getResultKey(None, MODEL_KEY, 'f1', 'rgb') is None
+    assert result_cache._getResultKey('d1', MODEL_KEY, None, 'rgb') is None
+    assert result_cache._getResultKey('d1', MODEL_KEY, 'f1', 'rgb') != result_cache._getResultKey('d1', MODEL_KEY, 'f1', 'gray')
+
+    result_cache._setResultCache(False, 2, None)
+    assert result_cache._getImageDigest(b'image') is None
+
+def test_result_is_taken_from_memory_then_from_disk(result_cache):
+    key = result_cache._getResultKey('d1', MODEL_KEY, 'f1', 'rgb')
+    assert result_cache._getCachedResult(key) is None
+
+    result_cache._putCachedResult(key, [0.25, 99.5, 0.25], 0.125)
+    prediction, run_time = result_cache._getCachedResult(key)
+    assert prediction == [0.25, 99.5, 0.25]
+    assert run_time == 0.125 and run_time.cached
+
+    result_cache._RESULTS.clear() # such a restarted worker
+    assert result_cache._getCachedResult(key)[0] == [0.25, 99.5, 0.25]
+    info = result_cache._getResultCacheInfo()
+    assert (info['hits'], info['disk_hits'], info['misses'], info['stores']) == (1, 1, 1, 1)
+
+def test_least_recently_used_result_is_evicted(result_cache):
+    result_cache._setResultCache(True, 2, None)
+    keys = [result_cache._getResultKey('d%d' % index, MODEL_KEY, 'f1', 'rgb') for index in range(3)]
+    result_cache._putCachedResult(keys[0], [1.0], 0.1)
+    result_cache._putCachedResult(keys[1], [2.0], 0.1)
+    result_cache._getCachedResult(keys[0])
+    result_cache._putCachedResult(keys[2], [3.0], 0.1)
+
+    assert list(result_cache._RESULTS) == [keys[0], keys[2]]
+    assert result_cache._getResultCacheInfo()['evictions'] == 1
+
+def test_changed_model_files_invalidate_their_results(result_cache):
+    old_key   = result_cache._getResultKey('d1', MODEL_KEY, 'f1', 'rgb')
+    other_key = result_cache._getResultKey('d1', ('static/model/', 'B_model'), 'f1', 'rgb')
+    result_cache._putCachedResult(old_key, [1.0], 0.1)
+    result_cache._putCachedResult(other_key, [2.0], 0.1)
+    assert os.path.exists(result_cache._getResultFile(old_key))
+
+    new_key = result_cache._getResultKey('d1', MODEL_KEY, 'f2', 'rgb')
+    assert new_key != old_key
+    assert not os.path.exists(result_cache._getResultFile(old_key))
+    assert result_cache._getCachedResult(old_key) is None
+    assert result_cache._getCachedResult(new_key) is None
+    assert result_cache._getCachedResult(other_key)[0] == [2.0]
+    assert result_cache._getResultCacheInfo()['invalidations'] == 2 # from memory and from disk
+
+def test_persisted_results_of_a_previous_run_are_invalidated(result_cache):
+    old_key = result_cache._getResultKey('d1', MODEL_KEY, 'f1', 'rgb')
+    result_cache._putCachedResult(old_key, [1.0], 0.1)
+    result_cache._RESULTS.clear()
+    result_cache._FINGERPRINTS.clear() # such a restarted worker whose model files were replaced
+
+    result_cache._getResultKey('d1', MODEL_KEY, 'f2', 'rgb')
+    assert not os.path.exists(result_cache._getResultFile(old_key))